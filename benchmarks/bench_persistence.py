@@ -0,0 +1,66 @@
+"""
+Benchmark WalkNetwork.load_graph() for a saved folder against a gzip pickle,
+comparing load time and increase in peak memory (RSS) of a fresh process
+for each. Linux only, as peak RSS is read from /proc.
+
+Run as a module from the project root directory:
+
+    python -m benchmarks.bench_persistence [graph.gpickle.gz]
+"""
+
+import os
+import sys
+import json
+import tempfile
+import subprocess
+
+from osmcatch import network
+
+# Load graph in a fresh process and report time and peak RSS
+LOAD_SCRIPT = """
+import json, time
+from osmcatch import network
+
+def peak_rss():
+    # Peak RSS in kB, read from /proc as ru_maxrss is carried across exec()
+    with open('/proc/self/status') as f:
+        return int([l for l in f if l.startswith('VmHWM')][0].split()[1])
+
+before = peak_rss()
+start = time.perf_counter()
+walk = network.WalkNetwork.load_graph({path!r}, compact={compact})
+load_time = time.perf_counter() - start
+print(json.dumps({{'time': load_time, 'rss': peak_rss() - before}}))
+"""
+
+
+def folder_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(entry.stat().st_size for entry in os.scandir(path))
+
+
+def load(path, compact=False):
+    out = subprocess.run([sys.executable, '-c',
+                          LOAD_SCRIPT.format(path=str(path), compact=compact)],
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main(path='notebooks/input_data/walk_network_graph_2_elevation.gpickle.gz'):
+    with tempfile.TemporaryDirectory() as tmp:
+        walk = network.WalkNetwork.load_graph(path)
+        folder = os.path.join(tmp, 'walk_network_graph')
+        walk.save_graph(folder)
+        print("nodes: {:,}, edges: {:,}".format(len(walk.nodes), len(walk.edges)))
+
+        for name, load_path in [('gpickle', path), ('folder', folder)]:
+            for compact in [False, True]:
+                result = load(load_path, compact)
+                print("{:8} compact={!s:5} {:6.2f}s {:7.0f}MB peak RSS increase {:6.1f}MB on disk".format(
+                    name, compact, result['time'], result['rss'] / 1024,
+                    folder_size(load_path) / 1e6))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,40 @@
+"""
+Benchmark vectorised gradient_adjusted_walk_speed() against the list version.
+
+Run as a module from the project root directory:
+
+    python -m benchmarks.bench_walk_speed
+"""
+
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from osmcatch import elevation
+
+
+def main(n=1000000, repeat=3):
+    rng = np.random.default_rng(0)
+    gradients = pd.Series(rng.normal(0, 8, n))
+
+    as_list = gradients.tolist()
+    list_time = min(timeit.repeat(
+        lambda: elevation.gradient_adjusted_walk_speed(as_list), 
+        number=1, repeat=repeat))
+    series_time = min(timeit.repeat(
+        lambda: elevation.gradient_adjusted_walk_speed(gradients), 
+        number=1, repeat=repeat))
+
+    # Check both versions give the same result
+    expected = elevation.gradient_adjusted_walk_speed(as_list)
+    result = elevation.gradient_adjusted_walk_speed(gradients)
+    assert (result.values == np.array(expected)).all()
+
+    print("edges: {:,}".format(n))
+    print("list:   {:.3f}s".format(list_time))
+    print("series: {:.3f}s ({:.0f}x faster)".format(series_time, list_time / series_time))
+
+
+if __name__ == '__main__':
+    main()
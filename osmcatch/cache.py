@@ -0,0 +1,364 @@
+"""Local caches for downloaded data and calculated results"""
+
+import os
+import gzip
+import math
+import time
+import pickle
+import sqlite3
+import hashlib
+from contextlib import closing
+from collections import OrderedDict
+
+import networkx as nx
+
+
+class GraphTileCache:
+    """
+    On-disk cache of OSM network graphs split into fixed lat/lng grid tiles.
+
+    Each tile is stored once for each custom_filter and snapshot_date, so
+    nearby locations and later runs only download tiles not yet held. Tiles
+    are written as gzip compressed node and edge lists, and the least
+    recently used tiles are removed once the cache is larger than `max_size`.
+    """
+
+    def __init__(self,
+                 cache_folder='cache/osm_tiles',
+                 tile_size=0.01,
+                 max_size=None):
+        """
+        Parameters
+        ----------
+        cache_folder : string or pathlib.Path
+            folder to store tiles in, created if it does not exist.
+        tile_size : decimal
+            tile width and height in decimal degrees, default 0.01 (about
+            1km).
+        max_size : int
+            maximum size of cache folder in bytes, default None for no limit.
+        """
+        self.cache_folder = cache_folder
+        self.tile_size = tile_size
+        self.max_size = max_size
+        os.makedirs(cache_folder, exist_ok=True)
+
+    def tiles_for_bbox(self, north, south, east, west):
+        """
+        Return tiles that intersect a bounding box.
+
+        Parameters
+        ----------
+        north, south, east, west : decimal
+            bounding box in decimal degrees, as from
+            ox.utils_geo.bbox_from_point()
+
+        Returns
+        -------
+        tiles : list of tuple
+            (row, col) of each tile
+        """
+        rows = range(math.floor(south / self.tile_size),
+                     math.floor(north / self.tile_size) + 1)
+        cols = range(math.floor(west / self.tile_size),
+                     math.floor(east / self.tile_size) + 1)
+        return [(row, col) for row in rows for col in cols]
+
+    def tile_bbox(self, tile):
+        """
+        Return (north, south, east, west) bounding box for a tile.
+
+        Parameters
+        ----------
+        tile : tuple
+            (row, col) of tile
+        """
+        row, col = tile
+        return ((row + 1) * self.tile_size, row * self.tile_size,
+                (col + 1) * self.tile_size, col * self.tile_size)
+
+    def _path(self, tile, custom_filter, snapshot_date):
+        """Return file path for tile"""
+        key = '{}|{}|{}|{}|{}'.format(*tile, self.tile_size, custom_filter,
+                                      snapshot_date)
+        name = '{}_{}_{}.pkl.gz'.format(*tile, hashlib.sha1(key.encode()).hexdigest()[:16])
+        return os.path.join(self.cache_folder, name)
+
+    def get(self, tile, custom_filter, snapshot_date=None):
+        """
+        Return cached graph for a tile, or None if not in the cache.
+
+        Parameters
+        ----------
+        tile : tuple
+            (row, col) of tile
+        custom_filter : string
+            overpass way filter the tile was downloaded with
+        snapshot_date : string
+            OSM snapshot date the tile was downloaded for
+
+        Returns
+        -------
+        G : networkx.MultiDiGraph
+        """
+        path = self._path(tile, custom_filter, snapshot_date)
+        try:
+            with gzip.open(path, 'rb') as f:
+                graph_attrs, nodes, edges = pickle.load(f)
+        except FileNotFoundError:
+            return None
+
+        self._touch(path)
+
+        G = nx.MultiDiGraph(**graph_attrs)
+        G.add_nodes_from(nodes)
+        G.add_edges_from(edges)
+        return G
+
+    def put(self, tile, custom_filter, snapshot_date, G):
+        """
+        Add graph for a tile to the cache, removing least recently used tiles
+        if the cache is larger than `max_size`.
+
+        Parameters
+        ----------
+        tile : tuple
+            (row, col) of tile
+        custom_filter : string
+            overpass way filter the tile was downloaded with
+        snapshot_date : string
+            OSM snapshot date the tile was downloaded for
+        G : networkx.MultiDiGraph
+            graph for tile
+        """
+        path = self._path(tile, custom_filter, snapshot_date)
+        data = (G.graph,
+                list(G.nodes(data=True)),
+                list(G.edges(keys=True, data=True)))
+
+        # Write to temporary file first so partial writes are never read
+        with gzip.open(path + '.tmp', 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+        self._touch(path)
+
+        self._evict()
+
+    def _touch(self, path):
+        """Mark tile as recently used for eviction"""
+        # Set exact time, as file system timestamps can be coarser than the
+        # time between cache calls
+        now = time.time_ns()
+        os.utime(path, ns=(now, now))
+
+    def _evict(self):
+        """Remove least recently used tiles until cache is within max_size"""
+        if self.max_size is None:
+            return
+
+        files = []
+        for entry in os.scandir(self.cache_folder):
+            if entry.name.endswith('.pkl.gz'):
+                stat = entry.stat()
+                files.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_size:
+                break
+            os.remove(path)
+            total -= size
+
+
+class ElevationCache:
+    """
+    On-disk cache of node elevations keyed by OSM node id and raster source.
+
+    Elevations are held in a single sqlite database, so overlapping networks
+    only sample DEM rasters for nodes not already in the cache.
+    """
+
+    # Largest number of node ids in a single sqlite query
+    _chunk_size = 500
+
+    def __init__(self, path='cache/elevations.sqlite'):
+        """
+        Parameters
+        ----------
+        path : string or pathlib.Path
+            sqlite database file, created if it does not exist.
+        """
+        self.path = path
+        folder = os.path.dirname(os.fspath(path))
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with closing(self._connect()) as con, con:
+            con.execute('CREATE TABLE IF NOT EXISTS elevations ('
+                        'source TEXT, node INTEGER, elevation REAL, '
+                        'PRIMARY KEY (source, node)) WITHOUT ROWID')
+
+    def _connect(self):
+        # Connect for each call so the cache can be shared across processes
+        return sqlite3.connect(self.path, timeout=60)
+
+    def get_many(self, source, nodes):
+        """
+        Return cached elevation for each node held.
+
+        Parameters
+        ----------
+        source : string
+            raster source the elevations were sampled from, e.g. the DEM
+            tile folder
+        nodes : list
+            OSM node ids
+
+        Returns
+        -------
+        elevations : dict
+            dict keyed by node id of elevation, for nodes in the cache only
+        """
+        nodes = [int(node) for node in nodes]
+        elevations = {}
+        with closing(self._connect()) as con:
+            for start in range(0, len(nodes), self._chunk_size):
+                chunk = nodes[start:start + self._chunk_size]
+                rows = con.execute(
+                    'SELECT node, elevation FROM elevations WHERE source = ? '
+                    'AND node IN ({})'.format(','.join('?' * len(chunk))),
+                    [source] + chunk)
+                elevations.update(rows)
+        return elevations
+
+    def put_many(self, source, elevations):
+        """
+        Add node elevations to the cache.
+
+        Parameters
+        ----------
+        source : string
+            raster source the elevations were sampled from
+        elevations : dict
+            dict keyed by node id of elevation
+        """
+        with closing(self._connect()) as con, con:
+            con.executemany('INSERT OR REPLACE INTO elevations VALUES (?, ?, ?)',
+                            [(source, int(node), float(elevation))
+                             for node, elevation in elevations.items()])
+
+
+class ResultCache:
+    """
+    Least recently used cache of results, e.g. WalkNetwork.iso_bands()
+    results or HttpClient json responses.
+
+    Results are held in memory up to `max_items`. If `spill_folder` is set,
+    results evicted from memory are written there as pickles and read back
+    when next requested, rather than recalculated. The least recently 
+    spilled results are removed once more than `max_spill_items` are held.
+    """
+
+    def __init__(self, max_items=32, spill_folder=None, max_spill_items=1024):
+        """
+        Parameters
+        ----------
+        max_items : int
+            maximum number of results held in memory, default 32.
+        spill_folder : string or pathlib.Path
+            folder to write evicted results to, created if it does not 
+            exist. Default None to drop evicted results.
+        max_spill_items : int
+            maximum number of results held in `spill_folder`, default 1024.
+            None for no limit.
+        """
+        self.max_items = max_items
+        self.spill_folder = spill_folder
+        self.max_spill_items = max_spill_items
+        self._items = OrderedDict()
+        if spill_folder is not None:
+            os.makedirs(spill_folder, exist_ok=True)
+
+    def __len__(self):
+        return len(self._items)
+
+    def _path(self, key):
+        """Return spill file path for key"""
+        name = hashlib.sha1(repr(key).encode()).hexdigest() + '.pkl'
+        return os.path.join(self.spill_folder, name)
+
+    def get(self, key):
+        """
+        Return cached result, or None if not in the cache.
+
+        Parameters
+        ----------
+        key : tuple
+            hashable key with a stable repr(), e.g. the iso_bands() 
+            arguments and WalkNetwork.fingerprint()
+        """
+        if key in self._items:
+            self._items.move_to_end(key)
+            return self._items[key]
+        if self.spill_folder is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+
+        # Held in memory again, and spilled again if evicted
+        os.remove(path)
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        """
+        Add result to the cache, moving the least recently used results to
+        `spill_folder` (if set) once more than `max_items` are held.
+
+        Parameters
+        ----------
+        key : tuple
+            hashable key with a stable repr()
+        value : object
+            result to cache, which must be picklable if spilled
+        """
+        self._items[key] = value
+        self._items.move_to_end(key)
+        spilled = False
+        while len(self._items) > self.max_items:
+            old_key, old_value = self._items.popitem(last=False)
+            if self.spill_folder is not None:
+                # Write to temporary file first so partial writes are never read
+                path = self._path(old_key)
+                with open(path + '.tmp', 'wb') as f:
+                    pickle.dump(old_value, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(path + '.tmp', path)
+                # Set exact time, as file system timestamps can be coarser 
+                # than the time between evictions
+                now = time.time_ns()
+                os.utime(path, ns=(now, now))
+                spilled = True
+        if spilled:
+            self._evict_spilled()
+
+    def _evict_spilled(self):
+        """Remove least recently spilled results beyond max_spill_items"""
+        if self.max_spill_items is None:
+            return
+
+        files = [(entry.stat().st_mtime_ns, entry.path) 
+                 for entry in os.scandir(self.spill_folder) 
+                 if entry.name.endswith('.pkl')]
+        for _, path in sorted(files)[:max(len(files) - self.max_spill_items, 0)]:
+            os.remove(path)
+
+    def clear(self):
+        """Remove all results, including any spilled to disk"""
+        self._items.clear()
+        if self.spill_folder is not None:
+            for entry in os.scandir(self.spill_folder):
+                if entry.name.endswith('.pkl'):
+                    os.remove(entry.path)
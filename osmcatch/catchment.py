@@ -1,7 +1,7 @@
 """Get network graph"""
 
 import osmnx as ox
-import networkx as nx
+import pandas as pd
 import geopandas as gpd
 from osmcatch import network
 import matplotlib.pyplot as plt
@@ -63,43 +63,69 @@ def get_iso_bands(access_points,
     # Ensure centre_point is a list to prevent errors
     access_points = [access_points] if type(access_points) is tuple else access_points
     
-    # Get nearest node to each access point. NB: Need to reverse lat/lon            
-    access_nodes = []
-    for ap in access_points:
-        access_nodes.append(ox.nearest_nodes(G, *ap[::-1]))
+    # Get nearest node to each access point in one call. NB: Need to 
+    # reverse lat/lon
+    access_nodes = ox.nearest_nodes(G, [ap[1] for ap in access_points],
+                                    [ap[0] for ap in access_points])
       
     # Loop through bands from high to low
-    iso_bands.sort(reverse=True)
+    iso_bands = sorted(iso_bands, reverse=True)
 
+    # Single search from all access nodes out to the largest band, with each
+    # smaller band cut from the same cost map
+    costs = network.multi_source_costs(G, access_nodes, 
+                                       cutoff=iso_bands[0], 
+                                       weight=network_cost)
+    edges = ox.graph_to_gdfs(G.subgraph(costs), nodes=False)
+    polygons = network.iso_band_polygons(edges, costs, iso_bands, iso_buffer)
 
     iso_group = []
     for iso_band in iso_bands:
- 
-        # Calculate subgraphs for each access node and return single subgraph
-        # with all nodes/edges traversed 
-        subgraphs = []
-        for access_node in access_nodes:
-            subgraphs.append(nx.ego_graph(G, access_node, 
-                                          radius = iso_band, 
-                                          distance = network_cost))
-        subgraph = nx.compose_all(subgraphs)
-    
-        # Get gdf with edges and buffer, but first having changed to projected 
-        # coordinates and then back to default to ensure correct dist results
-        edges = ox.graph_to_gdfs(subgraph, nodes=False)
-        buffer = ox.project_gdf(edges).buffer(iso_buffer)
-        buffer = ox.project_gdf(buffer, to_latlong=True)
         iso_group.append({'location_name': location_name,
                           'access_points': access_points,
                           'access_nodes': access_nodes,
                           'iso_band': iso_band,
-                          'geometry': buffer.unary_union})
+                          'geometry': polygons[iso_band]})
     
-    iso_bands_gpd = gpd.GeoDataFrame(iso_group, crs=buffer.crs)
+    iso_bands_gpd = gpd.GeoDataFrame(iso_group, crs=polygons.crs)
  
     return G, iso_bands_gpd
 
 
+def group_access_points(stations,
+                        location_col='stop_name',
+                        lat_col='lat',
+                        lng_col='lon'):
+    """
+    Group a table with one row per station entrance, such as 
+    `input_data/stations.csv`, into one row per station for use with 
+    WalkNetwork.iso_bands_batch().
+ 
+    Parameters
+    ----------
+    stations : DataFrame
+        one row per access point.
+    location_col : str
+        column with the station name, default 'stop_name'.
+    lat_col : str
+        column with access point latitude, default 'lat'.
+    lng_col : str
+        column with access point longitude, default 'lon'.
+ 
+    Returns
+    -------
+    stations_df : DataFrame
+        `location_name` and `access_points` columns, in order of first 
+        appearance.
+    """
+    groups = stations.groupby(location_col, sort=False)
+    access_points = groups.apply(lambda df: list(zip(df[lat_col], df[lng_col])))
+    stations_df = pd.DataFrame({'location_name': access_points.index,
+                                'access_points': access_points.values})
+    
+    return stations_df
+
+
 def compare_slope_vs_flat(access_points, 
                           location_name, 
                           walk, 
@@ -110,15 +136,19 @@ def compare_slope_vs_flat(access_points,
     # Generate catchment based on 
     slope = walk.iso_bands(access_points = access_points, 
                            location_name = location_name, 
-                           iso_bands=[5,10])
+                           iso_bands=[5,10],
+                           iso_band_graphs=False)
     flat = walk.iso_bands(access_points = access_points,
                           location_name = location_name,
                           iso_band_cost='length',
-                          iso_bands=[5*60*1.5,10*60*flat_walk_speed])
+                          iso_bands=[5*60*1.5,10*60*flat_walk_speed],
+                          iso_band_graphs=False)
 
     # Get total distance
-    slope_dist = network.graph_street_length(slope[slope['iso_band_mins']==10]['iso_band_graph'][0])
-    flat_dist = network.graph_street_length(flat[flat['iso_band_mins']==10*60*flat_walk_speed]['iso_band_graph'][0])
+    station_df = pd.DataFrame({'location_name': [location_name], 
+                               'access_points': [access_points]})
+    slope_dist = walk.coverage(station_df, 10)[0]['street_length'][0]
+    flat_dist = walk.coverage(station_df, 10*60*flat_walk_speed, 'length')[0]['street_length'][0]
 
     # Plot catchment
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 8))
@@ -0,0 +1,119 @@
+"""Shared HTTP client for web service queries, e.g. LINZ and StatsNZ"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .cache import ResultCache
+
+# Client used when none is passed, created on first use
+_default_client = None
+
+
+class HttpClient:
+    """
+    HTTP client with a pooled session, retries with backoff, a bounded
+    number of concurrent requests and an in-memory cache of responses.
+
+    One client is shared by get_raster_tile_names_from_linz() and
+    get_local_authority_boundary(), so repeated queries reuse connections
+    and only new urls are requested.
+    """
+
+    def __init__(self,
+                 max_workers=8,
+                 retries=3,
+                 backoff_factor=0.5,
+                 timeout=30,
+                 cache_size=256):
+        """
+        Parameters
+        ----------
+        max_workers : int
+            largest number of requests made at once, and connections held.
+        retries : int
+            number of times to retry a request on connection errors or 429
+            and 5xx responses, default 3.
+        backoff_factor : decimal
+            wait backoff_factor * 2 ** (retry - 1) seconds between retries,
+            default 0.5.
+        timeout : decimal
+            seconds to wait for the server, default 30.
+        cache_size : int
+            number of responses held, default 256. 0 to not cache.
+        """
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._cache = ResultCache(max_items=cache_size)
+        self._lock = threading.Lock()
+
+        retry = Retry(total=retries, backoff_factor=backoff_factor,
+                      status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=['GET'], raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=max_workers,
+                              pool_maxsize=max_workers, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get_json(self, url):
+        """
+        Return json response for `url`, or None if the request fails.
+
+        Parameters
+        ----------
+        url : str
+            url to request
+
+        Returns
+        -------
+        result : dict or list
+            parsed json, cached for later calls with the same url
+        """
+        with self._lock:
+            result = self._cache.get(url)
+        if result is not None:
+            return result
+
+        try:
+            r = self.session.get(url, timeout=self.timeout)
+        except requests.RequestException:
+            return None
+        if r.status_code != 200:
+            return None
+        result = r.json()
+
+        with self._lock:
+            self._cache.put(url, result)
+        return result
+
+    def get_json_many(self, urls):
+        """
+        Return json response for each url, or None where the request fails,
+        making up to `max_workers` requests at once.
+
+        Parameters
+        ----------
+        urls : list of str
+            urls to request, each unique url requested once
+
+        Returns
+        -------
+        results : list
+            parsed json in `urls` order
+        """
+        unique = list(dict.fromkeys(urls))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = dict(zip(unique, executor.map(self.get_json, unique)))
+        return [results[url] for url in urls]
+
+
+def default_client():
+    """Return HttpClient shared by web service queries"""
+    global _default_client
+    if _default_client is None:
+        _default_client = HttpClient()
+    return _default_client
@@ -0,0 +1,699 @@
+"""Compact array backed graph for network searches"""
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import networkx as nx
+from shapely.geometry import LineString
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+# Edge attributes held as cost columns when present in the source graph
+COST_FIELDS = ['length', 'grade', 'speed', 'walk_mins']
+
+
+class CompactGraph:
+    """
+    Compressed sparse row (CSR) representation of a walk network graph.
+
+    Node ids are mapped to int32 indices and edges are held as CSR adjacency
+    arrays sorted by origin node, which is a small fraction of the memory 
+    used by a networkx.MultiDiGraph. Both directions of a two way edge share
+    one row of an undirected edge table, with edge costs held as forward 
+    and reverse float32 arrays so direction dependent costs such as slope 
+    adjusted walk time are searched the right way. Costs the same in both
+    directions, such as length, are only held once.
+
+    Other node and edge attributes, e.g. `osmid` and `geometry`, can also be
+    held so the CompactGraph is the only copy of the network, with the
+    networkx graph and GeoDataFrames recreated with to_graph() and 
+    to_gdfs() when needed. Edge attributes are held on the undirected edge
+    table too, with values the same both ways, including geometry, shared
+    by both directions.
+    """
+
+    def __init__(self, node_ids, x, y, u, v, key, costs, node_attrs=None, edge_attrs=None):
+        """
+        Parameters
+        ----------
+        node_ids : array
+            node ids, e.g. osm ids
+        x : array
+            node x coordinates in the graph crs
+        y : array
+            node y coordinates in the graph crs
+        u : array
+            edge origin node ids
+        v : array
+            edge destination node ids
+        key : array
+            edge keys, to distinguish parallel edges
+        costs : dict
+            dict of edge cost arrays keyed by edge attribute name, with NaN
+            where an edge does not have the attribute
+        node_attrs : dict
+            optional dict of other node attribute arrays keyed by name, with
+            None or NaN where a node does not have the attribute
+        edge_attrs : dict
+            optional dict of other edge attribute arrays keyed by name, with
+            `geometry` running from `u` to `v`
+        """
+        # Sort nodes by id so node ids can be mapped to indices in bulk
+        node_ids = np.asarray(node_ids)
+        order = np.argsort(node_ids, kind='stable')
+        self.node_ids = node_ids[order]
+        self.x = np.asarray(x, dtype=np.float64)[order]
+        self.y = np.asarray(y, dtype=np.float64)[order]
+        self.node_attrs = {name: _attr_array(values)[order] 
+                           for name, values in (node_attrs or {}).items()}
+        self._holds_attrs = node_attrs is not None or edge_attrs is not None
+
+        self._set_edges(self.index_of(u), self.index_of(v), 
+                        np.asarray(key, dtype=np.int32), costs, edge_attrs or {})
+
+    def _set_edges(self, u, v, key, costs, attrs, held=False):
+        """
+        Create edge table and CSR arrays from node index arrays `u` and `v`,
+        `key` and dicts of cost and attribute arrays for each directed edge.
+        If `held` the attributes are from the tables already held, with 
+        geometry running from lower to higher node index.
+        """
+        self._key_range = int(key.max()) + 1 if len(key) else 1
+
+        # Undirected edge table, with one row for both directions of an 
+        # edge running from lower to higher node index
+        reverse = (u > v).astype(np.int32)
+        low, high = np.minimum(u, v), np.maximum(u, v)
+        codes, edge = np.unique(self._edge_codes(low, high, key), return_inverse=True)
+        edge = edge.astype(np.int32)
+        pairs = codes // self._key_range
+        self.edge_u = (pairs // self.number_of_nodes).astype(np.int32)
+        self.edge_v = (pairs % self.number_of_nodes).astype(np.int32)
+        self.edge_key = (codes % self._key_range).astype(np.int32)
+
+        # Sort edges by origin node, destination node and key to give CSR
+        # adjacency arrays where each edge can be found by binary search, 
+        # each pointing to its undirected edge and direction
+        order = np.lexsort((key, v, u))
+        self.indptr = np.zeros(len(self.node_ids) + 1, dtype=np.int32)
+        np.cumsum(np.bincount(u, minlength=len(self.node_ids)),
+                  out=self.indptr[1:])
+        self.edge_ref = (edge * 2 + reverse)[order]
+        self.costs = {name: self._cost_table(values, reverse, edge) 
+                      for name, values in costs.items()}
+        self.attrs = {}
+        for name, values in attrs.items():
+            values = _attr_array(values)
+            if name == 'geometry' and not held:
+                values = _orient(values, reverse.astype(bool))
+            self.attrs[name] = self._attr_table(values, reverse, edge, share=not held)
+
+        self._matrices = {}
+        self._max_speeds = {}
+
+    def _cost_table(self, values, reverse, edge):
+        """
+        Return (2, edges) forward and reverse cost table from the cost of 
+        each directed edge, sharing one row if the same both ways.
+        """
+        table = np.full((2, len(self.edge_key)), np.nan, dtype=np.float32)
+        table[reverse, edge] = values
+
+        # Edges with both directions, e.g. not one way
+        both = np.bincount(edge, minlength=len(self.edge_key)) == 2
+        if np.array_equal(table[0, both], table[1, both], equal_nan=True):
+            shared = np.where(np.isnan(table[0]), table[1], table[0])
+            return np.broadcast_to(shared, table.shape)
+        return table
+
+    def _attr_table(self, values, reverse, edge, share=True):
+        """
+        Return (2, edges) forward and reverse attribute table from the 
+        value of each directed edge. Numeric tables share one row if the 
+        same both ways, and if `share` object tables hold one object for 
+        values the same both ways.
+        """
+        table = np.zeros((2, len(self.edge_key)), dtype=values.dtype)
+        if values.dtype.kind == 'f':
+            table[:] = np.nan
+        table[reverse, edge] = values
+
+        both = np.flatnonzero(np.bincount(edge, minlength=len(self.edge_key)) == 2)
+        if values.dtype != object:
+            if np.array_equal(table[0, both], table[1, both], 
+                              equal_nan=values.dtype.kind == 'f'):
+                forward = np.zeros(len(self.edge_key), dtype=bool)
+                forward[edge[reverse == 0]] = True
+                return np.broadcast_to(np.where(forward, table[0], table[1]), table.shape)
+            return table
+        if share:
+            for e, a, b in zip(both.tolist(), table[0, both], table[1, both]):
+                if a is not b and _equal(a, b):
+                    table[1, e] = a
+        return table
+
+    @classmethod
+    def from_graph(cls, G, cost_fields=COST_FIELDS, attrs=False):
+        """
+        Create CompactGraph from a networkx graph.
+
+        Parameters
+        ----------
+        G : networkx.MultiDiGraph
+            input graph
+        cost_fields : list of str
+            edge attributes to hold as cost columns, fields not present on
+            any edge are skipped
+        attrs : boolean
+            if True also hold all other node and edge attributes, so the 
+            graph can be recreated with to_graph()
+        """
+        node_ids, x, y = [], [], []
+        node_attrs = {}
+        for i, (node, data) in enumerate(G.nodes(data=True)):
+            node_ids.append(node)
+            x.append(data['x'])
+            y.append(data['y'])
+            if attrs:
+                for name, value in data.items():
+                    if name not in ('x', 'y'):
+                        if name not in node_attrs:
+                            node_attrs[name] = [None] * G.number_of_nodes()
+                        node_attrs[name][i] = value
+
+        u, v, key = [], [], []
+        costs = {name: [] for name in cost_fields}
+        edge_attrs = {}
+        for i, (edge_u, edge_v, edge_key, data) in enumerate(G.edges(keys=True, data=True)):
+            u.append(edge_u)
+            v.append(edge_v)
+            key.append(edge_key)
+            for name in cost_fields:
+                costs[name].append(data.get(name, np.nan))
+            if attrs:
+                for name, value in data.items():
+                    if name not in costs:
+                        if name not in edge_attrs:
+                            edge_attrs[name] = [None] * G.number_of_edges()
+                        edge_attrs[name][i] = value
+        costs = {name: values for name, values in costs.items()
+                 if not np.isnan(np.asarray(values, dtype=np.float64)).all()}
+
+        if not attrs:
+            node_attrs, edge_attrs = None, None
+        return cls(node_ids, x, y, u, v, key, costs, node_attrs, edge_attrs)
+
+    @classmethod
+    def from_gdfs(cls, gdf_nodes, gdf_edges, cost_fields=COST_FIELDS, attrs=False):
+        """
+        Create CompactGraph from osmnx node and edge GeoDataFrames.
+
+        Parameters
+        ----------
+        gdf_nodes : GeoDataFrame
+            nodes indexed by node id, with `x` and `y` columns
+        gdf_edges : GeoDataFrame
+            edges indexed by `u`, `v` and `key`
+        cost_fields : list of str
+            edge columns to hold as cost columns, fields not present are
+            skipped
+        attrs : boolean
+            if True also hold all other node and edge columns, so the 
+            GeoDataFrames can be recreated with to_gdfs()
+        """
+        costs = {name: gdf_edges[name].values for name in cost_fields
+                 if name in gdf_edges.columns}
+        node_attrs, edge_attrs = None, None
+        if attrs:
+            node_attrs = {name: gdf_nodes[name].values for name in gdf_nodes.columns
+                          if name not in ('x', 'y', 'geometry')}
+            edge_attrs = {name: gdf_edges[name].values for name in gdf_edges.columns
+                          if name not in costs}
+        return cls(gdf_nodes.index.values,
+                   gdf_nodes['x'].values,
+                   gdf_nodes['y'].values,
+                   gdf_edges.index.get_level_values('u').values,
+                   gdf_edges.index.get_level_values('v').values,
+                   gdf_edges.index.get_level_values('key').values,
+                   costs, node_attrs, edge_attrs)
+
+    @property
+    def number_of_nodes(self):
+        return len(self.node_ids)
+
+    @property
+    def number_of_edges(self):
+        """Number of directed edges"""
+        return len(self.edge_ref)
+
+    @property
+    def number_of_undirected_edges(self):
+        return len(self.edge_key)
+
+    @property
+    def indices(self):
+        """Destination node index of each edge in CSR order"""
+        edge = self.edge_ref >> 1
+        return np.where(self.edge_ref & 1, self.edge_u[edge], self.edge_v[edge])
+
+    @property
+    def key(self):
+        """Edge key of each edge in CSR order"""
+        return self.edge_key[self.edge_ref >> 1]
+
+    def index_of(self, node_ids):
+        """
+        Return int32 index for each node id.
+
+        Parameters
+        ----------
+        node_ids : list or array
+            node ids to look up
+
+        Returns
+        -------
+        index : numpy.ndarray
+        """
+        node_ids = np.asarray(node_ids, dtype=self.node_ids.dtype)
+        index = np.searchsorted(self.node_ids, node_ids)
+        index[index == len(self.node_ids)] = 0
+        if len(node_ids) and not (self.node_ids[index] == node_ids).all():
+            missing = node_ids[self.node_ids[index] != node_ids]
+            raise KeyError("Nodes not in graph: {}".format(list(missing[:5])))
+        return index.astype(np.int32)
+
+    def _edge_codes(self, u, v, key):
+        """Return single int64 code for each edge, ordered as CSR arrays"""
+        n = np.int64(self.number_of_nodes)
+        return ((u.astype(np.int64) * n + v) * self._key_range + key)
+
+    def edge_positions(self, u, v, key):
+        """
+        Return position in CSR arrays of each edge.
+
+        Parameters
+        ----------
+        u : array
+            edge origin node ids
+        v : array
+            edge destination node ids
+        key : array
+            edge keys
+
+        Returns
+        -------
+        positions : numpy.ndarray
+        """
+        row = np.repeat(np.arange(self.number_of_nodes, dtype=np.int32),
+                        np.diff(self.indptr))
+        codes = self._edge_codes(row, self.indices, self.key)
+        query = self._edge_codes(self.index_of(u), self.index_of(v),
+                                 np.asarray(key, dtype=np.int64))
+        positions = np.searchsorted(codes, query)
+        positions[positions == len(codes)] = 0
+        if len(query) and not (codes[positions] == query).all():
+            raise KeyError("Edges not in graph")
+        return positions
+
+    def set_costs(self, name, u, v, key, values):
+        """
+        Set cost column `name` for the given edges in place, adding the
+        column if not already held.
+
+        Parameters
+        ----------
+        name : str
+            edge attribute name
+        u : array
+            edge origin node ids
+        v : array
+            edge destination node ids
+        key : array
+            edge keys
+        values : array
+            cost for each edge, NaN where an edge does not have the attribute
+        """
+        if name not in self.costs:
+            self.costs[name] = np.full((2, self.number_of_undirected_edges), 
+                                       np.nan, dtype=np.float32)
+        elif not self.costs[name].flags.writeable:
+            # Split shared row as costs may now differ by direction
+            self.costs[name] = self.costs[name].copy()
+        ref = self.edge_ref[self.edge_positions(u, v, key)]
+        self.costs[name][ref & 1, ref >> 1] = values
+        self._matrices.pop(name, None)
+        self._max_speeds.clear()
+
+    def edit_edges(self, remove=None, add=None):
+        """
+        Remove and add edges between existing nodes in place, recreating 
+        the CSR arrays from those held rather than from the source graph.
+
+        Parameters
+        ----------
+        remove : list of tuple
+            (u, v, key) of each edge to remove
+        add : list of tuple
+            (u, v, key, data) of each edge to add, with `data` a dict of 
+            edge attributes. Cost columns missing from `data` are NaN
+        """
+        remove, add = list(remove or []), list(add or [])
+        row = np.repeat(np.arange(self.number_of_nodes, dtype=np.int32),
+                        np.diff(self.indptr))
+        keep = np.ones(self.number_of_edges, dtype=bool)
+        if remove:
+            u, v, key = zip(*remove)
+            keep[self.edge_positions(u, v, key)] = False
+
+        u = self.index_of([edge[0] for edge in add])
+        v = self.index_of([edge[1] for edge in add])
+        direction, edge = self.edge_ref[keep] & 1, self.edge_ref[keep] >> 1
+        costs = {}
+        for name, table in self.costs.items():
+            added = np.array([data.get(name, np.nan) for _, _, _, data in add], 
+                             dtype=np.float32)
+            costs[name] = np.concatenate([table[direction, edge], added])
+
+        # Attributes of added edges, with geometry from lower to higher node
+        attrs = {}
+        names = list(self.attrs)
+        if self._holds_attrs:
+            names += [name for _, _, _, data in add for name in data 
+                      if name not in names and name not in costs]
+        for name in names:
+            table = self.attrs.get(name)
+            held = (table[direction, edge] if table is not None 
+                    else np.full(len(edge), None, dtype=object))
+            added = _attr_array([data.get(name) for _, _, _, data in add])
+            if name == 'geometry':
+                added = _orient(added, u > v)
+            elif held.dtype.kind == 'f':
+                try:
+                    added = added.astype(np.float64)
+                except (TypeError, ValueError):
+                    pass
+            attrs[name] = np.concatenate([held, added])
+
+        self._set_edges(np.concatenate([row[keep], u]),
+                        np.concatenate([self.indices[keep], v]),
+                        np.concatenate([self.key[keep], 
+                                        np.array([edge[2] for edge in add], dtype=np.int32)]),
+                        costs, attrs, held=True)
+
+    def set_attrs(self, name, u, v, key, values):
+        """
+        Set attribute column `name` for the given edges in place, adding 
+        the column if not already held.
+
+        Parameters
+        ----------
+        name : str
+            edge attribute name
+        u : array
+            edge origin node ids
+        v : array
+            edge destination node ids
+        key : array
+            edge keys
+        values : array
+            value for each edge, None or NaN where an edge does not have 
+            the attribute
+        """
+        values = _attr_array(values)
+        table = self.attrs.get(name)
+        if table is None:
+            table = np.full((2, self.number_of_undirected_edges), None, dtype=object)
+        dtype = (object if object in (table.dtype, values.dtype) 
+                 else np.result_type(table.dtype, values.dtype))
+        if not table.flags.writeable or table.dtype != dtype:
+            table = table.astype(dtype)
+        ref = self.edge_ref[self.edge_positions(u, v, key)]
+        if name == 'geometry':
+            values = _orient(values, (ref & 1).astype(bool))
+        table[ref & 1, ref >> 1] = values
+        self.attrs[name] = table
+
+    def out_edge_positions(self, nodes):
+        """
+        Return position in CSR arrays of each edge leaving node index array
+        `nodes`, without reading edges of other nodes.
+        """
+        nodes = np.asarray(nodes, dtype=np.int64)
+        starts, ends = self.indptr[nodes], self.indptr[nodes + 1]
+        counts = ends - starts
+        return np.repeat(ends - np.cumsum(counts), counts) + np.arange(counts.sum())
+
+    def edge_values(self, name, positions=None):
+        """
+        Return cost or attribute `name` of each edge in CSR order, or at
+        `positions`, in the direction of travel. Costs are NaN and 
+        attributes None where an edge does not have them, and geometry 
+        is None where not held.
+        """
+        ref = self.edge_ref if positions is None else self.edge_ref[positions]
+        if name in self.costs:
+            return self.costs[name][ref & 1, ref >> 1].astype(np.float64)
+        if name not in self.attrs:
+            return np.full(len(ref), None, dtype=object)
+        values = self.attrs[name][ref & 1, ref >> 1]
+        if name == 'geometry':
+            values = _orient(values, (ref & 1).astype(bool))
+        return values
+
+    def edge_geometries(self, positions=None):
+        """
+        Return geometry of each edge in CSR order, or at `positions`, 
+        running in the direction of travel, with a straight line between
+        its nodes where geometry is not held, the same as ox.graph_to_gdfs().
+        """
+        positions = np.arange(self.number_of_edges) if positions is None else positions
+        geoms = self.edge_values('geometry', positions)
+        missing = np.flatnonzero([not hasattr(g, 'coords') for g in geoms])
+        if len(missing):
+            row = np.searchsorted(self.indptr, positions[missing], side='right') - 1
+            col = self.indices[positions[missing]]
+            for i, a, b in zip(missing.tolist(), row.tolist(), col.tolist()):
+                geoms[i] = LineString([(self.x[a], self.y[a]), (self.x[b], self.y[b])])
+        return geoms
+
+    def to_graph(self, graph_attrs=None, nodes=None):
+        """
+        Return networkx graph of the nodes and edges held, or only of node
+        index array `nodes` and the edges between them. Costs are float32 
+        precision, and null attributes are not set, the same as 
+        ox.graph_from_gdfs().
+
+        Parameters
+        ----------
+        graph_attrs : dict
+            graph attributes, e.g. crs
+        nodes : array
+            optional node indices to create a subgraph of
+        """
+        nodes = np.arange(self.number_of_nodes) if nodes is None else np.unique(nodes)
+        G = nx.MultiDiGraph(**(graph_attrs or {}))
+
+        names = list(self.node_attrs)
+        columns = [self.node_attrs[name][nodes].tolist() for name in names]
+        node_data = []
+        for i, (x, y) in enumerate(zip(self.x[nodes].tolist(), self.y[nodes].tolist())):
+            data = {'y': y, 'x': x}
+            for name, column in zip(names, columns):
+                if _notnull(column[i]):
+                    data[name] = column[i]
+            node_data.append(data)
+        G.add_nodes_from(zip(self.node_ids[nodes].tolist(), node_data))
+
+        positions = self.out_edge_positions(nodes)
+        inside = np.zeros(self.number_of_nodes, dtype=bool)
+        inside[nodes] = True
+        positions = positions[inside[self.indices[positions]]]
+        row = np.searchsorted(self.indptr, positions, side='right') - 1
+        names = list(self.attrs) + list(self.costs)
+        columns = [self.edge_values(name, positions).tolist() for name in names]
+        edge_data = []
+        for i in range(len(positions)):
+            data = {}
+            for name, column in zip(names, columns):
+                if _notnull(column[i]):
+                    data[name] = column[i]
+            edge_data.append(data)
+        G.add_edges_from(zip(self.node_ids[row].tolist(), 
+                             self.node_ids[self.indices[positions]].tolist(),
+                             self.key[positions].tolist(), edge_data))
+        return G
+
+    def to_gdfs(self, crs):
+        """
+        Return node and edge GeoDataFrames of the nodes and edges held, the 
+        same as ox.graph_to_gdfs() of the graph, with edges in CSR order.
+
+        Parameters
+        ----------
+        crs : string or pyproj.CRS
+            crs of node coordinates
+        """
+        nodes = pd.DataFrame({'y': self.y, 'x': self.x}, 
+                             index=pd.Index(self.node_ids, name='osmid'))
+        for name, values in self.node_attrs.items():
+            nodes[name] = values
+        nodes = gpd.GeoDataFrame(nodes.infer_objects(), 
+                                 geometry=gpd.points_from_xy(self.x, self.y), crs=crs)
+
+        row = np.repeat(np.arange(self.number_of_nodes, dtype=np.int32), np.diff(self.indptr))
+        index = pd.MultiIndex.from_arrays([self.node_ids[row], self.node_ids[self.indices],
+                                           self.key.astype(np.int64)], names=['u', 'v', 'key'])
+        edges = pd.DataFrame({name: self.edge_values(name) 
+                              for name in list(self.attrs) + list(self.costs)
+                              if name != 'geometry'}, index=index)
+        edges = gpd.GeoDataFrame(edges.infer_objects(), 
+                                 geometry=gpd.GeoSeries(self.edge_geometries(), index=index), 
+                                 crs=crs)
+        return nodes, edges
+
+    def edge_costs(self, weight):
+        """
+        Return cost of each edge in CSR order, in the direction of travel. 
+        Edges without the attribute cost 1, the same as networkx shortest 
+        path functions.
+
+        Parameters
+        ----------
+        weight : str
+            edge attribute to use as network cost
+        """
+        if weight not in self.costs:
+            return np.ones(self.number_of_edges, dtype=np.float32)
+        costs = self.costs[weight][self.edge_ref & 1, self.edge_ref >> 1]
+        return np.where(np.isnan(costs), np.float32(1), costs)
+
+    def matrix(self, weight):
+        """
+        Return sparse adjacency matrix with lowest cost between each pair of
+        nodes, caching the result for later searches.
+
+        Parameters
+        ----------
+        weight : str
+            edge attribute to use as network cost
+        """
+        if weight not in self._matrices:
+            row = np.repeat(np.arange(self.number_of_nodes, dtype=np.int32),
+                            np.diff(self.indptr))
+            costs = self.edge_costs(weight)
+
+            # Keep only lowest cost edge between each pair of nodes
+            indices = self.indices
+            order = np.lexsort((costs, indices, row))
+            row, col, costs = row[order], indices[order], costs[order]
+            first = np.ones(len(row), dtype=bool)
+            first[1:] = (row[1:] != row[:-1]) | (col[1:] != col[:-1])
+
+            self._matrices[weight] = csr_matrix(
+                (costs[first].astype(np.float64), (row[first], col[first])),
+                shape=(self.number_of_nodes, self.number_of_nodes))
+
+        return self._matrices[weight]
+
+    def max_speed(self, weight):
+        """
+        Return the largest edge length per unit of `weight`, so a search 
+        within a cost can reach no further than cost * max_speed() metres,
+        or inf if an edge has length but no cost.
+
+        Parameters
+        ----------
+        weight : str
+            edge attribute to use as network cost
+        """
+        if weight not in self._max_speeds:
+            length = self.edge_costs('length').astype(np.float64)
+            costs = self.edge_costs(weight).astype(np.float64)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                speeds = np.where(length > 0, length / costs, 0)
+            self._max_speeds[weight] = float(speeds.max()) if len(speeds) else 0.0
+        return self._max_speeds[weight]
+
+    def _local_matrix(self, matrix, nodes):
+        """
+        Return rows and columns of `matrix` for sorted node index array 
+        `nodes`, without reading edges of other nodes.
+        """
+        starts, ends = matrix.indptr[nodes], matrix.indptr[nodes + 1]
+        counts = ends - starts
+        positions = (np.repeat(ends - np.cumsum(counts), counts) + 
+                     np.arange(counts.sum()))
+        cols = matrix.indices[positions]
+        local = np.searchsorted(nodes, cols)
+        local[local == len(nodes)] = 0
+        keep = nodes[local] == cols
+        rows = np.repeat(np.arange(len(nodes), dtype=np.int32), counts)
+        return csr_matrix((matrix.data[positions][keep], (rows[keep], local[keep])),
+                          shape=(len(nodes), len(nodes)))
+
+    def multi_source_costs(self, sources, cutoff=None, weight='length', nodes=None):
+        """
+        Return the lowest network cost from any of `sources` to each node
+        reached, matching network.multi_source_costs().
+
+        Parameters
+        ----------
+        sources : list
+            node ids to search from
+        cutoff : decimal
+            stop searching beyond this cost
+        weight : str
+            edge attribute to use as network cost
+        nodes : array
+            optional node indices to limit the search to, e.g. those within
+            reach of the sources, so search cost depends on the number of 
+            nodes rather than the size of the network
+
+        Returns
+        -------
+        costs : dict
+            dict keyed by node id of cost from the nearest source
+        """
+        matrix = self.matrix(weight)
+        indices = np.unique(self.index_of(list(sources)))
+        if nodes is not None:
+            nodes = np.union1d(nodes, indices).astype(np.int32)
+            matrix = self._local_matrix(matrix, nodes)
+            indices = np.searchsorted(nodes, indices)
+        dist = dijkstra(matrix,
+                        indices=indices,
+                        min_only=True,
+                        limit=np.inf if cutoff is None else cutoff)
+        reached = np.flatnonzero(np.isfinite(dist))
+        node_index = reached if nodes is None else nodes[reached]
+        return dict(zip(self.node_ids[node_index].tolist(),
+                        dist[reached].tolist()))
+
+
+def _attr_array(values):
+    """Return attribute values as a numeric array if given as one, else of objects"""
+    if isinstance(values, np.ndarray) and values.dtype.kind in 'biuf':
+        return np.asarray(values)
+    return np.fromiter(values, dtype=object, count=len(values))
+
+
+def _orient(geoms, reverse):
+    """Return copy of object array `geoms` with lines reversed where `reverse`"""
+    geoms = geoms.copy()
+    for i in np.flatnonzero(reverse).tolist():
+        if hasattr(geoms[i], 'coords'):
+            geoms[i] = LineString(geoms[i].coords[::-1])
+    return geoms
+
+
+def _equal(a, b):
+    """Return True if attribute values are equal, e.g. lists or geometry"""
+    try:
+        return bool(a == b)
+    except (TypeError, ValueError):
+        return False
+
+
+def _notnull(value):
+    """Return True if an attribute value is set, the same as ox.graph_from_gdfs()"""
+    return isinstance(value, list) or pd.notnull(value)
@@ -1,11 +1,16 @@
 """ Return elevation data from DEM tiles """
 
 import os
-import requests
-import osmnx as ox
-from osgeo import gdal
+import networkx as nx
 import rasterio
+import pyproj
 import math
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from rasterio.windows import Window
+
+from . import client as http_client
 
 
 def gradient_adjusted_walk_speed(gradient, max_speed=1.5, unit='m/s'): 
@@ -19,8 +24,9 @@ def gradient_adjusted_walk_speed(gradient, max_speed=1.5, unit='m/s'):
     
     Parameters
     ----------
-    gradient : list or series
-        list or series of gradients, calcaulteda as (rise / run * 100).
+    gradient : list, numpy.ndarray or series
+        list, array or series of gradients, calcaulteda as (rise / run * 100).
+        Arrays and series are calculated in a single vectorised pass.
     max_speed : decimal
         maximum walk speed for use in Irmischer formulation, default 5.4 km/h
         (1.5 m/s) which is reached at 5% downhill gradient. NB: The standard 
@@ -31,8 +37,10 @@ def gradient_adjusted_walk_speed(gradient, max_speed=1.5, unit='m/s'):
         
     Returns
     -------
-    speed : list of decimal
-        list of speeds adjusted by slope
+    speed : list of decimal, numpy.ndarray or series
+        speeds adjusted by slope, as a list unless `gradient` is an array or
+        series in which case the same type is returned with the same float
+        dtype and index
     
     """
     # Convert km/h to m/s
@@ -44,6 +52,16 @@ def gradient_adjusted_walk_speed(gradient, max_speed=1.5, unit='m/s'):
         # No unit specified so fail
         assert False
         
+    # Vectorised path for arrays and series, rounded the same as round()
+    if isinstance(gradient, (np.ndarray, pd.Series)):
+        g = np.asarray(gradient, dtype=np.float64)
+        s = np.round((ms - 1) + np.exp(-(g + 5)**2 / (2 * 30**2)), 4)
+        if np.issubdtype(gradient.dtype, np.floating):
+            s = s.astype(gradient.dtype, copy=False)
+        if isinstance(gradient, pd.Series):
+            s = pd.Series(s, index=gradient.index, name=gradient.name)
+        return s
+
     # Ensure gradient is iterable so can pass in list of series
     gradient = gradient if hasattr(gradient, '__iter__') else [gradient]
 
@@ -68,10 +86,13 @@ def add_walk_speed_to_graph(G):
 
 def add_elevations_to_graph(G, 
                           raster_path, 
-                          raster_crs=None):
+                          raster_crs=None,
+                          max_workers=None,
+                          cache=None,
+                          raster_source=None):
     """
-    Use osmnx to add `elevation` and `grade` attribute to each node from local
-    raster file(s).
+    Add `elevation` attribute to each node from local raster file(s), and 
+    `grade` attribute to each edge using edge_grades().
 
     Parameters
     ----------
@@ -80,37 +101,196 @@ def add_elevations_to_graph(G,
     raster_path : string or pathlib.Path or list of strings/Paths
         path (or list of paths) to the raster file(s) to query
     raster_crs : string or pyproj.CRS
-        the coordinate reference system for the raster, default to G.graph crs. 
+        the coordinate reference system for the raster, default to crs of 
+        the first raster file or G.graph crs if it has none. 
+    max_workers : int
+        number of threads to read raster files with, default None for the
+        ThreadPoolExecutor default.
+    cache : cache.ElevationCache
+        elevation cache to read nodes from before sampling rasters, and add 
+        sampled nodes to. Default None for no cache.
+    raster_source : string
+        name of the raster source in the cache, e.g. 'linz_53591', default 
+        the folder holding the raster files.
 
     Returns
     -------
     G : networkx.MultiDiGraph
-        graph with node elevation, edge `grade` and `grade_abs` attributes
+        graph with node elevation and edge `grade` attributes
     """
-    graph_crs = G.graph["crs"]
+    raster_paths = [raster_path] if isinstance(raster_path, (str, os.PathLike)) else list(raster_path)
+
+    nodes, x, y = [], [], []
+    for node, data in G.nodes(data=True):
+        nodes.append(node)
+        x.append(data['x'])
+        y.append(data['y'])
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    elevations = np.full(len(nodes), np.nan)
+
+    # Use cached elevations, so only nodes new to the cache are sampled
+    if cache is not None:
+        if raster_source is None:
+            raster_source = os.path.commonpath([os.path.dirname(os.path.abspath(path))
+                                                for path in raster_paths])
+        cached = cache.get_many(raster_source, nodes)
+        elevations[:] = [cached.get(node, np.nan) for node in nodes]
+    sample = np.flatnonzero(np.isnan(elevations))
     
-    # If raster_crs specified then use G.graph crs
-    if raster_crs is None:
-        raster_crs = graph_crs
+    if len(sample):
+        # If raster_crs not specified then use raster or G.graph crs
+        if raster_crs is None and raster_paths:
+            with rasterio.open(raster_paths[0]) as raster:
+                raster_crs = raster.crs
+        if raster_crs is None:
+            raster_crs = G.graph["crs"]
 
-    # Ensure graph same crs as raster for processing        
-    G = ox.project_graph(G, raster_crs)
+        # Transform only node coordinates to raster crs, not the whole graph
+        to_raster = pyproj.Transformer.from_crs(G.graph["crs"], raster_crs, always_xy=True)
+        sample_x, sample_y = to_raster.transform(x[sample], y[sample])
 
-    # Process raster data
-    G = ox.add_node_elevations_raster(G, raster_path)
-    G = ox.add_edge_grades(G, add_absolute=False)   
-        
-    # Ensure graph crs set back to original
-    G = ox.project_graph(G, graph_crs)
+        # Process raster data
+        elevations[sample] = raster_elevations(sample_x, sample_y, raster_paths, 
+                                               max_workers=max_workers)
+
+        # Add sampled nodes to cache, except those not within any raster
+        if cache is not None:
+            cache.put_many(raster_source, {nodes[i]: elevations[i] for i in sample
+                                           if not np.isnan(elevations[i])})
+
+    nx.set_node_attributes(G, dict(zip(nodes, elevations.tolist())), name="elevation")
+    
+    # Add edge grades from node elevation array, the same as 
+    # ox.add_edge_grades() but without looking up each edge's nodes
+    edges = list(G.edges(keys=True, data='length'))
+    grades = edge_grades(nodes, elevations, 
+                         [edge[0] for edge in edges], [edge[1] for edge in edges],
+                         np.array([edge[3] for edge in edges], dtype=np.float64))
+    nx.set_edge_attributes(G, {edge[:3]: grade for edge, grade in zip(edges, grades.tolist())},
+                           name="grade")
 
     return G
 
 
+def edge_grades(node_ids, node_elevations, u, v, length, precision=3):
+    """
+    Return grade (rise / run) of each edge from `u` to `v`, calculated from
+    node elevation arrays in a single vectorised pass.
+
+    Parameters
+    ----------
+    node_ids : list or numpy.ndarray
+        node ids
+    node_elevations : list or numpy.ndarray
+        elevation of each node in `node_ids`
+    u, v : list or numpy.ndarray
+        edge origin and destination node ids
+    length : numpy.ndarray
+        edge lengths, in the same units as elevation
+    precision : int
+        decimal precision to round grades to, default 3 the same as 
+        ox.add_edge_grades()
+
+    Returns
+    -------
+    grades : numpy.ndarray
+        NaN where either end node has no elevation
+    """
+    node_ids = np.asarray(node_ids)
+    node_elevations = np.asarray(node_elevations, dtype=np.float64)
+    
+    # Edge end node positions, by binary search of sorted node ids
+    order = np.argsort(node_ids, kind='stable')
+    sorted_ids = node_ids[order]
+    elevation_u = node_elevations[order[np.searchsorted(sorted_ids, np.asarray(u))]]
+    elevation_v = node_elevations[order[np.searchsorted(sorted_ids, np.asarray(v))]]
+    
+    return ((elevation_v - elevation_u) / length).round(precision)
+
+
+def raster_elevations(x, y, raster_path, band=1, max_workers=None):
+    """
+    Return raster value at each point, reading only the window of each 
+    raster file that contains points, with files read in parallel.
+
+    Each point is sampled from the first file whose bounds contain it, so
+    a large set of DEM tiles is read without building a virtual raster 
+    across all of them.
+
+    Parameters
+    ----------
+    x, y : numpy.ndarray
+        point coordinates in the raster crs
+    raster_path : string or pathlib.Path or list of strings/Paths
+        path (or list of paths) to the raster file(s) to query
+    band : int
+        raster band to read, default 1
+    max_workers : int
+        number of threads to read raster files with, default None for the
+        ThreadPoolExecutor default.
+
+    Returns
+    -------
+    values : numpy.ndarray
+        value at each point, NaN for points not within any raster or on 
+        nodata cells
+    """
+    raster_paths = [raster_path] if isinstance(raster_path, (str, os.PathLike)) else list(raster_path)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    values = np.full(len(x), np.nan)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+        # Group points by the raster file containing them, reading only 
+        # file headers
+        groups = []
+        remaining = np.ones(len(x), dtype=bool)
+        for path, (left, bottom, right, top) in zip(raster_paths, 
+                                                    executor.map(_raster_bounds, raster_paths)):
+            inside = remaining & (x >= left) & (x <= right) & (y >= bottom) & (y <= top)
+            if inside.any():
+                groups.append((path, np.flatnonzero(inside)))
+                remaining &= ~inside
+
+        # Read files in parallel, as rasterio releases the GIL while reading
+        futures = [executor.submit(_read_raster_window, path, x[index], y[index], band)
+                   for path, index in groups]
+        for (_, index), future in zip(groups, futures):
+            values[index] = future.result()
+    
+    return values
+
+
+def _raster_bounds(path):
+    """Return raster (left, bottom, right, top) bounds"""
+    with rasterio.open(path) as raster:
+        return raster.bounds
+
+
+def _read_raster_window(path, x, y, band):
+    """Return raster values at points, reading only the window around them"""
+    with rasterio.open(path) as raster:
+        cols, rows = ~raster.transform * (x, y)
+        rows = np.clip(np.floor(rows).astype(np.int64), 0, raster.height - 1)
+        cols = np.clip(np.floor(cols).astype(np.int64), 0, raster.width - 1)
+        row_off, col_off = rows.min(), cols.min()
+        window = Window(col_off, row_off, cols.max() - col_off + 1, rows.max() - row_off + 1)
+        data = raster.read(band, window=window)
+        values = data[rows - row_off, cols - col_off].astype(np.float64)
+        if raster.nodata is not None:
+            values[values == raster.nodata] = np.nan
+    return values
+
+
 def get_raster_tile_names_from_linz(access_points,
                                     buffer=1000,
                                     linz_api=None,
                                     linz_layer_code=53591, 
-                                    max_results=25):
+                                    max_results=25,
+                                    linz_url="https://data.linz.govt.nz",
+                                    client=None):
     """
     Return list of LINZ Wellington region DEM tiles within specified radius of
     point. These then need to be manually downloaded.
@@ -130,6 +310,11 @@ def get_raster_tile_names_from_linz(access_points,
         Koordinates API key to access the layer from LINZ.
     max_results :
         Maximum number of results to be returned from LINZ query, default `25`.
+    linz_url : str
+        LINZ data service base url, default "https://data.linz.govt.nz".
+    client : client.HttpClient
+        client to query with, default client.default_client(), which runs
+        queries for each access point at once and caches responses.
  
     Returns
     -------
@@ -141,23 +326,20 @@ def get_raster_tile_names_from_linz(access_points,
         linz_api = "69b10a1278be4d0e9a0247fdf4cfe0cc"
 
     # LINZ base url
-    dem_index_url = "https://data.linz.govt.nz/services/query/v1/vector.json?" + \
+    dem_index_url = linz_url + "/services/query/v1/vector.json?" + \
                     "key={}&layer={}&x={}&y={}&radius={}&with_field_names=true" + \
                     "&max_results={}"
     
     # Ensure access_points is a list even when only passed a single access_point
     access_points = [access_points] if type(access_points) is tuple else access_points    
 
-    # Query LINZ index
+    # Query LINZ index for DEM tiles within range of each point at once
+    client = http_client.default_client() if client is None else client
+    urls = [dem_index_url.format(linz_api, linz_layer_code, ap[1], ap[0], buffer, max_results)
+            for ap in access_points]
     tiles = []
-    for ap in access_points:
-
-        # Identify DEM tiles within range of point
-        url = dem_index_url.format(linz_api, linz_layer_code, ap[1], ap[0], buffer, max_results)       
-        r = requests.get(url)
-        
-        if r.status_code == 200:
-            r_json = r.json()
+    for r_json in client.get_json_many(urls):
+        if r_json is not None:
             result = [i["properties"]["tile"] for i in r_json["vectorQuery"]["layers"][str(linz_layer_code)]["features"]]
         else:    
             result = []
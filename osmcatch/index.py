@@ -0,0 +1,473 @@
+"""Precomputed travel time index for station catchments"""
+
+import os
+import json
+import heapq
+
+import numpy as np
+import pandas as pd
+from scipy.sparse.csgraph import dijkstra
+
+# Arrays saved as .npy files within the index folder
+_ARRAYS = ['node_ids', 'nearest_station', 'nearest_access_node', 'nearest_cost',
+           'access_ptr', 'access_nodes', 'access_points', 'station_ptr', 
+           'station_nodes', 'station_costs']
+
+
+class TravelTimeIndex:
+    """
+    Network cost from each station to every node within `max_band`, and from
+    each node to its nearest station access point. Costs are from the origin
+    towards the station, e.g. uphill walk times, the same as 
+    WalkNetwork.nearest_station_times().
+
+    Once built the index is saved as a folder of .npy arrays, normally next
+    to the graph pickle, and loaded memory-mapped so iso_bands() for any
+    band up to `max_band` is a threshold lookup rather than a graph search.
+    """
+
+    def __init__(self, location_names, cost, max_band, arrays):
+        """
+        Parameters
+        ----------
+        location_names : list of str
+            station names, in index order.
+        cost : str
+            graph edge field used for network cost, e.g. 'walk_mins'.
+        max_band : decimal
+            largest cost held for each station.
+        arrays : dict
+            index arrays, as created by build().
+        """
+        self.location_names = list(location_names)
+        self.cost = cost
+        self.max_band = max_band
+        for name in _ARRAYS:
+            setattr(self, name, arrays[name])
+
+        # Lookup station by its access nodes
+        self._stations = {}
+        for station in range(len(self.location_names)):
+            nodes = self.access_nodes[self.access_ptr[station]:self.access_ptr[station + 1]]
+            self._stations.setdefault(frozenset(nodes.tolist()), station)
+
+    @classmethod
+    def build(cls, walk, stations_df, max_band=15, cost='walk_mins'):
+        """
+        Build index for stations on a WalkNetwork.
+
+        Parameters
+        ----------
+        walk : WalkNetwork
+            network to search.
+        stations_df : DataFrame
+            one row per station with `location_name` and `access_points`
+            columns, see catchment.group_access_points().
+        max_band : decimal
+            largest iso band that will be looked up, default 15.
+        cost : str
+            graph edge field to use for network cost, default 'walk_mins'.
+
+        Returns
+        -------
+        TravelTimeIndex
+        """
+        compact = walk.as_compact()
+        matrix = compact.matrix(cost)
+
+        # Snap all stations' access points to nodes in one query
+        station_points = [[points] if type(points) is tuple else points
+                          for points in stations_df['access_points']]
+        access_ptr = np.zeros(len(stations_df) + 1, dtype=np.int64)
+        np.cumsum([len(points) for points in station_points], out=access_ptr[1:])
+        access_points = [p for points in station_points for p in points]
+        access_nodes = np.array(walk.nearest_nodes(access_points) if access_points else [],
+                                dtype=compact.node_ids.dtype)
+        access_index = compact.index_of(access_nodes)
+
+        # Cost to each node within max_band of each station
+        station_nodes, station_costs = [], []
+        for station in range(len(access_ptr) - 1):
+            index = access_index[access_ptr[station]:access_ptr[station + 1]]
+            station_dist = dijkstra(matrix, indices=np.unique(index),
+                                    min_only=True, limit=max_band)
+            nodes = np.flatnonzero(np.isfinite(station_dist)).astype(np.int32)
+            station_nodes.append(nodes)
+            station_costs.append(station_dist[nodes])
+        station_ptr = np.zeros(len(station_nodes) + 1, dtype=np.int64)
+        np.cumsum([len(nodes) for nodes in station_nodes], out=station_ptr[1:])
+
+        arrays = {
+            'node_ids': compact.node_ids,
+            'access_ptr': access_ptr,
+            'access_nodes': access_nodes,
+            'access_points': np.array(access_points, dtype=np.float64).reshape(-1, 2),
+            'station_ptr': station_ptr,
+            'station_nodes': np.concatenate(station_nodes) if station_nodes
+                             else np.zeros(0, dtype=np.int32),
+            'station_costs': np.concatenate(station_costs) if station_costs
+                             else np.zeros(0, dtype=np.float64)}
+        # Nearest station costs from each node towards the station
+        arrays.update(nearest_stations(compact, matrix.T.tocsr(), access_index, access_ptr))
+
+        return cls(stations_df['location_name'], cost, max_band, arrays)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """
+        Load index saved with save().
+
+        Parameters
+        ----------
+        path : string or pathlib.Path
+            index folder.
+        mmap_mode : str
+            numpy memory-map mode, default 'r'. None to read into memory.
+        """
+        with open(os.path.join(path, 'index.json')) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode)
+                  for name in _ARRAYS}
+        return cls(meta['location_names'], meta['cost'], meta['max_band'], arrays)
+
+    def save(self, path):
+        """
+        Save index as a folder of .npy arrays, e.g.
+        `input_data/walk_network_graph_3_speed.index` next to the graph
+        pickle.
+
+        Parameters
+        ----------
+        path : string or pathlib.Path
+            index folder, created if it does not exist.
+        """
+        os.makedirs(path, exist_ok=True)
+        for name in _ARRAYS:
+            np.save(os.path.join(path, name + '.npy'), getattr(self, name))
+        with open(os.path.join(path, 'index.json'), 'w') as f:
+            json.dump({'location_names': self.location_names,
+                       'cost': self.cost,
+                       'max_band': self.max_band}, f)
+
+    def station(self, access_nodes):
+        """
+        Return index of station with `access_nodes`, or None if not held.
+        """
+        return self._stations.get(frozenset(access_nodes))
+
+    def lookup(self, access_nodes, max_cost, cost):
+        """
+        Return cost from station to each node within `max_cost`, or None if
+        the station, cost or band is not held by the index.
+
+        Parameters
+        ----------
+        access_nodes : list
+            station access nodes
+        max_cost : decimal
+            largest cost to return, normally the largest iso band
+        cost : str
+            graph edge field used for network cost
+
+        Returns
+        -------
+        costs : dict
+            dict keyed by node id of cost from the nearest access node, the
+            same as network.multi_source_costs()
+        """
+        station = self.station(access_nodes)
+        if station is None or cost != self.cost or max_cost > self.max_band:
+            return None
+
+        start, end = self.station_ptr[station], self.station_ptr[station + 1]
+        costs = np.asarray(self.station_costs[start:end])
+        nodes = np.asarray(self.station_nodes[start:end])[costs <= max_cost]
+        return dict(zip(self.node_ids[nodes].tolist(),
+                        costs[costs <= max_cost].tolist()))
+
+    def stations(self):
+        """
+        Return DataFrame of indexed stations with `location_name` and 
+        `access_points` columns, as passed to build().
+        """
+        points = [list(map(tuple, self.access_points[start:end].tolist()))
+                  for start, end in zip(self.access_ptr[:-1], self.access_ptr[1:])]
+        return pd.DataFrame({'location_name': self.location_names,
+                             'access_points': points})
+
+    def reaching(self, node_ids):
+        """
+        Return index of each station reaching any of `node_ids` within
+        `max_band`.
+        """
+        index = np.searchsorted(self.node_ids, np.asarray(node_ids, dtype=self.node_ids.dtype))
+        entry_station = np.repeat(np.arange(len(self.location_names)), 
+                                  np.diff(self.station_ptr))
+        return np.unique(entry_station[np.isin(self.station_nodes, index)]).tolist()
+
+    def update(self, compact, old_matrix, u, v):
+        """
+        Repair station costs after network edges are added, removed or 
+        change cost, returning the stations whose costs changed.
+
+        Only stations that reach a changed edge within `max_band` are
+        searched, and for each only the nodes whose cost can change: nodes 
+        reached through an edge that now costs more are searched again from
+        their unchanged neighbours, and lower costs are spread from edges 
+        that now cost less (Ramalingam & Reps dynamic shortest paths). The
+        nearest station to each node is repaired the same way, searching 
+        towards the stations.
+
+        Parameters
+        ----------
+        compact : CompactGraph
+            network after the edit, with the same nodes as the index
+        old_matrix : scipy.sparse.csr_matrix
+            CompactGraph.matrix() for the index cost before the edit
+        u, v : list
+            origin and destination node ids of changed edges
+
+        Returns
+        -------
+        stations : list of int
+            index of each station whose costs changed
+        """
+        if compact.number_of_nodes != len(self.node_ids):
+            raise ValueError("Network nodes have changed since index was built")
+        matrix = compact.matrix(self.cost)
+        reverse = matrix.T.tocsr()
+        u = compact.index_of(u)
+        v = compact.index_of(v)
+        old_cost = _pair_costs(old_matrix, u, v)
+        new_cost = _pair_costs(matrix, u, v)
+        changed = old_cost != new_cost
+        u, v, old_cost, new_cost = u[changed], v[changed], old_cost[changed], new_cost[changed]
+
+        # Only stations reaching the start of a changed edge can change
+        candidates = self.reaching(compact.node_ids[u])
+
+        station_nodes, station_costs, updated = {}, {}, []
+        for station in candidates:
+            start, end = self.station_ptr[station], self.station_ptr[station + 1]
+            costs = dict(zip(np.asarray(self.station_nodes[start:end]).tolist(),
+                             np.asarray(self.station_costs[start:end]).tolist()))
+            access = self.access_nodes[self.access_ptr[station]:self.access_ptr[station + 1]]
+            if _repair_costs(costs, compact.index_of(access).tolist(), old_matrix, 
+                             matrix, reverse, u, v, old_cost, new_cost, self.max_band):
+                nodes = np.array(sorted(costs), dtype=np.int32)
+                station_nodes[station] = nodes
+                station_costs[station] = np.array([costs[n] for n in nodes.tolist()])
+                updated.append(station)
+
+        if updated:
+            self._replace_stations(station_nodes, station_costs)
+        if len(u):
+            self._repair_nearest(compact, old_matrix, matrix, reverse, 
+                                 u, v, old_cost, new_cost)
+
+        return updated
+
+    def _repair_nearest(self, compact, old_matrix, matrix, reverse, 
+                        u, v, old_cost, new_cost):
+        """
+        Repair nearest station arrays for changed edges, searching again 
+        only the nodes whose lowest cost path towards a station can change.
+        """
+        # Copy arrays memory-mapped read only by load()
+        nearest_cost = np.array(self.nearest_cost, dtype=np.float32)
+        nearest_station = np.array(self.nearest_station, dtype=np.int32)
+        nearest_access_node = np.array(self.nearest_access_node, dtype=np.int64)
+
+        # First station listed for each access node, as for nearest_stations()
+        access_index = compact.index_of(self.access_nodes).tolist()
+        access_station = np.repeat(np.arange(len(self.location_names)), 
+                                   np.diff(self.access_ptr)).tolist()
+        station_of_access = {}
+        for node, station in zip(access_index, access_station):
+            station_of_access.setdefault(node, station)
+        access_of_id = dict(zip(self.access_nodes.tolist(), access_index))
+
+        # Searching towards stations, so a changed a to b edge is followed 
+        # from b to a, and paths are followed against edge direction
+        old_reverse = old_matrix.T.tocsr()
+        stack = [a for a, b, old, new in zip(u.tolist(), v.tolist(), old_cost, new_cost)
+                 if new > old and np.isfinite(nearest_cost[b]) and 
+                 np.isclose(nearest_cost[b] + old, nearest_cost[a], rtol=1e-6, atol=0)]
+        affected = set()
+        while stack:
+            node = stack.pop()
+            if node in affected:
+                continue
+            affected.add(node)
+            start, end = old_reverse.indptr[node], old_reverse.indptr[node + 1]
+            for prev_node, cost in zip(old_reverse.indices[start:end].tolist(),
+                                       old_reverse.data[start:end].tolist()):
+                if (prev_node not in affected and np.isclose(
+                        nearest_cost[node] + cost, nearest_cost[prev_node], rtol=1e-6, atol=0)):
+                    stack.append(prev_node)
+        affected = np.array(sorted(affected), dtype=np.int64)
+        nearest_cost[affected] = np.inf
+        nearest_station[affected] = -1
+        nearest_access_node[affected] = -1
+
+        # Search again from unaffected neighbours, access nodes and cheaper
+        # edges, carrying the access node each cost is from
+        heap = [(0.0, node, node) for node in affected.tolist() if node in station_of_access]
+        for node in affected.tolist():
+            start, end = matrix.indptr[node], matrix.indptr[node + 1]
+            for next_node, cost in zip(matrix.indices[start:end].tolist(),
+                                       matrix.data[start:end].tolist()):
+                if nearest_station[next_node] >= 0:
+                    heap.append((float(nearest_cost[next_node]) + cost, node, 
+                                 access_of_id[int(nearest_access_node[next_node])]))
+        for a, b, old, new in zip(u.tolist(), v.tolist(), old_cost, new_cost):
+            if new < old and nearest_station[b] >= 0:
+                heap.append((float(nearest_cost[b]) + new, a, 
+                             access_of_id[int(nearest_access_node[b])]))
+        heapq.heapify(heap)
+
+        while heap:
+            cost, node, access = heapq.heappop(heap)
+            if np.float32(cost) >= nearest_cost[node]:
+                continue
+            nearest_cost[node] = cost
+            nearest_station[node] = station_of_access[access]
+            nearest_access_node[node] = compact.node_ids[access]
+            start, end = reverse.indptr[node], reverse.indptr[node + 1]
+            for prev_node, edge_cost in zip(reverse.indices[start:end].tolist(),
+                                            reverse.data[start:end].tolist()):
+                if np.float32(cost + edge_cost) < nearest_cost[prev_node]:
+                    heapq.heappush(heap, (cost + edge_cost, prev_node, access))
+
+        self.nearest_cost = nearest_cost
+        self.nearest_station = nearest_station
+        self.nearest_access_node = nearest_access_node
+
+    def _replace_stations(self, station_nodes, station_costs):
+        """Replace cost arrays for stations in `station_nodes`"""
+        nodes, costs = [], []
+        for station in range(len(self.location_names)):
+            if station in station_nodes:
+                nodes.append(station_nodes[station])
+                costs.append(station_costs[station])
+            else:
+                start, end = self.station_ptr[station], self.station_ptr[station + 1]
+                nodes.append(np.asarray(self.station_nodes[start:end]))
+                costs.append(np.asarray(self.station_costs[start:end]))
+        station_ptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum([len(n) for n in nodes], out=station_ptr[1:])
+        self.station_ptr = station_ptr
+        self.station_nodes = np.concatenate(nodes).astype(np.int32)
+        self.station_costs = np.concatenate(costs).astype(np.float64)
+
+
+def nearest_stations(compact, matrix, access_index, access_ptr, limit=None):
+    """
+    Return nearest station to each node, from a single search out from all
+    station access nodes.
+
+    Parameters
+    ----------
+    compact : CompactGraph
+        network searched
+    matrix : scipy.sparse.csr_matrix
+        CompactGraph.matrix() transposed, so costs are from each node 
+        towards the station, as used by TravelTimeIndex and 
+        WalkNetwork.nearest_station_times()
+    access_index : array
+        node index of each station access node, in station order
+    access_ptr : array
+        start of each station in `access_index`, and its end
+    limit : decimal
+        stop searching beyond this cost, default None for no limit
+
+    Returns
+    -------
+    arrays : dict
+        `nearest_station` (-1 if not reached), `nearest_access_node` and 
+        `nearest_cost` from each node to its nearest access node
+    """
+    dist, _, sources = dijkstra(matrix, indices=np.unique(access_index),
+                                min_only=True, return_predecessors=True,
+                                limit=np.inf if limit is None else limit)
+    station_of_access = np.full(compact.number_of_nodes, -1, dtype=np.int32)
+    access_station = np.repeat(np.arange(len(access_ptr) - 1, dtype=np.int32),
+                               np.diff(access_ptr))
+    station_of_access[access_index[::-1]] = access_station[::-1]
+    reached = sources >= 0
+    nearest_station = np.full(compact.number_of_nodes, -1, dtype=np.int32)
+    nearest_station[reached] = station_of_access[sources[reached]]
+    nearest_access_node = np.full(compact.number_of_nodes, -1, dtype=np.int64)
+    nearest_access_node[reached] = compact.node_ids[sources[reached]]
+    return {'nearest_station': nearest_station,
+            'nearest_access_node': nearest_access_node,
+            'nearest_cost': dist.astype(np.float32)}
+
+
+def _pair_costs(matrix, u, v):
+    """Return cost of each u to v edge in csr `matrix`, inf if no edge"""
+    costs = np.full(len(u), np.inf)
+    for i, (row, col) in enumerate(zip(u.tolist(), v.tolist())):
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        found = np.flatnonzero(matrix.indices[start:end] == col)
+        if len(found):
+            costs[i] = matrix.data[start + found[0]]
+    return costs
+
+
+def _repair_costs(costs, sources, old_matrix, matrix, reverse, u, v, 
+                  old_cost, new_cost, max_cost):
+    """
+    Update `costs` dict of node index to cost from `sources` in place for 
+    changed edges, returning True if any cost changed.
+    """
+    before = dict(costs)
+
+    # Nodes whose lowest cost path may use an edge that now costs more,
+    # found by following edges on lowest cost paths from the edge end
+    stack = [b for a, b, old, new in zip(u.tolist(), v.tolist(), old_cost, new_cost)
+             if new > old and a in costs and b in costs 
+             and np.isclose(costs[a] + old, costs[b], rtol=1e-9, atol=0)]
+    affected = set()
+    while stack:
+        node = stack.pop()
+        if node in affected:
+            continue
+        affected.add(node)
+        start, end = old_matrix.indptr[node], old_matrix.indptr[node + 1]
+        for next_node, cost in zip(old_matrix.indices[start:end].tolist(),
+                                   old_matrix.data[start:end].tolist()):
+            if (next_node in costs and next_node not in affected and
+                    np.isclose(costs[node] + cost, costs[next_node], rtol=1e-9, atol=0)):
+                stack.append(next_node)
+    for node in affected:
+        del costs[node]
+
+    # Search again from unaffected neighbours, sources and cheaper edges
+    heap = [(0.0, node) for node in sources if node in affected]
+    for node in affected:
+        start, end = reverse.indptr[node], reverse.indptr[node + 1]
+        for prev_node, cost in zip(reverse.indices[start:end].tolist(),
+                                   reverse.data[start:end].tolist()):
+            if prev_node in costs:
+                heap.append((costs[prev_node] + cost, node))
+    for a, b, old, new in zip(u.tolist(), v.tolist(), old_cost, new_cost):
+        if new < old and a in costs:
+            heap.append((costs[a] + new, b))
+    heapq.heapify(heap)
+
+    while heap:
+        cost, node = heapq.heappop(heap)
+        if cost > max_cost:
+            break
+        if node in costs and costs[node] <= cost:
+            continue
+        costs[node] = cost
+        start, end = matrix.indptr[node], matrix.indptr[node + 1]
+        for next_node, edge_cost in zip(matrix.indices[start:end].tolist(),
+                                        matrix.data[start:end].tolist()):
+            next_cost = cost + edge_cost
+            if next_cost <= max_cost and next_cost < costs.get(next_node, np.inf):
+                heapq.heappush(heap, (next_cost, next_node))
+
+    return costs != before
@@ -0,0 +1,200 @@
+"""Build iso band polygons from network edges"""
+
+import numpy as np
+import osmnx as ox
+import geopandas as gpd
+from shapely.geometry import LineString
+from shapely.ops import substring, unary_union
+
+
+def utm_crs(lng):
+    """
+    Return UTM crs for the zone containing longitude `lng`, calculated the
+    same as ox.project_gdf().
+    """
+    utm_zone = int(np.floor((lng + 180) / 6) + 1)
+    return "+proj=utm +zone={} +ellps=WGS84 +datum=WGS84 +units=m +no_defs".format(utm_zone)
+
+
+class IsoPolygonBuilder:
+    """
+    Build iso band polygons by buffering network edges.
+
+    Edge geometries are projected once, when first added, and buffered once
+    for each buffer distance, with both directions of a two way edge sharing
+    a single buffer. Bands are built from the smallest outward, each adding
+    its new edges to the union of the band inside it.
+    """
+
+    def __init__(self, crs):
+        """
+        Parameters
+        ----------
+        crs : string or pyproj.CRS
+            projected crs to buffer edges in, e.g. from utm_crs()
+        """
+        self.crs = crs
+        self._projected = {}
+        self._buffers = {}
+        # Shared geometry key of each (u, v, key) edge, and whether the 
+        # shared geometry runs from u to v
+        self._keys = {}
+        self._shared = {}
+
+    def missing(self, edge_keys):
+        """
+        Return edges not yet added to the builder.
+
+        Parameters
+        ----------
+        edge_keys : list of tuple
+            (u, v, key) of edges
+        """
+        return [edge for edge in edge_keys if tuple(edge) not in self._keys]
+
+    def discard(self, edge_keys):
+        """
+        Drop held geometry for edges, e.g. edges removed from the network, 
+        so they are added again if needed.
+
+        Parameters
+        ----------
+        edge_keys : list of tuple
+            (u, v, key) of edges
+        """
+        for edge in edge_keys:
+            self._keys.pop(tuple(edge), None)
+
+    def add_edges(self, edges):
+        """
+        Project and hold geometry for edges not yet added. The two 
+        directions of an edge share geometry if they have the same 
+        coordinates, as keys of reverse edges can differ between parallel
+        edges of simplified graphs.
+
+        Parameters
+        ----------
+        edges : GeoDataFrame
+            edges indexed by `u`, `v` and `key`, with geometry running from
+            `u` to `v`
+        """
+        keys, geoms = [], []
+        for (u, v, k), geom in zip(edges.index, edges.geometry):
+            if (u, v, k) in self._keys:
+                continue
+
+            # Match reverse direction by coordinates running from lower to 
+            # higher node id, or either way round for self loops
+            coords = tuple(geom.coords)
+            forward = u < v or (u == v and coords <= coords[::-1])
+            match = (min(u, v), max(u, v), coords if forward else coords[::-1])
+            key = self._shared.get(match)
+            if key is None:
+                key = self._shared[match] = (match[0], match[1], len(self._shared))
+                keys.append(key)
+                geoms.append(geom if forward else LineString(match[2]))
+            self._keys[u, v, k] = (key, forward)
+        geoms = gpd.GeoSeries(geoms, crs=edges.crs).to_crs(self.crs)
+        self._projected.update(zip(keys, geoms))
+
+    def polygons(self, edge_keys, costs, iso_bands, edge_buffer=25, edge_costs=None):
+        """
+        Return a polygon for each iso band by buffering the edges whose end
+        nodes are both within the band or, if `edge_costs` are provided, the
+        part of each edge reachable within the band.
+
+        Parameters
+        ----------
+        edge_keys : list of tuple
+            (u, v, key) of edges reached by the search, all previously added
+            with add_edges(). If `edge_costs` are provided then all edges
+            leaving nodes in `costs`, including those to nodes not reached.
+        costs : dict
+            dict keyed by node of cost from the nearest source, as returned
+            by network.multi_source_costs()
+        iso_bands : list
+            band costs to cut from `costs`
+        edge_buffer : int
+            buffer in metres to apply around each edge
+        edge_costs : dict
+            cost to travel each edge in `edge_keys` from `u` to `v`. If
+            provided then edges crossing the band boundary are cut at the
+            point reachable within the band, rather than included or dropped
+            whole, assuming cost is spread evenly along the edge.
+
+        Returns
+        -------
+        polygons : GeoSeries
+            latlong polygons indexed by iso band
+        """
+        bands = sorted(iso_bands)
+        if edge_costs is None:
+            edge_band, partial = self._node_bands(edge_keys, costs, bands)
+        else:
+            edge_band, partial = self._partial_bands(edge_keys, costs, bands, edge_costs)
+
+        # Buffer whole edges not already buffered
+        buffers = self._buffers.setdefault(edge_buffer, {})
+        new = [k for k in edge_band if k not in buffers]
+        if new:
+            geoms = gpd.GeoSeries([self._projected[k] for k in new], crs=self.crs)
+            buffers.update(zip(new, geoms.buffer(edge_buffer)))
+
+        # Build each band from the band inside it
+        band_edges = [[] for _ in bands]
+        for k, band in edge_band.items():
+            band_edges[band].append(buffers[k])
+        for k, band, start, end in partial:
+            line = substring(self._projected[k], start, end, normalized=True)
+            band_edges[band].append(line.buffer(edge_buffer))
+        geoms, inner = {}, []
+        for band, edge_buffers in zip(bands, band_edges):
+            inner = unary_union(inner + edge_buffers)
+            geoms[band] = inner
+            inner = [inner]
+
+        polygons = gpd.GeoSeries([geoms[band] for band in iso_bands],
+                                 index=iso_bands, crs=self.crs)
+
+        return ox.project_gdf(polygons, to_latlong=True)
+
+    def _node_bands(self, edge_keys, costs, bands):
+        """Return smallest band with both end nodes of each edge"""
+        edge_band = {}
+        for u, v, k in edge_keys:
+            band = np.searchsorted(bands, max(costs[u], costs[v]))
+            if band < len(bands):
+                edge_band[self._keys[u, v, k][0]] = band
+        return edge_band, []
+
+    def _partial_bands(self, edge_keys, costs, bands, edge_costs):
+        """
+        Return smallest band each edge is wholly reachable in, and the part
+        of each edge reachable in bands before that.
+        """
+        # Fraction of each edge reachable from each end in each band
+        bands = np.asarray(bands, dtype=float)
+        reach = {}
+        for u, v, k in edge_keys:
+            cost = edge_costs[u, v, k]
+            if cost > 0:
+                fraction = np.clip((bands - costs[u]) / cost, 0, 1)
+            else:
+                fraction = np.where(bands >= costs[u], 1.0, 0.0)
+            key, forward = self._keys[u, v, k]
+            ends = reach.setdefault(key, [np.zeros(len(bands)), np.zeros(len(bands))])
+            end = 0 if forward else 1
+            ends[end] = np.maximum(ends[end], fraction)
+
+        edge_band, partial = {}, []
+        for key, (from_start, from_end) in reach.items():
+            whole = np.flatnonzero(from_start + from_end >= 1)
+            last = whole[0] if len(whole) else len(bands)
+            if last < len(bands):
+                edge_band[key] = last
+            for band in range(last):
+                if from_start[band] > 0:
+                    partial.append((key, band, 0, from_start[band]))
+                if from_end[band] > 0:
+                    partial.append((key, band, 1 - from_end[band], 1))
+        return edge_band, partial
@@ -1,94 +1,630 @@
 """Get network graph"""
 
+import os
+import hashlib
 import osmnx as ox
 import networkx as nx
 
-import requests
 import json
+import multiprocessing
 from shapely.geometry import shape, Point, MultiPoint
+from shapely.ops import unary_union
+import numpy as np
+import pandas as pd
 import geopandas as gpd
+import pyproj
+from scipy.sparse import csr_matrix
+from scipy.spatial import cKDTree
 import matplotlib.pyplot as plt
 
-from . import elevation
+from . import cache, elevation, store
+from . import client as http_client
+from .compact import CompactGraph, COST_FIELDS
+from .index import nearest_stations
+from .isochrone import IsoPolygonBuilder, utm_crs
+
+# OSM walk network tags, as separate filters for OR tag criteria
+WALK_CUSTOM_FILTERS = [
+    # Highways
+    '["area"!~"yes"]["highway"]' + \
+    '["highway"!~"motorway"]' + \
+    '["highway"!~"motorway_junction"]' + \
+    '["highway"!~"traffic_signals"]["highway"!~"give_way"]' + \
+    '["foot"!~"no"]' + \
+    '["sidewalk"!~"no|separate"]["area"!~"yes"]',
+    # Footways
+    '["area"!~"yes"]["footway"]']
+
+# Smallest network for which compact searches are limited to the nodes
+# within reach of the access nodes, rather than searching the whole network
+LOCAL_SEARCH_MIN_NODES = 100000
+
+# WalkNetwork used by iso_bands_batch() worker processes. Set before the pool
+# is created so forked workers share it rather than each task pickling it
+_batch_network = None
 
 class WalkNetwork:
     """Class for walk network"""
     
-    _default_save_path = 'input_data/walk_network_graph.gml.gz'
+    _default_save_path = 'input_data/walk_network_graph'
     
     _G = nx.classes.multidigraph.MultiDiGraph
     _nodes = nx.classes.reportviews.NodeView
     _edges = nx.classes.reportviews.EdgeView
+    _graph_attrs = None
+    _compact = None
+    _search_compact = None
+    _travel_time_index = None
+    _polygon_builder = None
+    _node_tree = None
+    _result_cache = None
+    _fingerprint = None
+    _station_search = None
     
-    def __init__(self, G):
+    def __init__(self, G=None, compact=False, gdfs=None):
+        """
+        Parameters
+        ----------
+        G : networkx.MultiDiGraph
+            walk network graph
+        compact : boolean
+            if True then hold the network as a CompactGraph only, including
+            node and edge attributes, and run network searches on it. The 
+            graph, node and edge GeoDataFrames are recreated from it when 
+            first accessed
+        gdfs : tuple
+            (gdf_nodes, gdf_edges, graph_attrs) to use instead of `G`, as 
+            from store.load_gdfs(), with the graph only created from them 
+            when first accessed
+        """
+        # Repeated iso_bands() calls, e.g. for plots, are read from cache
+        self._result_cache = cache.ResultCache()
+        
+        if gdfs is not None:
+            self._G = None
+            self._nodes, self._edges, self._graph_attrs = gdfs
+            if compact:
+                self._compact = CompactGraph.from_gdfs(self._nodes, self._edges, attrs=True)
+                self._nodes, self._edges = None, None
+            return
+        
         assert type(G) == nx.classes.multidigraph.MultiDiGraph
-        self._G = G
-        self._nodes, self._edges = ox.graph_to_gdfs(G)
+        self._graph_attrs = G.graph
+        if compact:
+            self._G = None
+            self._compact = CompactGraph.from_graph(G, attrs=True)
+        else:
+            self._G = G
+        
+        # Node and edge GeoDataFrames are only created when first accessed,
+        # as creating geometry for every node and edge is slow for large 
+        # networks and not needed for iso_bands()
+        self._nodes, self._edges = None, None
     
     @staticmethod
-    def load_graph(path=_default_save_path, **kwargs):
-        """Read graph from pickle `path` and return as new WalkNetwork.
+    def load_graph(path=_default_save_path, compact=False, mmap_mode='r', **kwargs):
+        """Read graph from `path` and return as new WalkNetwork.
+        
+        Folders saved with save_graph() are loaded straight into the node
+        and edge GeoDataFrames, and the networkx graph only created when
+        first needed. Files are read as pickles, decompressed if ending 
+        with .gz or .bz2, e.g. `walk_network_graph_2_elevation.gpickle.gz`.
 
         Parameters
         ----------
         path : filename or filehandle
-            The filename or filehandle to read from.
+            The folder, filename or filehandle to read from.
+        compact : boolean
+            if True then use CompactGraph for network searches.
+        mmap_mode : str
+            numpy memory-map mode for folder columns, default 'r'. 
         """
-        G = nx.read_gpickle(path, **kwargs)
-        return WalkNetwork(G)
+        if isinstance(path, (str, os.PathLike)) and store.is_gdfs_folder(path):
+            return WalkNetwork(compact=compact, 
+                               gdfs=store.load_gdfs(path, mmap_mode=mmap_mode))
+        G = store.read_pickle(path, **kwargs)
+        return WalkNetwork(G, compact=compact)
     
     def save_graph(self, path=_default_save_path, **kwargs):
-        """Write the WalkNetwork graph to `path` using pickle.
+        """Write the WalkNetwork graph to folder `path`, one file per node and
+        edge column, see store.save_gdfs(). Filehandles and paths ending 
+        with .gpickle, .pickle, .pkl, .gz or .bz2 are written using pickle 
+        instead.
 
         Parameters
         ----------
         path : filename or filehandle
-            The filename or filehandle to write. Files whose names end with .gz or
-            .bz2 will be compressed.
+            The folder, filename or filehandle to write. Files whose names 
+            end with .gz or .bz2 will be compressed.
 
         """
-        nx.write_gpickle(self._G, path, **kwargs)
+        if store.is_pickle_path(path):
+            store.write_pickle(self.graph, path, **kwargs)
+        else:
+            graph_attrs = self._G.graph if self._G is not None else self._graph_attrs
+            store.save_gdfs(path, self.nodes, self.edges, graph_attrs)
         
     @property
     def graph(self):
+        if self._G is None:
+            if self._compact is not None:
+                self._G = self._compact.to_graph(self._graph_attrs)
+            else:
+                self._G = ox.graph_from_gdfs(self._nodes, self._edges, 
+                                             graph_attrs=self._graph_attrs)
         return self._G
     
     @property
     def nodes(self):
+        self._materialise_gdfs()
         return self._nodes
     
     @property
     def edges(self):
+        self._materialise_gdfs()
         return self._edges
     
     @property
     def edge_slope(self):
-        return self._edges['grade']
+        return self.edges['grade']
+    
+    def _materialise_gdfs(self):
+        """Create node and edge GeoDataFrames from graph if not yet held"""
+        if self._nodes is None or self._edges is None:
+            if self._compact is not None:
+                self._nodes, self._edges = self._compact.to_gdfs(self._crs())
+            else:
+                self._nodes, self._edges = ox.graph_to_gdfs(self._G)
+    
+    def graph_changed(self):
+        """
+        Drop everything created from the graph, e.g. node and edge 
+        GeoDataFrames, so it is recreated when next needed. Call after 
+        changing `graph` directly, such as adding or removing edges or 
+        setting attributes without set_edge_attributes().
+        """
+        # Create graph first if loaded from GeoDataFrames, as it is the 
+        # source for everything else from now on
+        G = self.graph
+        self._nodes, self._edges = None, None
+        if self._compact is not None:
+            self._compact = CompactGraph.from_graph(G, attrs=True)
+        self._search_compact = None
+        self._travel_time_index = None
+        self._polygon_builder = None
+        self._node_tree = None
+        self._fingerprint = None
     
     def add_edge_speed(self):
         """
         Add walk speed to graph based on elevations using 
         gradient_adjusted_walk_speed() method
         """
-        # Calculate walk speeds
-        gradients = self._edges['grade']
-        speeds = elevation.gradient_adjusted_walk_speed(gradients*100, max_speed=1.5, unit='m/s')
-        self._edges['speed'] = speeds
+        edges = self._edge_columns(['grade', 'length'])
+        self.set_edge_attributes(self._walk_speeds(edges['grade'], edges['length']))
+    
+    def add_edge_grades(self, precision=3):
+        """
+        Add edge `grade` and `grade_abs` calculated from node elevations, 
+        and walk `speed` and `walk_mins` from grade, in a single vectorised 
+        pass written to the graph and edge GeoDataFrame together. Replaces 
+        ox.add_edge_grades() followed by add_edge_speed().
+        
+        Parameters
+        ----------
+        precision : int
+            decimal precision to round grades to, default 3
+        """
+        if self._nodes is not None:
+            node_ids, elevations = self._nodes.index.values, self._nodes['elevation'].values
+        elif self._compact is not None:
+            node_ids = self._compact.node_ids
+            elevations = self._compact.node_attrs.get('elevation', [np.nan] * len(node_ids))
+        else:
+            nodes = list(self._G.nodes(data='elevation', default=np.nan))
+            node_ids, elevations = [n for n, _ in nodes], [e for _, e in nodes]
+        edges = self._edge_columns(['length'])
+        grades = elevation.edge_grades(node_ids, np.array(elevations, dtype=np.float64),
+                                       edges.index.get_level_values(0).values,
+                                       edges.index.get_level_values(1).values,
+                                       edges['length'].values, precision=precision)
+        grades = pd.Series(grades, index=edges.index)
+        
+        values = self._walk_speeds(grades, edges['length'])
+        values.insert(0, 'grade', grades)
+        values.insert(1, 'grade_abs', grades.abs())
+        self.set_edge_attributes(values)
+    
+    def _edge_columns(self, names):
+        """
+        Return DataFrame of edge attributes indexed by `u`, `v` and `key`, 
+        from the edge GeoDataFrame if already held, otherwise read straight
+        from the CompactGraph or graph rather than creating edge geometries 
+        """
+        if self._edges is not None:
+            return self._edges.reindex(columns=names)
+        if self._compact is not None:
+            compact = self._compact
+            row = np.repeat(compact.node_ids, np.diff(compact.indptr))
+            index = pd.MultiIndex.from_arrays([row, compact.node_ids[compact.indices],
+                                               compact.key.astype(np.int64)])
+            return pd.DataFrame({name: compact.edge_values(name).astype(np.float64) 
+                                 for name in names}, index=index, columns=names)
+        u, v, key, values = [], [], [], {name: [] for name in names}
+        for edge_u, edge_v, edge_key, data in self._G.edges(keys=True, data=True):
+            u.append(edge_u)
+            v.append(edge_v)
+            key.append(edge_key)
+            for name in names:
+                values[name].append(data.get(name, np.nan))
+        return pd.DataFrame(values, index=pd.MultiIndex.from_arrays([u, v, key]), 
+                            dtype=np.float64)
+    
+    @staticmethod
+    def _walk_speeds(grade, length):
+        """Return DataFrame of walk `speed` and `walk_mins` for each edge"""
+        speeds = elevation.gradient_adjusted_walk_speed(grade*100, max_speed=1.5, unit='m/s')
+        walk_mins = (length / speeds) / 60.0
+        return pd.DataFrame({'speed': speeds, 'walk_mins': walk_mins})
+    
+    def set_edge_attributes(self, values):
+        """
+        Write edge attributes in place to the graph and the edge 
+        GeoDataFrame (if created), and the CompactGraph (if used).
+        
+        Parameters
+        ----------
+        values : DataFrame
+            one column per edge attribute, indexed by `u`, `v` and `key` the 
+            same as `edges`. Null values remove the attribute from the graph 
+            edge, the same as ox.graph_from_gdfs()
+        """
+        u = values.index.get_level_values(0)
+        v = values.index.get_level_values(1)
+        key = values.index.get_level_values(2)
+        
+        # Cached iso_bands() results are no longer valid
+        self._fingerprint = None
+        
+        # Graph adjacency dicts, bypassing networkx views for speed. If the
+        # graph is not yet created it is later created from `edges` or the 
+        # CompactGraph
+        adj = self._G._adj if self._G is not None else None
+        
+        for name, column in values.items():
+            
+            # Graph edge attribute dicts
+            if adj is not None:
+                for edge_u, edge_v, edge_key, value, null in zip(u, v, key, 
+                                                                 column.tolist(), 
+                                                                 column.isnull().tolist()):
+                    if null:
+                        adj[edge_u][edge_v][edge_key].pop(name, None)
+                    else:
+                        adj[edge_u][edge_v][edge_key][name] = value
+            
+            # Edge GeoDataFrame
+            if self._edges is not None:
+                if values.index.equals(self._edges.index):
+                    self._edges[name] = column.values
+                else:
+                    self._edges.loc[values.index, name] = column.values
+            
+            # CompactGraph cost or attribute columns, only costs for the
+            # CompactGraph held by as_compact() of a network not compact
+            compact = self._compact if self._compact is not None else self._search_compact
+            if compact is not None and name in COST_FIELDS:
+                compact.set_costs(name, u, v, key, column.values)
+            elif self._compact is not None:
+                self._compact.set_attrs(name, u, v, key, column.values)
+            
+            # TravelTimeIndex is no longer valid if its cost changes
+            if self._travel_time_index is not None and name == self._travel_time_index.cost:
+                self._travel_time_index = None
+       
+    def nearest_nodes(self, access_points, return_dist=False):
+        """
+        Return nearest graph node to each access point, from a single query
+        of a KD-tree of projected node coordinates built on first use.
+        
+        Parameters
+        ----------
+        access_points : list
+            the (lat, lng), [(lat, lng), (lat, lng), etc] points to snap, or
+            (y, x) if the graph is projected
+        return_dist : boolean
+            if True also return distance in metres from each access point to
+            its nearest node, e.g. to flag entrances snapped far away
+            
+        Returns
+        -------
+        access_nodes : list
+            or tuple of (access_nodes, dists) if `return_dist` is True
+        """
+        if self._node_tree is None:
+            self._build_node_tree()
+        tree, node_ids, to_projected = self._node_tree
+
+        # NB: Need to reverse lat/lon
+        points = np.asarray(access_points, dtype=np.float64).reshape(-1, 2)
+        x, y = to_projected.transform(points[:, 1], points[:, 0])
+        dists, index = tree.query(np.column_stack([x, y]))
+        access_nodes = node_ids[index].tolist()
+
+        if return_dist:
+            return access_nodes, dists.tolist()
+        return access_nodes
+
+    def _build_node_tree(self):
+        """Build KD-tree of node coordinates projected to metres"""
+        node_ids, x, y = self._node_arrays()
+        to_projected = pyproj.Transformer.from_crs(self._crs(), 
+                                                   self._projected_crs(),
+                                                   always_xy=True)
+        x, y = to_projected.transform(x, y)
+        self._node_tree = (cKDTree(np.column_stack([x, y])), node_ids, to_projected)
+
+    def _node_arrays(self):
+        """Return node ids, x and y as arrays from the fastest source held"""
+        if self._compact is not None:
+            return self._compact.node_ids, self._compact.x, self._compact.y
+        if self._nodes is not None:
+            return self._nodes.index.values, self._nodes['x'].values, self._nodes['y'].values
+        node_ids, x, y = [], [], []
+        for node, data in self._G.nodes(data=True):
+            node_ids.append(node)
+            x.append(data['x'])
+            y.append(data['y'])
+        return np.asarray(node_ids), np.asarray(x), np.asarray(y)
+
+    def _crs(self):
+        """Return graph crs"""
+        return self._G.graph['crs'] if self._G is not None else self._graph_attrs['crs']
+
+    def _projected_crs(self):
+        """Return graph crs if projected, otherwise UTM zone of the nodes"""
+        if ox.projection.is_projected(self._crs()):
+            return self._crs()
+        return utm_crs(np.mean(self._node_arrays()[1]))
+    
+    def as_compact(self):
+        """
+        Return CompactGraph for the network, the one used for searches if
+        created with compact=True, otherwise one of the edge costs created
+        on first call and kept in step by set_edge_attributes() and 
+        edit_edges() until graph_changed().
+        """
+        if self._compact is not None:
+            return self._compact
+        if self._search_compact is None:
+            if self._G is None:
+                self._search_compact = CompactGraph.from_gdfs(self._nodes, self._edges)
+            else:
+                self._search_compact = CompactGraph.from_graph(self._G)
+        return self._search_compact
+    
+    def set_travel_time_index(self, index):
+        """
+        Use precomputed TravelTimeIndex for iso_bands() of indexed stations,
+        instead of searching the graph. Pass None to stop using the index.
+        
+        Parameters
+        ----------
+        index : TravelTimeIndex
+            index built for this network with TravelTimeIndex.build()
+        """
+        if index is not None and len(index.node_ids) != len(self._node_arrays()[0]):
+            raise ValueError("TravelTimeIndex was not built for this network")
+        self._travel_time_index = index
+    
+    def set_result_cache(self, result_cache):
+        """
+        Use `result_cache` for iso_bands() results, e.g. one with a 
+        `spill_folder` shared by several networks. Pass None to stop caching.
+        
+        Parameters
+        ----------
+        result_cache : cache.ResultCache
+        """
+        self._result_cache = result_cache
+    
+    def fingerprint(self, cost=None):
+        """
+        Return content hash of the network nodes and edge costs, used to key
+        cached results. Recalculated after set_edge_attributes() (e.g. from
+        add_edge_speed()) or graph_changed().
+        
+        Parameters
+        ----------
+        cost : str
+            edge field searched on, hashed as well as COST_FIELDS if it is a
+            custom cost, e.g. 'walk_cost'. Default None for COST_FIELDS only
+        """
+        if self._fingerprint is None:
+            self._fingerprint = {}
+        names = [name for name in COST_FIELDS 
+                 if self._edges is None or name in self._edges]
+        if cost is not None and cost not in names:
+            names.append(cost)
+        key = tuple(names)
+        if key not in self._fingerprint:
+            node_ids, x, y = self._node_arrays()
+            edges = self._edge_columns(names).dropna(axis=1, how='all')
+            digest = hashlib.sha1()
+            digest.update(np.ascontiguousarray(node_ids, dtype=np.int64).tobytes())
+            digest.update(np.ascontiguousarray(np.column_stack([x, y]), dtype=np.float64).tobytes())
+            digest.update(repr(sorted(edges.columns)).encode())
+            digest.update(pd.util.hash_pandas_object(edges[sorted(edges.columns)]).values.tobytes())
+            self._fingerprint[key] = digest.hexdigest()
+        return self._fingerprint[key]
+    
+    def edit_edges(self, add=None, remove=None, costs=None, **kwargs):
+        """
+        Add, remove or change the cost of edges and return iso bands for 
+        only the stations whose catchments are touched by the edits.
+
+        The TravelTimeIndex set with set_travel_time_index() is repaired 
+        rather than rebuilt, searching again only from stations that reach
+        an edited edge, and only the nodes whose cost can change.
+
+        Parameters
+        ----------
+        add : list of tuple
+            (u, v, data) for each edge to add between existing nodes, with
+            `data` a dict of edge attributes including the index cost, e.g.
+            `walk_mins`. Add both directions for a two way edge
+        remove : list of tuple
+            (u, v, key) of each edge to remove
+        costs : DataFrame
+            edge attributes to set, indexed by `u`, `v` and `key`, as for
+            set_edge_attributes()
+        **kwargs
+            passed to iso_bands(), e.g. `iso_bands` which should be no 
+            larger than the index `max_band`. `iso_band_cost` is the index
+            cost
+
+        Returns
+        -------
+        GeoDataFrame
+            iso_bands_gpd for stations whose costs changed or that reach an
+            edited edge, empty if none
+        """
+        index = self._travel_time_index
+        if index is None:
+            raise ValueError("edit_edges() needs a TravelTimeIndex, see set_travel_time_index()")
+        iso_band_cost = kwargs.pop('iso_band_cost', index.cost)
+        if iso_band_cost != index.cost:
+            raise ValueError("iso_band_cost {} is not the TravelTimeIndex cost {}".format(
+                iso_band_cost, index.cost))
+        add, remove = list(add or []), list(remove or [])
+
+        # Edit the CompactGraph searched, or the one held by as_compact() 
+        # if the network is not compact, which set_edge_attributes() also 
+        # keeps in step
+        compact = self.as_compact()
+        old_matrix = compact.matrix(index.cost)
+
+        edited = [(u, v, k) for u, v, k in remove]
+        if costs is not None:
+            edited += list(costs.index)
+            self.set_edge_attributes(costs)
+
+        if add or remove:
+            # A network not compact loaded from GeoDataFrames has no other
+            # copy of its edges, so create its graph to edit
+            if self._compact is None:
+                self.graph
+
+            # Edges are found and keyed on the CompactGraph, so a compact 
+            # network's graph is not created, and edited too only if held
+            remove = [edge for edge in remove if _has_edge(compact, *edge)]
+            keys = {}
+            for u, v, k in remove:
+                keys.setdefault((u, v), set(_edge_keys(compact, u, v))).discard(k)
+            added = []
+            for u, v, data in add:
+                if not _has_node(compact, u) or not _has_node(compact, v):
+                    raise KeyError("Nodes not in graph: {}".format([u, v]))
+                held = keys.setdefault((u, v), set(_edge_keys(compact, u, v)))
+                # Lowest unused key from the number of edges, as networkx
+                k = len(held)
+                while k in held:
+                    k += 1
+                held.add(k)
+                added.append((u, v, k, data))
+            if self._G is not None:
+                self._G.remove_edges_from(remove)
+                self._G.add_edges_from(added)
+            edited += [(u, v, k) for u, v, k, _ in added]
+            compact.edit_edges(remove, added)
+
+            # Nodes are unchanged, so keep node KD-tree, CompactGraph and 
+            # edge polygons not edited, recreating only the edge GeoDataFrame
+            self._edges = None
+            self._fingerprint = None
+            if self._polygon_builder is not None:
+                self._polygon_builder.discard(edited)
+
+        u = [edge[0] for edge in edited]
+        v = [edge[1] for edge in edited]
+        stations = set(index.update(compact, old_matrix, u, v))
+        stations.update(index.reaching(u + v))
+        self._travel_time_index = index
+
+        stations_df = index.stations().iloc[sorted(stations)]
+        return self.iso_bands_batch(stations_df, processes=1, 
+                                    iso_band_cost=index.cost, **kwargs)
+    
+    def access_costs(self, access_nodes, max_cost, cost='walk_mins'):
+        """
+        Return lowest network cost from any access node to each node within
+        `max_cost`, using the TravelTimeIndex if it holds the access nodes, 
+        otherwise a single multi-source search.
         
-        walk_mins = (self._edges['length'] / self._edges['speed']) / 60.0
-        self._edges['walk_mins'] = walk_mins
+        Parameters
+        ----------
+        access_nodes : list
+            nodes to search from
+        max_cost : decimal
+            stop searching beyond this cost, normally the largest iso band
+        cost : str
+            graph edge field to use for network cost
+            
+        Returns
+        -------
+        costs : dict
+            dict keyed by node of cost from the nearest access node
+        """
+        if self._travel_time_index is not None:
+            costs = self._travel_time_index.lookup(access_nodes, max_cost, cost)
+            if costs is not None:
+                return costs
         
-        # Calculate walk speeds
-        G = ox.graph_from_gdfs(self._nodes, self._edges)
-        self.__init__(G)
+        if self._compact is None:
+            return multi_source_costs(self.graph, access_nodes, 
+                                      cutoff=max_cost, 
+                                      weight=cost)
+        return self._compact.multi_source_costs(access_nodes, 
+                                                cutoff=max_cost, 
+                                                weight=cost,
+                                                nodes=self._local_nodes(access_nodes, 
+                                                                        max_cost, cost))
+    
+    def _local_nodes(self, access_nodes, max_cost, cost):
+        """
+        Return CompactGraph index of nodes within straight line reach of 
+        the access nodes for `max_cost`, from the node KD-tree, or None if 
+        a search may reach most of the network anyway.
+        """
+        # Whole network searches are already fast for small networks
+        if self._compact.number_of_nodes < LOCAL_SEARCH_MIN_NODES:
+            return None
+        speed = self._compact.max_speed(cost)
+        if not np.isfinite(speed) or len(access_nodes) == 0:
+            return None
+        if self._node_tree is None:
+            self._build_node_tree()
+        tree = self._node_tree[0]
         
+        # Tree is built from CompactGraph node arrays so shares its index. 
+        # Radius allows for projected distances being slightly longer than
+        # edge lengths away from the UTM central meridian
+        index = self._compact.index_of(access_nodes)
+        radius = max_cost * speed * 1.01
+        nodes = tree.query_ball_point(tree.data[np.unique(index)], radius)
+        nodes = np.unique(np.concatenate([np.asarray(n, dtype=np.int32) for n in nodes]))
+        if len(nodes) * 50 > self._compact.number_of_nodes:
+            return None
+        return nodes
        
     def iso_bands(self,
                  access_points,
                  location_name = "",
                  iso_bands = [5, 10],
                  iso_band_cost = 'walk_mins',
-                 iso_edge_buffer = 25
+                 iso_edge_buffer = 25,
+                 iso_partial_edges = False,
+                 iso_band_graphs = True
                  ):
         """
         Calculate and return iso_bands
@@ -106,7 +642,17 @@ class WalkNetwork:
             could use 'distance' or other graph field
         iso_edge_buffer : int
             Buffer to apply around edges for plotting
-            
+        iso_partial_edges : bool
+            Default False to include only edges with both end nodes within
+            the band. If True edges crossing the band boundary are cut at the
+            point reachable within the band, so bands follow the network
+            closely on simplified graphs with few nodes
+        iso_band_graphs : bool
+            Default True to return a subgraph copy for each band in
+            `iso_band_graph`. If False return only a sorted array of the node
+            ids reached in `iso_band_nodes`, much smaller for large batches,
+            with the subgraph created when needed with iso_band_graph()
+
         Returns
         -------
         GeoDataFrame
@@ -119,48 +665,461 @@ class WalkNetwork:
         # Ensure centre_point is a list to prevent errors
         access_points = [access_points] if type(access_points) is tuple else access_points
 
-        # Get nearest node to each access point. NB: Need to reverse lat/lon            
-        access_nodes = []
-        for ap in access_points:
-            access_nodes.append(ox.nearest_nodes(self._G, *ap[::-1]))
+        # Get nearest node to each access point
+        access_nodes, snap_dists = self.nearest_nodes(access_points, return_dist=True)
 
         # Loop through bands from high to low
-        iso_bands.sort(reverse=True)
+        iso_bands = sorted(iso_bands, reverse=True)
+
+        # Reuse result for the same access nodes if already calculated
+        if self._result_cache is not None:
+            key = (self.fingerprint(iso_band_cost), tuple(sorted(set(access_nodes))), tuple(iso_bands),
+                   iso_band_cost, iso_edge_buffer, iso_partial_edges, iso_band_graphs)
+            iso_bands_gpd = self._result_cache.get(key)
+            if iso_bands_gpd is not None:
+                iso_bands_gpd = _copy_iso_bands(iso_bands_gpd)
+                for column, value in [('location_name', location_name),
+                                      ('access_points', access_points),
+                                      ('access_nodes', access_nodes),
+                                      ('access_snap_dists', snap_dists)]:
+                    iso_bands_gpd[column] = [value] * len(iso_bands_gpd)
+                return iso_bands_gpd
+
+        # Single search from all access nodes out to the largest band, with
+        # each smaller band cut from the same cost map
+        costs = self.access_costs(access_nodes, iso_bands[0], iso_band_cost)
+        polygons = self._iso_band_polygons(costs, iso_bands, iso_edge_buffer,
+                                           iso_band_cost if iso_partial_edges else None)
+
+        # Node ids reached, sorted so each band is a slice of the array
+        nodes = np.fromiter(costs.keys(), dtype=np.int64, count=len(costs))
+        node_costs = np.fromiter(costs.values(), dtype=np.float64, count=len(costs))
+        order = np.lexsort((nodes, node_costs))
 
         iso_group = []
         for iso_band in iso_bands:
+            band_nodes = np.sort(nodes[order[:np.searchsorted(node_costs[order], iso_band, 'right')]])
+            row = {'location_name': location_name,
+                   'access_points': access_points,
+                   'access_nodes': access_nodes,
+                   'access_snap_dists': snap_dists,
+                   'iso_band_mins': iso_band}
+            if iso_band_graphs:
+                row['iso_band_graph'] = self._subgraph(band_nodes, copy=True)
+            else:
+                row['iso_band_nodes'] = band_nodes
+            row['geometry'] = polygons[iso_band]
+            iso_group.append(row)
 
-            # Calculate subgraphs for each access node and return single subgraph
-            # with all nodes/edges traversed 
-            subgraphs = []
-            for access_node in access_nodes:
-                subgraphs.append(nx.ego_graph(self._G, 
-                                              access_node, 
-                                              radius = iso_band, 
-                                              distance = iso_band_cost))
-            subgraph = nx.compose_all(subgraphs)
-
-            # Get gdf with edges and buffer, but first having changed to projected 
-            # coordinates and then back to default to ensure correct dist results
-            edges = ox.graph_to_gdfs(subgraph, nodes=False)
-            buffer = ox.project_gdf(edges).buffer(iso_edge_buffer)
-            buffer = ox.project_gdf(buffer, to_latlong=True)
-
-            iso_group.append({'location_name': location_name,
-                              'access_points': access_points,
-                              'access_nodes': access_nodes,
-                              'iso_band_mins': iso_band,
-                              'iso_band_graph': subgraph,
-                              'geometry': buffer.unary_union})
-
-        iso_bands_gpd = gpd.GeoDataFrame(iso_group, crs=buffer.crs)
+        iso_bands_gpd = gpd.GeoDataFrame(iso_group, crs=polygons.crs)
+        if self._result_cache is not None:
+            self._result_cache.put(key, _copy_iso_bands(iso_bands_gpd))
 
         return iso_bands_gpd
 
+    def iso_band_graph(self, iso_band):
+        """
+        Return subgraph of nodes reached for an iso_bands() row, created from
+        `iso_band_nodes` if the row does not hold `iso_band_graph`.
+        
+        Parameters
+        ----------
+        iso_band : Series
+            row of iso_bands_gpd
+            
+        Returns
+        -------
+        networkx.MultiDiGraph
+            read only subgraph view of `graph`, a subgraph created from the
+            CompactGraph if the graph is not held, or the row's own subgraph
+        """
+        if 'iso_band_graph' in iso_band:
+            return iso_band['iso_band_graph']
+        return self._subgraph(iso_band['iso_band_nodes'])
+
+    def _subgraph(self, nodes, copy=False):
+        """
+        Return subgraph of node ids `nodes`, created from the CompactGraph
+        if the graph is not held so a compact network's graph is not 
+        created. If `copy` a graph view is copied.
+        """
+        if self._G is None and self._compact is not None:
+            return self._compact.to_graph(self._graph_attrs, 
+                                          nodes=self._compact.index_of(nodes))
+        G = self.graph.subgraph(np.asarray(nodes).tolist())
+        return G.copy() if copy else G
+
+    def _iso_band_polygons(self, costs, iso_bands, edge_buffer, partial_cost=None):
+        """
+        Return polygon for each iso band from edges reached, using an 
+        IsoPolygonBuilder held for the network so each edge is only 
+        projected and buffered once. If `partial_cost` is given, edges
+        crossing the band boundary are cut using that edge cost field.
+        """
+        if self._polygon_builder is None:
+            self._polygon_builder = IsoPolygonBuilder(self._projected_crs())
+        
+        if self._compact is not None:
+            return self._compact_iso_band_polygons(costs, iso_bands, edge_buffer, partial_cost)
+        
+        # Add geometry for edges not yet held by builder
+        edge_costs = None
+        if partial_cost is None:
+            edge_keys = list(self.graph.subgraph(costs).edges(keys=True))
+        else:
+            # All edges leaving reached nodes, including to nodes not reached
+            edge_costs = {(u, v, k): d.get(partial_cost, 1) for u, v, k, d
+                          in self.graph.out_edges(costs, keys=True, data=True)}
+            edge_keys = list(edge_costs)
+        missing = self._polygon_builder.missing(edge_keys)
+        if missing:
+            if self._edges is None:
+                edges = ox.graph_to_gdfs(self.graph.edge_subgraph(missing), nodes=False)
+            else:
+                edges = self._edges.loc[missing, ['geometry']]
+            self._polygon_builder.add_edges(edges)
+        
+        return self._polygon_builder.polygons(edge_keys, costs, iso_bands, edge_buffer,
+                                              edge_costs=edge_costs)
+
+    def _compact_iso_band_polygons(self, costs, iso_bands, edge_buffer, partial_cost=None):
+        """
+        Return polygon for each iso band as _iso_band_polygons(), reading
+        edges reached and their geometry from the CompactGraph arrays 
+        rather than the graph.
+        """
+        compact = self._compact
+        reached = compact.index_of(np.fromiter(costs.keys(), dtype=np.int64, count=len(costs)))
+        positions = compact.out_edge_positions(reached)
+        if partial_cost is None:
+            # Only edges between reached nodes
+            inside = np.zeros(compact.number_of_nodes, dtype=bool)
+            inside[reached] = True
+            positions = positions[inside[compact.indices[positions]]]
+        row = np.searchsorted(compact.indptr, positions, side='right') - 1
+        edge_keys = list(zip(compact.node_ids[row].tolist(),
+                             compact.node_ids[compact.indices[positions]].tolist(),
+                             compact.edge_key[compact.edge_ref[positions] >> 1].tolist()))
+        
+        edge_costs = None
+        if partial_cost is not None:
+            # All edges leaving reached nodes, including to nodes not reached
+            values = compact.edge_values(partial_cost, positions).astype(np.float64)
+            edge_costs = dict(zip(edge_keys, np.where(np.isnan(values), 1, values).tolist()))
+        
+        # Add geometry for edges not yet held by builder
+        missing = set(self._polygon_builder.missing(edge_keys))
+        if missing:
+            new = np.array([edge in missing for edge in edge_keys])
+            index = pd.MultiIndex.from_tuples([edge for edge in edge_keys if edge in missing],
+                                              names=['u', 'v', 'key'])
+            edges = gpd.GeoDataFrame(geometry=gpd.GeoSeries(
+                compact.edge_geometries(positions[new]), index=index), crs=self._crs())
+            self._polygon_builder.add_edges(edges)
+        
+        return self._polygon_builder.polygons(edge_keys, costs, iso_bands, edge_buffer,
+                                              edge_costs=edge_costs)
+
+    def iso_bands_batch(self,
+                        stations_df,
+                        processes=None,
+                        chunksize=1,
+                        **kwargs):
+        """
+        Calculate iso_bands for many stations using a pool of worker 
+        processes. Results are returned in `stations_df` order, so are the 
+        same regardless of the number of processes.
+        
+        Parameters
+        ----------
+        stations_df : DataFrame
+            one row per station with `location_name` and `access_points` 
+            columns, see catchment.group_access_points()
+        processes : int
+            number of worker processes, default os.cpu_count(). If 1 then 
+            run in this process
+        chunksize : int
+            number of stations sent to a worker process at a time
+        **kwargs
+            passed to iso_bands()
+            
+        Returns
+        -------
+        GeoDataFrame
+            combined iso_bands_gpd for all stations
+        """
+        results = list(self.iso_bands_iter(stations_df, processes, chunksize, **kwargs))
+        if len(results) == 0:
+            return gpd.GeoDataFrame()
+
+        iso_bands_gpd = gpd.GeoDataFrame(pd.concat(results, ignore_index=True),
+                                         crs=results[0].crs)
+        
+        return iso_bands_gpd
+
+    def iso_bands_iter(self,
+                       stations_df,
+                       processes=None,
+                       chunksize=1,
+                       **kwargs):
+        """
+        Generate iso_bands for each station in `stations_df` order as each
+        finishes, so results can be written out without holding them all.
+        Parameters are the same as iso_bands_batch().
+        
+        Yields
+        ------
+        GeoDataFrame
+            iso_bands_gpd for a single station
+        """
+        global _batch_network
+        
+        tasks = [(access_points, location_name, kwargs) for location_name, access_points 
+                 in zip(stations_df['location_name'], stations_df['access_points'])]
+        if len(tasks) == 0:
+            return
+
+        # Build search matrix before forking so workers share it
+        if self._compact is not None:
+            self._compact.matrix(kwargs.get('iso_band_cost', 'walk_mins'))
+        if self._result_cache is not None:
+            self.fingerprint(kwargs.get('iso_band_cost', 'walk_mins'))
+
+        if processes == 1:
+            for ap, name, kw in tasks:
+                yield self.iso_bands(ap, name, **kw)
+            return
+
+        # Forked workers inherit the network, otherwise (e.g. on Windows)
+        # it is pickled once per worker rather than once per task
+        if 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')
+            initializer, initargs = None, ()
+            _batch_network = self
+        else:
+            context = multiprocessing.get_context()
+            initializer, initargs = _init_batch_worker, (self,)
+        try:
+            with context.Pool(processes, initializer, initargs) as pool:
+                yield from pool.imap(_batch_iso_bands, tasks, chunksize)
+        finally:
+            _batch_network = None
+
+    def iso_bands_to_folder(self,
+                            stations_df,
+                            path,
+                            driver='FlatGeobuf',
+                            processes=None,
+                            chunksize=1,
+                            **kwargs):
+        """
+        Calculate iso_bands for many stations, writing each station's bands
+        to its own file in folder `path` as it finishes, so only one 
+        station's result is held at a time. Stations already written, e.g. 
+        by an interrupted run with the same `stations_df`, are skipped. Read
+        the result with store.load_parts().
+        
+        Parameters
+        ----------
+        stations_df : DataFrame
+            one row per station with `location_name` and `access_points` 
+            columns, see catchment.group_access_points()
+        path : string or pathlib.Path
+            folder to write to, created if it does not exist
+        driver : str
+            'FlatGeobuf' (default), 'GPKG' or 'Parquet' (needs pyarrow)
+        processes : int
+            number of worker processes, see iso_bands_batch()
+        chunksize : int
+            number of stations sent to a worker process at a time
+        **kwargs
+            passed to iso_bands()
+            
+        Returns
+        -------
+        written : int
+            number of stations written, excluding those skipped
+        """
+        names = store.part_names(stations_df['location_name'], stations_df['access_points'])
+        todo = [not store.has_part(path, name, driver) for name in names]
+        kwargs['iso_band_graphs'] = False
+        
+        written = 0
+        for name, iso_bands_gpd in zip([n for n, t in zip(names, todo) if t],
+                                       self.iso_bands_iter(stations_df[todo], processes,
+                                                           chunksize, **kwargs)):
+            store.save_part(path, name, iso_bands_gpd.drop(columns='iso_band_nodes'), driver)
+            written += 1
+        
+        return written
+
  
+    def coverage(self,
+                 stations_df,
+                 iso_band=10,
+                 iso_band_cost='walk_mins',
+                 node_weights=None):
+        """
+        Return street length (and optionally node weight, e.g. population) 
+        covered by each station's iso band, by no other station, and by 
+        any number of stations, in one pass over the undirected edge table 
+        rather than composing subgraphs.
+        
+        Street length matches graph_street_length() of the iso band graph,
+        i.e. each edge with both end nodes in the band is counted once for
+        both directions.
+        
+        Parameters
+        ----------
+        stations_df : DataFrame
+            one row per station with `location_name` and `access_points` 
+            columns, see catchment.group_access_points()
+        iso_band : decimal
+            band to measure coverage within, default 10
+        iso_band_cost : str
+            graph edge field to use for network cost, default 'walk_mins'
+        node_weights : Series
+            optional weight for each node indexed by node id, e.g. 
+            population assigned to nearest nodes. Missing nodes weigh 0
+            
+        Returns
+        -------
+        station_coverage : DataFrame
+            one row per station with `location_name`, `street_length` and
+            `unique_length` (not covered by any other station), plus 
+            `weight` and `unique_weight` if `node_weights` are given
+        overlap : DataFrame
+            `street_length` (and `weight`) indexed by the number of stations
+            covering it. The column sum is the total covered by any station
+        """
+        compact = self.as_compact()
+        
+        # Station by node matrix of nodes reached within band
+        rows, cols = [], []
+        for station, access_points in enumerate(stations_df['access_points']):
+            access_points = [access_points] if type(access_points) is tuple else access_points
+            costs = self.access_costs(self.nearest_nodes(access_points), iso_band, iso_band_cost)
+            nodes = compact.index_of(list(costs))
+            rows.append(np.full(len(nodes), station, dtype=np.int32))
+            cols.append(nodes)
+        n = len(stations_df)
+        reached = csr_matrix((np.ones(sum(len(c) for c in cols), dtype=np.int8),
+                              (np.concatenate(rows) if rows else [], 
+                               np.concatenate(cols) if cols else [])),
+                             shape=(n, compact.number_of_nodes)).tocsc()
+        
+        # Edges covered by a station have both end nodes reached
+        covered = reached[:, compact.edge_u].multiply(reached[:, compact.edge_v]).tocsr()
+        edge_count = np.asarray(covered.sum(axis=0)).ravel()
+        if 'length' in compact.costs:
+            length = np.fmax(*compact.costs['length']).astype(np.float64)
+            length = np.nan_to_num(length)
+        else:
+            length = np.zeros(compact.number_of_undirected_edges)
+        
+        station_coverage = pd.DataFrame({'location_name': list(stations_df['location_name'])})
+        station_coverage['street_length'] = covered @ length
+        station_coverage['unique_length'] = covered @ np.where(edge_count == 1, length, 0)
+        overlap = pd.DataFrame({'street_length': np.bincount(edge_count, weights=length, 
+                                                             minlength=n + 1)})
+        
+        if node_weights is not None:
+            weights = node_weights.reindex(compact.node_ids).fillna(0).values.astype(np.float64)
+            node_count = np.asarray(reached.sum(axis=0)).ravel()
+            reached = reached.tocsr()
+            station_coverage['weight'] = reached @ weights
+            station_coverage['unique_weight'] = reached @ np.where(node_count == 1, weights, 0)
+            overlap['weight'] = np.bincount(node_count, weights=weights, minlength=n + 1)
+        
+        overlap.index.name = 'stations'
+        return station_coverage, overlap.iloc[1:]
+
+    def nearest_station_times(self,
+                              origins,
+                              stations_df,
+                              cost='walk_mins',
+                              max_cost=None,
+                              chunksize=100000):
+        """
+        Return network cost from each origin, e.g. address points, to its 
+        nearest station access point, from a single reverse search out 
+        from all stations rather than isochrones and point in polygon tests.
+        The search is held, so later calls for more origins with the same
+        stations only snap and look up the origins.
+        
+        Parameters
+        ----------
+        origins : array or list
+            (lat, lng) of each origin, or (y, x) if the graph is projected
+        stations_df : DataFrame
+            one row per station with `location_name` and `access_points` 
+            columns, see catchment.group_access_points(). Access points are
+            a list of (lat, lng), or a single (lat, lng) tuple
+        cost : str
+            graph edge field to use for network cost, default 'walk_mins',
+            with edges travelled from origin towards the station
+        max_cost : decimal
+            stop searching beyond this cost, default None for no limit
+        chunksize : int
+            number of origins snapped at a time, to limit memory for very
+            large origin sets
+            
+        Returns
+        -------
+        DataFrame
+            one row per origin with `location_name` and `station` (position
+            in `stations_df`) of the nearest station, `cost` and 
+            `snap_dist` from the origin to its nearest node in metres. 
+            Origins that cannot reach a station have station -1 and cost inf
+        """
+        compact, nearest = self._nearest_station_search(stations_df, cost, max_cost)
+        
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 2)
+        station = np.empty(len(origins), dtype=np.int32)
+        costs = np.empty(len(origins), dtype=np.float64)
+        snap_dists = np.empty(len(origins), dtype=np.float64)
+        for start in range(0, len(origins), chunksize):
+            end = start + chunksize
+            nodes, snap_dists[start:end] = self.nearest_nodes(origins[start:end], 
+                                                              return_dist=True)
+            index = compact.index_of(nodes)
+            station[start:end] = nearest['nearest_station'][index]
+            costs[start:end] = nearest['nearest_cost'][index]
+        
+        # Unreached origins (station -1) take the None after the last name
+        names = np.array(list(stations_df['location_name']) + [None], dtype=object)
+        return pd.DataFrame({'location_name': names[station],
+                             'station': station,
+                             'cost': costs,
+                             'snap_dist': snap_dists})
+    
+    def _nearest_station_search(self, stations_df, cost, max_cost):
+        """
+        Return CompactGraph and nearest station arrays for each node, from 
+        a search of the reversed network out from all station access nodes,
+        held until the network or stations change. Costs are from each node
+        towards the station, the same as TravelTimeIndex.nearest_cost.
+        """
+        station_points = [[points] if type(points) is tuple else points
+                          for points in stations_df['access_points']]
+        access_ptr = np.zeros(len(stations_df) + 1, dtype=np.int64)
+        np.cumsum([len(points) for points in station_points], out=access_ptr[1:])
+        access_points = [p for points in station_points for p in points]
+        access_nodes = self.nearest_nodes(access_points) if access_points else []
+        key = (self.fingerprint(cost), tuple(access_nodes), tuple(access_ptr), cost, max_cost)
+        if self._station_search is not None and self._station_search[0] == key:
+            return self._station_search[1]
+        
+        compact = self.as_compact()
+        reverse = compact.matrix(cost).T.tocsr()
+        nearest = nearest_stations(compact, reverse, compact.index_of(access_nodes),
+                                   access_ptr, limit=max_cost)
+        self._station_search = (key, (compact, nearest))
+        return compact, nearest
+    
     def plot_graph(self, **kwargs):
         """Convenience method to plot graph using osmnx"""
-        plt = ox.plot_graph(self._G, **kwargs)
+        plt = ox.plot_graph(self.graph, **kwargs)
         return plt
     
     
@@ -188,9 +1147,13 @@ class WalkNetwork:
         """
         
         # Get extend of edges graphs
-        G = None
-        for g in iso_bands_gpd['iso_band_graph']:
-            G = g if G is None else nx.compose(G, g)
+        if 'iso_band_graph' in iso_bands_gpd:
+            G = None
+            for g in iso_bands_gpd['iso_band_graph']:
+                G = g if G is None else nx.compose(G, g)
+        else:
+            nodes = np.unique(np.concatenate(list(iso_bands_gpd['iso_band_nodes'])))
+            G = self._subgraph(nodes)
         
         # Plot base graph
         fig, ax = ox.plot_graph(G, ax, bgcolor="w", node_size=0, close=False, 
@@ -217,12 +1180,111 @@ class WalkNetwork:
     def plot_station(self,
                      access_points,
                      location_name = ""):
-        iso_bands_gpd = self.iso_bands(access_points, location_name)
+        iso_bands_gpd = self.iso_bands(access_points, location_name, 
+                                       iso_band_graphs=False)
         fig, ax = self.plot_iso_bands(iso_bands_gpd)
 
         return fig, ax
 
 
+def _init_batch_worker(walk):
+    """Set WalkNetwork for iso_bands_batch() worker process"""
+    global _batch_network
+    _batch_network = walk
+
+
+def _batch_iso_bands(task):
+    """Calculate iso_bands for a single iso_bands_batch() task"""
+    access_points, location_name, kwargs = task
+    return _batch_network.iso_bands(access_points, location_name, **kwargs)
+
+
+def _copy_iso_bands(iso_bands_gpd):
+    """
+    Return copy of iso_bands_gpd with its own copy of each iso_band_graph,
+    so results held by the ResultCache are not changed by callers
+    """
+    iso_bands_gpd = iso_bands_gpd.copy()
+    if 'iso_band_graph' in iso_bands_gpd:
+        iso_bands_gpd['iso_band_graph'] = [G.copy() for G in iso_bands_gpd['iso_band_graph']]
+    return iso_bands_gpd
+
+
+def _has_node(compact, node):
+    """Return True if `node` is in CompactGraph `compact`"""
+    index = np.searchsorted(compact.node_ids, node)
+    return index < len(compact.node_ids) and compact.node_ids[index] == node
+
+
+def _edge_keys(compact, u, v):
+    """Return keys of edges from `u` to `v` in CompactGraph `compact`"""
+    if not _has_node(compact, u) or not _has_node(compact, v):
+        return []
+    positions = compact.out_edge_positions(compact.index_of([u]))
+    positions = positions[compact.indices[positions] == compact.index_of([v])[0]]
+    return compact.edge_key[compact.edge_ref[positions] >> 1].tolist()
+
+
+def _has_edge(compact, u, v, key):
+    """Return True if edge (`u`, `v`, `key`) is in CompactGraph `compact`"""
+    return key in _edge_keys(compact, u, v)
+
+
+def multi_source_costs(G, sources, cutoff=None, weight='length'):
+    """
+    Return the lowest network cost from any of `sources` to each node reached.
+
+    Parameters
+    ----------
+    G : networkx.MultiDiGraph
+        input graph
+    sources : list
+        nodes to search from, e.g. the access nodes for a station
+    cutoff : decimal
+        stop searching beyond this cost, normally the largest iso band
+    weight : str
+        edge attribute to use as network cost
+
+    Returns
+    -------
+    costs : dict
+        dict keyed by node of cost from the nearest source
+    """
+    return nx.multi_source_dijkstra_path_length(G, set(sources), 
+                                                cutoff=cutoff, 
+                                                weight=weight)
+
+
+def iso_band_polygons(edges, costs, iso_bands, edge_buffer=25):
+    """
+    Return a polygon for each iso band by buffering the edges whose end nodes
+    are both within the band.
+
+    Parameters
+    ----------
+    edges : GeoDataFrame
+        edges reached by the search, indexed by `u`, `v` and `key`
+    costs : dict
+        dict keyed by node of cost from the nearest source, as returned by
+        multi_source_costs()
+    iso_bands : list
+        band costs to cut from `costs`
+    edge_buffer : int
+        buffer in metres to apply around each edge
+
+    Returns
+    -------
+    polygons : GeoSeries
+        latlong polygons indexed by iso band
+    """
+    # Project once for all bands to ensure correct buffer distances
+    lng = edges.geometry.representative_point().x.mean()
+    builder = IsoPolygonBuilder(utm_crs(lng))
+    builder.add_edges(edges)
+    
+    return builder.polygons(edges.index, costs, iso_bands, edge_buffer)
+
+
 def graph_street_length(G):
     length = ox.stats.street_length_total(G.to_undirected())
     return length
@@ -232,7 +1294,8 @@ def get_osm_walk_network(centre_point,
                          dist=1000, 
                          snapshot_date=None, 
                          to_crs=None,
-                         return_local_authority_network=False):
+                         return_local_authority_network=False,
+                         cache=None):
     """
     Create a walking network graph using OSM within specified distance of a
     (lat, lng) point.
@@ -254,6 +1317,10 @@ def get_osm_walk_network(centre_point,
     return_local_authority_network : boolean
         if True then return network for local authority that first point is 
         located within instead of buffer around point
+    cache : GraphTileCache
+        if provided then build network from cached grid tiles, downloading
+        only tiles not already in the cache. Not used when 
+        return_local_authority_network is True.
  
     Returns
     -------
@@ -261,14 +1328,7 @@ def get_osm_walk_network(centre_point,
     """
  
     # OSM walk network tags
-    walk_highways = '["area"!~"yes"]["highway"]' + \
-        '["highway"!~"motorway"]' + \
-        '["highway"!~"motorway_junction"]' + \
-        '["highway"!~"traffic_signals"]["highway"!~"give_way"]' + \
-        '["foot"!~"no"]' + \
-        '["sidewalk"!~"no|separate"]["area"!~"yes"]'
-    walk_footways = '["area"!~"yes"]["footway"]'
-    custom_filters = [walk_highways, walk_footways]
+    custom_filters = WALK_CUSTOM_FILTERS
  
     # Configure output and set snapshot date
     config = '[out:json]' + ('' if snapshot_date is None else '[date:"' + snapshot_date + '"]')
@@ -277,45 +1337,31 @@ def get_osm_walk_network(centre_point,
     # Ensure centre_point is a list to prevent errors
     centre_points = [centre_point] if type(centre_point) is tuple else centre_point
  
-    graphs = []
     if return_local_authority_network:
         
         # Get local authority boundary within which to return network
         geom, name = get_local_authority_boundary(centre_points[0])
-        
-        # Need to do multiple calls to custom_filter for OR tag criteria
-        for custom_filter in custom_filters:
-            try:
-                G = ox.graph_from_polygon(geom.all(), 
-                                        network_type="walk", 
-                                        custom_filter=custom_filter, 
-                                        truncate_by_edge=True,
-                                        simplify=False)
-            except:
-                pass  # nothing to add
-            else:
-                graphs.append(G)            
+        G = _download_walk_graph(geom.all(), custom_filters, retain_all=False)
     else:
         
-        # Calculate graph for each centre point provided and each of the custom_filter
-        # tags, returning full extend of network as single graph 
-        for centre_point in centre_points:
+        bboxes = [ox.utils_geo.bbox_from_point(cp, dist=dist) for cp in centre_points]
+        if cache is None:
             
-            # Need to do multiple calls to custom_filter for OR tag criteria
-            for custom_filter in custom_filters:
-                try:
-                    G = ox.graph_from_point(centre_point, 
-                                            dist=dist, 
-                                            network_type="walk", 
-                                            custom_filter=custom_filter, 
-                                            truncate_by_edge=True,
-                                            simplify=False)
-                except:
-                    pass  # nothing to add
-                else:
-                    graphs.append(G)
-
-    G = nx.compose_all(graphs)
+            # Merge area around each centre point into a single polygon so 
+            # overlapping areas are downloaded and built once
+            polygon = unary_union([ox.utils_geo.bbox_to_poly(*bbox) for bbox in bboxes])
+            G = _download_walk_graph(polygon, custom_filters)
+        else:
+            
+            # Build graph from cached tiles, downloading any missing tiles
+            G = _get_tiled_walk_graph(bboxes, custom_filters, snapshot_date, cache)
+        
+        # Keep largest connected network around each centre point, the same
+        # as ox.graph_from_point()
+        nodes = set()
+        for bbox in bboxes:
+            nodes |= _largest_component_nodes(G, bbox)
+        G = G.subgraph(nodes).copy()
 
     if not to_crs is None:
       G = ox.project_graph(G, to_crs=to_crs)
@@ -323,9 +1369,152 @@ def get_osm_walk_network(centre_point,
     return G
  
     
+def _download_walk_graph(polygon, 
+                         custom_filters, 
+                         retain_all=True, 
+                         clean_periphery=True):
+    """
+    Download ways matching any of `custom_filters` within `polygon` and build
+    a single graph, the same as ox.graph_from_polygon() with 
+    truncate_by_edge=True and simplify=False.
+    
+    Overpass filters can't express OR tag criteria, so each filter is 
+    downloaded separately and the responses merged before building the graph.
+    Filters that download nothing are skipped, and an empty graph returned if
+    no ways are within `polygon`.
+    
+    Uses osmnx 1.x internals to merge responses, falling back to a graph per
+    filter from ox.graph_from_polygon() if they are not available.
+    """
+    empty = nx.MultiDiGraph(crs=ox.settings.default_crs)
+    if not _has_download_internals():
+        return _download_walk_graph_per_filter(polygon, custom_filters, retain_all, 
+                                               clean_periphery, empty)
+    
+    if clean_periphery:
+        # Buffer 500m so street counts include streets just outside polygon
+        poly_proj, crs_utm = ox.projection.project_geometry(polygon)
+        poly_buff, _ = ox.projection.project_geometry(poly_proj.buffer(500), 
+                                                      crs=crs_utm, 
+                                                      to_latlong=True)
+    else:
+        poly_buff = polygon
+    
+    # Keep each OSM element once, as ways can match more than one filter
+    elements = {}
+    for custom_filter in custom_filters:
+        for response_json in ox.downloader._osm_network_download(poly_buff, "walk", custom_filter):
+            for element in response_json.get("elements", []):
+                elements[element["type"], element["id"]] = element
+    if not any(element_type == "way" for element_type, _ in elements):
+        return empty
+    
+    G_buff = ox.graph._create_graph([{"elements": list(elements.values())}], 
+                                    retain_all=True, 
+                                    bidirectional=True)
+    try:
+        G = ox.truncate.truncate_graph_polygon(G_buff, polygon, 
+                                               retain_all=retain_all, 
+                                               truncate_by_edge=True)
+    except ValueError:
+        return empty  # no nodes within polygon
+    
+    if clean_periphery:
+        spn = ox.stats.count_streets_per_node(G_buff, nodes=G.nodes)
+        nx.set_node_attributes(G, values=spn, name="street_count")
+    
+    return G
+
+
+def _has_download_internals():
+    """Return True if osmnx has the internals used by _download_walk_graph()"""
+    return (hasattr(getattr(ox, 'downloader', None), '_osm_network_download') and
+            hasattr(getattr(ox, 'graph', None), '_create_graph'))
+
+
+def _download_walk_graph_per_filter(polygon, 
+                                    custom_filters, 
+                                    retain_all, 
+                                    clean_periphery, 
+                                    empty):
+    """
+    Download and compose a graph for each of `custom_filters` using the 
+    public ox.graph_from_polygon(), skipping filters that download nothing.
+    """
+    graphs = []
+    for custom_filter in custom_filters:
+        try:
+            G = ox.graph_from_polygon(polygon, 
+                                      network_type="walk", 
+                                      custom_filter=custom_filter, 
+                                      truncate_by_edge=True,
+                                      simplify=False,
+                                      retain_all=retain_all,
+                                      clean_periphery=clean_periphery)
+        except ValueError:
+            pass  # nothing to add
+        else:
+            graphs.append(G)
+    
+    return nx.compose_all(graphs) if graphs else empty
+
+
+def _largest_component_nodes(G, bbox):
+    """
+    Return nodes in largest weakly connected component of the network within 
+    bbox, retaining nodes outside bbox with a neighbour inside, the same as
+    ox.truncate.truncate_graph_bbox() with truncate_by_edge=True.
+    """
+    north, south, east, west = bbox
+    inside = [n for n, d in G.nodes(data=True) 
+              if south <= d['y'] <= north and west <= d['x'] <= east]
+    nodes = set(inside)
+    for n in inside:
+        nodes.update(nx.all_neighbors(G, n))
+    
+    components = list(nx.weakly_connected_components(G.subgraph(nodes)))
+    
+    return max(components, key=len) if components else set()
+
+
+def _get_tiled_walk_graph(bboxes, 
+                          custom_filters, 
+                          snapshot_date, 
+                          cache):
+    """
+    Return graph for all tiles intersecting bboxes from cache, downloading 
+    and adding tiles not yet in the cache.
+    """
+    tiles = sorted(set(tile for bbox in bboxes for tile in cache.tiles_for_bbox(*bbox)))
+    filters_key = json.dumps(custom_filters)
+    
+    tile_graphs = []
+    for tile in tiles:
+        G = cache.get(tile, filters_key, snapshot_date)
+        if G is None:
+            polygon = ox.utils_geo.bbox_to_poly(*cache.tile_bbox(tile))
+            try:
+                G = _download_walk_graph(polygon, custom_filters, 
+                                         clean_periphery=False)
+            except ValueError:
+                # No ways in tile, so cache as empty
+                G = nx.MultiDiGraph(crs=ox.settings.default_crs)
+            except:
+                continue  # nothing to add, and don't cache failure
+            cache.put(tile, filters_key, snapshot_date, G)
+        tile_graphs.append(G)
+    
+    if len(tile_graphs) == 0:
+        return nx.MultiDiGraph(crs=ox.settings.default_crs)
+    
+    return nx.compose_all(tile_graphs)
+
+
 def get_local_authority_boundary(access_point,
                                     statsnz_api=None,
-                                    statsnz_layer_code=104267):
+                                    statsnz_layer_code=104267,
+                                    statsnz_url="https://datafinder.stats.govt.nz",
+                                    client=None):
     """
     Return polygon for local authority boundary, which can be used to determine
     extent of osm network to download.
@@ -340,6 +1529,11 @@ def get_local_authority_boundary(access_point,
         Koordinates API key to access the layer from StatsNZ.
     statsnz_layer_code : str
         The StatsNZ layer id, default is `104267` which is NZ Local Authorities
+    statsnz_url : str
+        StatsNZ datafinder base url, default "https://datafinder.stats.govt.nz"
+    client : client.HttpClient
+        client to query with, default client.default_client(), which caches
+        responses so repeated lookups are not requested again
         
     Returns
     -------
@@ -351,17 +1545,17 @@ def get_local_authority_boundary(access_point,
         statsnz_api = 'e9dc37ccf1ef4152bb7444f61dcd2ceb'
 
     # StatsNZ base url
-    url_template = "https://datafinder.stats.govt.nz/services/query/v1/vector.json?" + \
+    url_template = statsnz_url + "/services/query/v1/vector.json?" + \
                    "key={}&layer={}&x={}&y={}&max_results=1&geometry=true&" + \
                    "with_field_names=true"
 
     
     # Query layer
     url = url_template.format(statsnz_api, statsnz_layer_code, access_point[1], access_point[0])       
-    r = requests.get(url)
+    client = http_client.default_client() if client is None else client
+    result = client.get_json(url)
 
-    if r.status_code == 200:
-        result = r.json() 
+    if result is not None:
         try:
             geom_str = str(result["vectorQuery"]["layers"][str(statsnz_layer_code)]\
                                  ["features"][0]["geometry"])       
@@ -0,0 +1,300 @@
+"""Columnar on-disk storage for walk network node and edge tables, and
+iso band results saved one station per file"""
+
+import os
+import bz2
+import gzip
+import json
+import pickle
+import hashlib
+import contextlib
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from shapely import wkb
+from shapely.geometry import Point
+
+# Index columns of each table, as created by ox.graph_to_gdfs()
+_INDEX = {'nodes': ['osmid'], 'edges': ['u', 'v', 'key']}
+
+
+def save_gdfs(path, gdf_nodes, gdf_edges, graph_attrs):
+    """
+    Save node and edge GeoDataFrames as a folder of one file per column.
+
+    Numeric and boolean columns are saved as .npy arrays so they can be
+    read memory-mapped, edge geometry as a single array of WKB bytes with
+    offsets, and other columns (e.g. OSM tags that can hold lists) as json.
+    Node geometry is not saved as it is created from `x` and `y`.
+
+    Parameters
+    ----------
+    path : string or pathlib.Path
+        folder to save to, created if it does not exist.
+    gdf_nodes : GeoDataFrame
+        nodes indexed by node id, as from ox.graph_to_gdfs()
+    gdf_edges : GeoDataFrame
+        edges indexed by `u`, `v` and `key`, as from ox.graph_to_gdfs()
+    graph_attrs : dict
+        graph attributes, e.g. `crs`
+    """
+    os.makedirs(path, exist_ok=True)
+    meta = {'graph_attrs': graph_attrs, 'crs': str(gdf_nodes.crs), 'columns': {}}
+    for table, gdf in [('nodes', gdf_nodes), ('edges', gdf_edges)]:
+        columns = {}
+        for name, index in zip(_INDEX[table], range(gdf.index.nlevels)):
+            _save_array(path, table, name, gdf.index.get_level_values(index).values)
+        for name, column in gdf.items():
+            if name == 'geometry':
+                if table == 'edges':
+                    columns[name] = 'wkb'
+                    _save_wkb(path, table, name, column)
+            elif column.dtype.kind in 'biuf':
+                columns[name] = 'npy'
+                _save_array(path, table, name, column.values)
+            else:
+                columns[name] = 'json'
+                _save_json(path, table, name, column)
+        meta['columns'][table] = columns
+
+    # Written last so a partly saved folder is not read
+    with open(os.path.join(path, 'graph.json'), 'w') as f:
+        json.dump(meta, f, default=str)
+
+
+def load_gdfs(path, mmap_mode='r'):
+    """
+    Load node and edge GeoDataFrames saved with save_gdfs(), without
+    creating a networkx graph.
+
+    Parameters
+    ----------
+    path : string or pathlib.Path
+        folder saved to.
+    mmap_mode : str
+        numpy memory-map mode for .npy columns, default 'r'. None to read
+        into memory.
+
+    Returns
+    -------
+    gdf_nodes, gdf_edges, graph_attrs : tuple
+    """
+    with open(os.path.join(path, 'graph.json')) as f:
+        meta = json.load(f)
+
+    gdfs = {}
+    for table, columns in meta['columns'].items():
+        index = [_load_array(path, table, name, mmap_mode) for name in _INDEX[table]]
+        index = (pd.Index(index[0], name=_INDEX[table][0]) if len(index) == 1
+                 else pd.MultiIndex.from_arrays(index, names=_INDEX[table]))
+        data = {}
+        for name, kind in columns.items():
+            if kind == 'npy':
+                data[name] = _load_array(path, table, name, mmap_mode)
+            elif kind == 'json':
+                data[name] = _load_json(path, table, name)
+            elif kind == 'wkb':
+                data[name] = _load_wkb(path, table, name, mmap_mode)
+        if table == 'nodes':
+            points = np.empty(len(index), dtype=object)
+            for i, (x, y) in enumerate(zip(data['x'].tolist(), data['y'].tolist())):
+                points[i] = Point(x, y)
+            data['geometry'] = _geometry_array(points)
+        gdfs[table] = gpd.GeoDataFrame(data, index=index, crs=meta['crs'])
+
+    return gdfs['nodes'], gdfs['edges'], meta['graph_attrs']
+
+
+def read_pickle(path, **kwargs):
+    """
+    Read object, e.g. a networkx graph, from a pickle file or filehandle.
+    Files ending with .gz or .bz2 are decompressed. Replaces 
+    nx.read_gpickle(), removed in networkx 3.0.
+    """
+    with _open_pickle(path, 'rb') as f:
+        return pickle.load(f, **kwargs)
+
+
+def write_pickle(obj, path, protocol=pickle.HIGHEST_PROTOCOL):
+    """
+    Write object to a pickle file or filehandle, compressed if the file
+    name ends with .gz or .bz2. Replaces nx.write_gpickle().
+    """
+    with _open_pickle(path, 'wb') as f:
+        pickle.dump(obj, f, protocol=protocol)
+
+
+def is_pickle_path(path):
+    """Return True if `path` is a filehandle or a pickle file name"""
+    if not isinstance(path, (str, os.PathLike)):
+        return True
+    return str(path).endswith(('.gpickle', '.pickle', '.pkl', '.gz', '.bz2'))
+
+
+def _open_pickle(path, mode):
+    """Open pickle path by compression suffix, leaving filehandles open"""
+    if not isinstance(path, (str, os.PathLike)):
+        return contextlib.nullcontext(path)
+    if str(path).endswith('.gz'):
+        return gzip.open(path, mode)
+    if str(path).endswith('.bz2'):
+        return bz2.open(path, mode)
+    return open(path, mode)
+
+
+def is_gdfs_folder(path):
+    """Return True if `path` is a folder saved with save_gdfs()"""
+    return os.path.isfile(os.path.join(path, 'graph.json'))
+
+
+def _file(path, table, name, suffix):
+    return os.path.join(path, '{}.{}{}'.format(table, name, suffix))
+
+
+def _save_array(path, table, name, values):
+    np.save(_file(path, table, name, '.npy'), np.asarray(values))
+
+
+def _load_array(path, table, name, mmap_mode):
+    return np.load(_file(path, table, name, '.npy'), mmap_mode=mmap_mode)
+
+
+def _save_wkb(path, table, name, geoms):
+    """Save geometries as concatenated WKB bytes and end offsets"""
+    wkbs = [geom.wkb for geom in geoms]
+    offsets = np.cumsum([len(wkb) for wkb in wkbs], dtype=np.int64)
+    np.save(_file(path, table, name, '.wkb.npy'),
+            np.frombuffer(b''.join(wkbs), dtype=np.uint8))
+    np.save(_file(path, table, name, '.offsets.npy'), offsets)
+
+
+def _load_wkb(path, table, name, mmap_mode):
+    buffer = np.load(_file(path, table, name, '.wkb.npy'), mmap_mode=mmap_mode)
+    offsets = np.load(_file(path, table, name, '.offsets.npy'))
+    starts = np.concatenate([[0], offsets[:-1]])
+
+    geoms = np.empty(len(offsets), dtype=object)
+    for i, (start, end) in enumerate(zip(starts, offsets)):
+        geoms[i] = wkb.loads(buffer[start:end].tobytes())
+    return _geometry_array(geoms)
+
+
+def _geometry_array(geoms):
+    """
+    Return GeometryArray from object array of shapely geometries, without
+    the per geometry checks of gpd.array.from_shapely() that read each
+    geometry's coordinates with shapely 1.x.
+    """
+    return gpd.array.GeometryArray(geoms)
+
+
+def _save_json(path, table, name, column):
+    """Save column of mixed values, e.g. str or list, with NaN as null"""
+    values = [None if isinstance(value, float) and np.isnan(value) else value
+              for value in column.tolist()]
+    with open(_file(path, table, name, '.json'), 'w') as f:
+        json.dump(values, f, default=lambda value: value.item())
+
+
+def _load_json(path, table, name):
+    with open(_file(path, table, name, '.json')) as f:
+        values = json.load(f)
+    # Fill item by item so list values are not read as extra dimensions
+    column = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        column[i] = np.nan if value is None else value
+    return column
+
+
+# File suffix for each part file driver
+_PART_SUFFIX = {'FlatGeobuf': '.fgb', 'GPKG': '.gpkg', 'Parquet': '.parquet'}
+
+# Columns holding lists, saved in part files as json text
+_JSON_COLUMNS = ['access_points', 'access_nodes', 'access_snap_dists']
+
+
+def part_names(location_names, access_points):
+    """
+    Return part file name for each station, in station order and unique to
+    its name and access points so a rerun skips only the same stations.
+    """
+    names = []
+    for i, (location_name, points) in enumerate(zip(location_names, access_points)):
+        points = [points] if type(points) is tuple else points
+        key = repr((location_name, [tuple(map(float, p)) for p in points]))
+        names.append('{:06d}_{}'.format(i, hashlib.sha1(key.encode()).hexdigest()[:12]))
+    return names
+
+
+def has_part(path, name, driver='FlatGeobuf'):
+    """Return True if part `name` has been written to folder `path`"""
+    return os.path.isfile(os.path.join(path, name + _PART_SUFFIX[driver]))
+
+
+def save_part(path, name, gdf, driver='FlatGeobuf'):
+    """
+    Save GeoDataFrame as part file `name` in folder `path`, written to a 
+    temporary file first so an interrupted write is never read as a part.
+
+    Parameters
+    ----------
+    path : string or pathlib.Path
+        folder to save to, created if it does not exist.
+    name : str
+        part name, e.g. from part_names()
+    gdf : GeoDataFrame
+        one station's iso_bands_gpd, without graph or node columns
+    driver : str
+        'FlatGeobuf', 'GPKG' or 'Parquet' (needs pyarrow)
+    """
+    os.makedirs(path, exist_ok=True)
+    gdf = gdf.copy()
+    for column in _JSON_COLUMNS:
+        if column in gdf:
+            gdf[column] = [json.dumps(value, default=lambda v: v.item()) 
+                           for value in gdf[column]]
+
+    part = os.path.join(path, name + _PART_SUFFIX[driver])
+    tmp = os.path.join(path, name + '.tmp' + _PART_SUFFIX[driver])
+    if driver == 'Parquet':
+        gdf.to_parquet(tmp)
+    elif driver == 'FlatGeobuf':
+        # Without spatial index, which reorders features
+        gdf.to_file(tmp, driver=driver, SPATIAL_INDEX='NO')
+    else:
+        gdf.to_file(tmp, driver=driver)
+    os.replace(tmp, part)
+
+
+def load_parts(path, driver='FlatGeobuf'):
+    """
+    Load part files saved with save_part() as a single GeoDataFrame, in
+    part name order.
+
+    Parameters
+    ----------
+    path : string or pathlib.Path
+        folder saved to.
+    driver : str
+        driver the parts were saved with
+
+    Returns
+    -------
+    GeoDataFrame
+    """
+    suffix = _PART_SUFFIX[driver]
+    names = sorted(entry.name for entry in os.scandir(path)
+                   if entry.name.endswith(suffix) and not entry.name.endswith('.tmp' + suffix))
+    if len(names) == 0:
+        return gpd.GeoDataFrame()
+
+    parts = [gpd.read_parquet(os.path.join(path, name)) if driver == 'Parquet'
+             else gpd.read_file(os.path.join(path, name), driver=driver) for name in names]
+    gdf = gpd.GeoDataFrame(pd.concat(parts, ignore_index=True), crs=parts[0].crs)
+    for column in _JSON_COLUMNS:
+        if column in gdf:
+            gdf[column] = [json.loads(value) for value in gdf[column]]
+    if 'access_points' in gdf:
+        gdf['access_points'] = [[tuple(p) for p in points] for points in gdf['access_points']]
+    return gdf
@@ -22,12 +22,13 @@ setuptools.setup(
     ],
     packages=setuptools.find_packages(),
     install_requires = [
-        "osmnx>=1.1.1",
+        "osmnx>=1.1.1,<2",
         "folium>=0.12.1",
         "scikit-learn>=0.22",
-        "gdal>=3.2.0",
+        "scipy>=1.4",
         "rasterio>=1.2.4",
-        "shapely>=1.7.1"
+        "shapely>=1.7.1",
+        "urllib3>=1.26"
     ],
     python_requires=">=3.6",
 )
@@ -0,0 +1,58 @@
+"""Shared fixtures for tests that should run without network access."""
+
+import math
+
+import pytest
+import networkx as nx
+
+
+def make_grid_graph(rows=10, cols=10, lat=-41.137575, lng=174.843478,
+                    step=0.0005):
+    """
+    Return a small bidirectional lat/lng grid graph shaped like an osmnx
+    walk network, with node `elevation` and edge `length` and `grade`.
+    """
+    G = nx.MultiDiGraph(crs='epsg:4326')
+
+    for r in range(rows):
+        for c in range(cols):
+            node = 1000 + r * cols + c
+            G.add_node(node,
+                       y=lat + r * step,
+                       x=lng + c * step,
+                       street_count=4,
+                       elevation=float(r * 4 + c))
+
+    def add(a, b, osmid):
+        ya, xa = G.nodes[a]['y'], G.nodes[a]['x']
+        yb, xb = G.nodes[b]['y'], G.nodes[b]['x']
+        dy = (yb - ya) * 111320
+        dx = (xb - xa) * 111320 * math.cos(math.radians(ya))
+        length = round(math.hypot(dx, dy), 3)
+        for u, v in ((a, b), (b, a)):
+            rise = G.nodes[v]['elevation'] - G.nodes[u]['elevation']
+            G.add_edge(u, v, osmid=osmid, highway='footway', oneway=False,
+                       length=length, grade=round(rise / length, 3))
+
+    osmid = 1
+    for r in range(rows):
+        for c in range(cols):
+            node = 1000 + r * cols + c
+            if c + 1 < cols:
+                add(node, node + 1, osmid)
+                osmid += 1
+            if r + 1 < rows:
+                add(node, node + cols, osmid)
+                osmid += 1
+
+    return G
+
+
+@pytest.fixture
+def grid_graph():
+    return make_grid_graph()
+
+
+@pytest.fixture
+def large_grid_graph():
+    return make_grid_graph(rows=40, cols=40)
@@ -0,0 +1,215 @@
+"""Unit tests for the cache module."""
+
+import pytest
+import json
+
+from osmcatch import cache, elevation, network
+import osmnx as ox
+import networkx as nx
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+
+# Tests
+class TestClassGraphTileCache():
+    
+    # Fixtures
+    access_point = (-41.1355, 174.8457)
+    dist = 100
+    
+    def seed_tiles(self, tile_cache, G):
+        bbox = ox.utils_geo.bbox_from_point(self.access_point, dist=self.dist)
+        for tile in tile_cache.tiles_for_bbox(*bbox):
+            G_tile = ox.truncate.truncate_graph_bbox(G, *tile_cache.tile_bbox(tile),
+                                                     truncate_by_edge=True,
+                                                     retain_all=True)
+            tile_cache.put(tile, json.dumps(network.WALK_CUSTOM_FILTERS), None, G_tile)
+    
+    def test_tiles_for_bbox(self, tmp_path):
+        tile_cache = cache.GraphTileCache(tmp_path, tile_size=0.01)
+        tiles = tile_cache.tiles_for_bbox(-41.135, -41.145, 174.855, 174.845)
+        assert len(tiles) == 4
+        for tile in tiles:
+            north, south, east, west = tile_cache.tile_bbox(tile)
+            assert north > -41.145 and south < -41.135
+            assert east > 174.845 and west < 174.855
+
+    def test_get_osm_walk_network_from_seeded_tiles(self, tmp_path, monkeypatch, grid_graph):
+        tile_cache = cache.GraphTileCache(tmp_path, tile_size=0.001)
+        self.seed_tiles(tile_cache, grid_graph)
+        
+        def no_download(*args, **kwargs):
+            raise AssertionError('tile should be read from cache')
+        monkeypatch.setattr(network, '_download_walk_graph', no_download)
+        
+        G = network.get_osm_walk_network(self.access_point, self.dist, cache=tile_cache)
+        expected = ox.truncate.truncate_graph_bbox(
+            grid_graph, *ox.utils_geo.bbox_from_point(self.access_point, dist=self.dist),
+            truncate_by_edge=True)
+        assert set(G.nodes) == set(expected.nodes)
+        assert set(G.edges) == set(expected.edges)
+
+    def test_only_missing_tiles_downloaded(self, tmp_path, monkeypatch, grid_graph):
+        tile_cache = cache.GraphTileCache(tmp_path, tile_size=0.001)
+        
+        downloads = []
+        def download(polygon, custom_filters, **kwargs):
+            downloads.append(polygon)
+            return ox.truncate.truncate_graph_polygon(grid_graph, polygon,
+                                                      truncate_by_edge=True, retain_all=True)
+        monkeypatch.setattr(network, '_download_walk_graph', download)
+        
+        G1 = network.get_osm_walk_network(self.access_point, self.dist, cache=tile_cache)
+        n = len(downloads)
+        assert n > 0
+        G2 = network.get_osm_walk_network(self.access_point, self.dist, cache=tile_cache)
+        assert len(downloads) == n
+        assert set(G1.edges) == set(G2.edges)
+        
+    def test_eviction(self, tmp_path, grid_graph):
+        tile_cache = cache.GraphTileCache(tmp_path, max_size=None)
+        tile_cache.put((0, 0), 'a', None, grid_graph)
+        size = sum(f.stat().st_size for f in tmp_path.iterdir())
+        
+        tile_cache.max_size = int(size * 2.5)
+        tile_cache.put((0, 1), 'a', None, grid_graph)
+        assert tile_cache.get((0, 0), 'a') is not None
+        tile_cache.put((0, 2), 'a', None, grid_graph)
+        
+        # Least recently used tile removed
+        assert tile_cache.get((0, 1), 'a') is None
+        assert tile_cache.get((0, 0), 'a') is not None
+        assert nx.utils.graphs_equal(tile_cache.get((0, 2), 'a'), grid_graph)
+
+
+class TestClassElevationCache():
+    
+    # Fixtures
+    tiles = list(Path("tests/test_data").glob("DEM*.tif"))
+    
+    def test_get_many_put_many(self, tmp_path):
+        elevation_cache = cache.ElevationCache(tmp_path / 'elevations.sqlite')
+        elevation_cache.put_many('dem', {n: n / 10 for n in range(1200)})
+        elevation_cache.put_many('other', {5: -1.0})
+        
+        cached = elevation_cache.get_many('dem', list(range(1100, 1300)))
+        assert cached == {n: n / 10 for n in range(1100, 1200)}
+        assert elevation_cache.get_many('other', [5, 6]) == {5: -1.0}
+    
+    def test_add_elevations_only_samples_new_nodes(self, tmp_path, monkeypatch, grid_graph):
+        elevation_cache = cache.ElevationCache(tmp_path / 'elevations.sqlite')
+        expected = elevation.add_elevations_to_graph(grid_graph.copy(), self.tiles, 
+                                                     cache=elevation_cache)
+        
+        # Second run reads from cache, sampling only nodes not within a tile
+        sampled = []
+        raster_elevations = elevation.raster_elevations
+        def count_sampled(x, y, *args, **kwargs):
+            sampled.extend(x)
+            return raster_elevations(x, y, *args, **kwargs)
+        monkeypatch.setattr(elevation, 'raster_elevations', count_sampled)
+        
+        G = grid_graph.copy()
+        G.add_node(1, x=174.8440, y=-41.1370)
+        G = elevation.add_elevations_to_graph(G, self.tiles, cache=elevation_cache)
+        missing = [n for n, e in expected.nodes(data='elevation') if np.isnan(e)]
+        assert len(sampled) == len(missing) + 1
+        for node, elev in expected.nodes(data='elevation'):
+            assert G.nodes[node]['elevation'] == pytest.approx(elev, nan_ok=True)
+        assert not np.isnan(G.nodes[1]['elevation'])
+
+
+class TestClassResultCache():
+    
+    def test_lru_eviction_and_spill(self, tmp_path):
+        result_cache = cache.ResultCache(max_items=2)
+        for key in ['a', 'b', 'c']:
+            result_cache.put((key,), key.upper())
+        assert len(result_cache) == 2
+        assert result_cache.get(('a',)) is None
+        
+        # Evicted results are read back from spill folder
+        result_cache = cache.ResultCache(max_items=2, spill_folder=tmp_path)
+        for key in ['a', 'b']:
+            result_cache.put((key,), key.upper())
+        result_cache.get(('a',))
+        result_cache.put(('c',), 'C')
+        assert list(result_cache._items) == [('a',), ('c',)]
+        assert result_cache.get(('b',)) == 'B'
+        result_cache.clear()
+        assert result_cache.get(('b',)) is None
+        
+        # Least recently spilled results removed beyond max_spill_items
+        result_cache = cache.ResultCache(max_items=1, spill_folder=tmp_path, 
+                                         max_spill_items=2)
+        for key in ['a', 'b', 'c', 'd']:
+            result_cache.put((key,), key.upper())
+        assert len(list(tmp_path.glob('*.pkl'))) == 2
+        assert result_cache.get(('a',)) is None
+        assert result_cache.get(('b',)) == 'B'
+        assert len(list(tmp_path.glob('*.pkl'))) == 2
+    
+    def test_iso_bands_cached_until_costs_change(self, grid_graph, monkeypatch):
+        walk = network.WalkNetwork(grid_graph)
+        access_points = [(-41.137575, 174.843478)]
+        first = walk.iso_bands(access_points, 'A', iso_bands=[100, 200], 
+                               iso_band_cost='length')
+        
+        def no_search(*args, **kwargs):
+            raise AssertionError('should use cache')
+        monkeypatch.setattr(walk, 'access_costs', no_search)
+        second = walk.iso_bands(access_points, 'B', iso_bands=[200, 100], 
+                                iso_band_cost='length')
+        assert list(second['location_name']) == ['B', 'B']
+        assert second.geometry.geom_equals(first.geometry).all()
+        
+        # Band graphs returned are not those held by the cache
+        nodes = set(first.loc[0, 'iso_band_graph'])
+        second.loc[0, 'iso_band_graph'].remove_node(1000)
+        third = walk.iso_bands(access_points, 'C', iso_bands=[100, 200], 
+                               iso_band_cost='length')
+        assert set(third.loc[0, 'iso_band_graph']) == nodes
+        
+        # New edge costs invalidate cached results
+        walk.add_edge_speed()
+        with pytest.raises(AssertionError):
+            walk.iso_bands(access_points, 'B', iso_bands=[100, 200], 
+                           iso_band_cost='length')
+    
+    def test_iso_bands_cache_missed_when_custom_cost_changes(self, grid_graph, monkeypatch):
+        walk = network.WalkNetwork(grid_graph)
+        walk.set_edge_attributes(pd.DataFrame({'walk_cost': walk.edges['length']}))
+        access_points = [(-41.137575, 174.843478)]
+        first = walk.iso_bands(access_points, 'A', iso_bands=[100, 200], 
+                               iso_band_cost='walk_cost')
+        
+        # Cost not in COST_FIELDS changed on the graph directly
+        searches = []
+        access_costs = walk.access_costs
+        def counted_search(*args, **kwargs):
+            searches.append(1)
+            return access_costs(*args, **kwargs)
+        monkeypatch.setattr(walk, 'access_costs', counted_search)
+        walk.iso_bands(access_points, 'A', iso_bands=[100, 200], iso_band_cost='walk_cost')
+        assert len(searches) == 0
+        
+        for u, v, k, d in walk.graph.edges(keys=True, data=True):
+            d['walk_cost'] = d['length'] * 2
+        walk.graph_changed()
+        second = walk.iso_bands(access_points, 'A', iso_bands=[100, 200], 
+                                iso_band_cost='walk_cost')
+        assert len(searches) == 1
+        assert not second.geometry.geom_equals(first.geometry).any()
+
+    def test_iso_bands_cost_not_an_edge_column(self, grid_graph):
+        walk = network.WalkNetwork(grid_graph)
+        access_points = [(-41.137575, 174.843478)]
+        expected = walk.iso_bands(access_points, iso_bands=[2], iso_band_cost='distance')
+        
+        # Missing cost is 1 per edge once the edge GeoDataFrame is created
+        walk = network.WalkNetwork(grid_graph)
+        assert len(walk.edges)
+        result = walk.iso_bands(access_points, iso_bands=[2], iso_band_cost='distance')
+        assert set(result.loc[0, 'iso_band_graph']) == set(expected.loc[0, 'iso_band_graph'])
+        assert len(result.loc[0, 'iso_band_graph']) > 1
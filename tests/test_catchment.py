@@ -4,6 +4,7 @@ import pytest
 
 from osmcatch import catchment
 import networkx as nx
+import pandas as pd
 import geopandas as gpd
 
 # Tests
@@ -29,3 +30,11 @@ class TestClassCatchment():
         assert type(iso_bands_gpd['geometry']) == gpd.geoseries.GeoSeries
         
         
+    def test_group_access_points(self):
+        stations = pd.read_csv('notebooks/input_data/stations.csv')
+        stations_df = catchment.group_access_points(stations)
+        assert list(stations_df.columns) == ['location_name', 'access_points']
+        assert stations_df['location_name'].is_unique
+        assert stations_df.loc[0, 'location_name'] == 'Waikanae Station'
+        assert stations_df.loc[1, 'access_points'] == [(-40.916677, 175.007223), 
+                                                       (-40.916623, 175.007128)]
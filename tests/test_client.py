@@ -0,0 +1,99 @@
+"""Unit tests for the client module, against a local stub server."""
+
+import pytest
+import json
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from osmcatch import client, elevation, network
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answer LINZ and StatsNZ vector queries with one feature per point"""
+
+    def do_GET(self):
+        query = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        self.server.requests.append(query)
+
+        # Fail first request for each point to test retries
+        point = (query['x'], query['y'])
+        if point in self.server.fail and point not in self.server.failed:
+            self.server.failed.add(point)
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        layer = query['layer']
+        if layer == '53591':
+            features = [{'properties': {'tile': 'DEM_{}_{}.tif'.format(query['x'], query['y'])}},
+                        {'properties': {'tile': 'DEM_shared.tif'}}]
+        else:
+            features = [{'geometry': {'type': 'Point', 'coordinates': [1, 2]},
+                         'properties': {'TA2020_V1_00_NAME': 'Porirua City'}}]
+        body = {'vectorQuery': {'layers': {layer: {
+            'features': features, 'crs': {'properties': {'name': 'EPSG:2193'}}}}}}
+        body = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = HTTPServer(('127.0.0.1', 0), StubHandler)
+    server.requests, server.fail, server.failed = [], set(), set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+# Tests
+class TestClassHttpClient():
+
+    # Fixtures
+    access_points = [(-41.1375, 174.8434), (-41.1355, 174.8459), (-41.1375, 174.8434)]
+
+    def url(self, server):
+        return 'http://127.0.0.1:{}'.format(server.server_port)
+
+    def test_linz_tiles_retried_and_cached(self, stub_server):
+        http = client.HttpClient(max_workers=2, backoff_factor=0)
+        stub_server.fail.add(('174.8459', '-41.1355'))
+        tiles = elevation.get_raster_tile_names_from_linz(self.access_points, 200,
+                                                          linz_url=self.url(stub_server),
+                                                          client=http)
+        assert tiles == ['DEM_174.8434_-41.1375.tif', 'DEM_174.8459_-41.1355.tif',
+                         'DEM_shared.tif']
+        # Duplicate point requested once, failed point twice
+        assert len(stub_server.requests) == 3
+        assert stub_server.requests[0]['radius'] == '200'
+
+        # Repeat served from cache
+        elevation.get_raster_tile_names_from_linz(self.access_points, 200,
+                                                  linz_url=self.url(stub_server),
+                                                  client=http)
+        assert len(stub_server.requests) == 3
+
+    def test_local_authority_boundary(self, stub_server):
+        http = client.HttpClient(backoff_factor=0)
+        geom, name = network.get_local_authority_boundary(self.access_points[0],
+                                                          statsnz_url=self.url(stub_server),
+                                                          client=http)
+        assert name == 'Porirua City'
+        assert geom.crs == 'EPSG:2193'
+        assert stub_server.requests[0]['layer'] == '104267'
+
+    def test_failed_requests_return_none(self, stub_server):
+        http = client.HttpClient(retries=0)
+        stub_server.fail.add(('174.8434', '-41.1375'))
+        url = self.url(stub_server) + '/?layer=53591&x=174.8434&y=-41.1375'
+        assert http.get_json(url) is None
+        assert http.get_json('http://127.0.0.1:1/') is None
@@ -0,0 +1,151 @@
+"""Unit tests for the compact module."""
+
+import pytest
+
+from osmcatch import compact, network
+import osmnx as ox
+import numpy as np
+
+
+# Tests
+class TestClassCompactGraph():
+    
+    # Fixtures
+    access_points = [(-41.137575, 174.843478), (-41.13555, 174.84598)]
+    sources = [1000, 1055]
+    
+    def test_from_graph_csr_arrays(self, grid_graph):
+        cg = compact.CompactGraph.from_graph(grid_graph)
+        assert cg.number_of_nodes == grid_graph.number_of_nodes()
+        assert cg.number_of_edges == grid_graph.number_of_edges()
+        assert cg.indptr[-1] == cg.number_of_edges
+        assert cg.indices.dtype == np.int32
+        assert set(cg.costs) == {'length', 'grade'}
+        assert all(c.dtype == np.float32 for c in cg.costs.values())
+
+    def test_from_gdfs_matches_from_graph(self, grid_graph):
+        cg1 = compact.CompactGraph.from_graph(grid_graph)
+        cg2 = compact.CompactGraph.from_gdfs(*ox.graph_to_gdfs(grid_graph))
+        assert (cg1.node_ids == cg2.node_ids).all()
+        assert (cg1.indptr == cg2.indptr).all()
+        assert (cg1.indices == cg2.indices).all()
+        assert (cg1.costs['length'] == cg2.costs['length']).all()
+
+    def test_multi_source_costs_match_networkx(self, grid_graph):
+        cg = compact.CompactGraph.from_graph(grid_graph)
+        costs = cg.multi_source_costs(self.sources, cutoff=200, weight='length')
+        expected = network.multi_source_costs(grid_graph, self.sources, 
+                                              cutoff=200, weight='length')
+        assert set(costs) == set(expected)
+        assert all(abs(costs[n] - expected[n]) < 1e-3 for n in expected)
+
+    def test_direction_costs_share_undirected_edges(self, grid_graph):
+        walk = network.WalkNetwork(grid_graph.copy())
+        walk.add_edge_grades()
+        G = walk.graph
+        G.remove_edge(1001, 1000)
+        cg = compact.CompactGraph.from_graph(G)
+        assert cg.number_of_undirected_edges == grid_graph.number_of_edges() // 2
+        assert cg.number_of_edges == G.number_of_edges()
+        
+        # Length held once for both directions, walk time each way
+        assert np.shares_memory(cg.costs['length'][0], cg.costs['length'][1])
+        assert not np.shares_memory(cg.costs['walk_mins'][0], cg.costs['walk_mins'][1])
+        for source in [1000, 1099]:
+            costs = cg.multi_source_costs([source], weight='walk_mins')
+            expected = network.multi_source_costs(G, [source], None, 'walk_mins')
+            assert all(abs(costs[n] - expected[n]) < 1e-4 for n in expected)
+        
+        # Setting cost one way splits shared row
+        cg.set_costs('length', [1000], [1010], [0], [1000])
+        assert cg.multi_source_costs([1000], weight='length')[1010] > 100
+        assert cg.multi_source_costs([1010], weight='length')[1000] < 100
+
+    def test_edit_edges_matches_from_graph(self, grid_graph):
+        cg = compact.CompactGraph.from_graph(grid_graph)
+        cg.matrix('length')
+        G = grid_graph.copy()
+        G.remove_edges_from([(1000, 1001, 0), (1055, 1056, 0)])
+        key = G.add_edge(1000, 1099, length=5.0)
+        cg.edit_edges(remove=[(1000, 1001, 0), (1055, 1056, 0)], 
+                      add=[(1000, 1099, key, {'length': 5.0})])
+        
+        expected = compact.CompactGraph.from_graph(G)
+        assert (cg.indptr == expected.indptr).all()
+        assert (cg.indices == expected.indices).all()
+        np.testing.assert_array_equal(cg.edge_costs('grade'), expected.edge_costs('grade'))
+        assert (cg.matrix('length') != expected.matrix('length')).nnz == 0
+        assert cg.multi_source_costs([1000], cutoff=10, weight='length')[1099] == 5.0
+
+    def test_to_graph_round_trip(self, grid_graph):
+        G = grid_graph.copy()
+        G.edges[1000, 1001, 0]['name'] = ['A', 'B']
+        G.edges[1001, 1000, 0]['name'] = ['A', 'B']
+        cg = compact.CompactGraph.from_graph(G, attrs=True)
+        result = cg.to_graph(G.graph)
+        assert result.graph == G.graph
+        assert dict(result.nodes(data=True)) == dict(G.nodes(data=True))
+        assert set(result.edges(keys=True)) == set(G.edges(keys=True))
+        for u, v, k, data in G.edges(keys=True, data=True):
+            for name, value in data.items():
+                if name in compact.COST_FIELDS:
+                    assert np.isclose(result.edges[u, v, k][name], value)
+                else:
+                    assert result.edges[u, v, k][name] == value
+
+        # Attributes the same both ways held once
+        edge = (cg.edge_u == cg.index_of([1000])[0]) & (cg.edge_v == cg.index_of([1001])[0])
+        assert cg.attrs['name'][0, edge][0] is cg.attrs['name'][1, edge][0]
+
+    def test_unknown_node_raises(self, grid_graph):
+        cg = compact.CompactGraph.from_graph(grid_graph)
+        with pytest.raises(KeyError):
+            cg.index_of([1])
+
+    def test_walk_network_compact_iso_bands(self, grid_graph):
+        walk = network.WalkNetwork(grid_graph)
+        walk_compact = network.WalkNetwork(grid_graph, compact=True)
+        assert walk_compact._edges is None
+        iso1 = walk.iso_bands(self.access_points, iso_bands=[100, 250],
+                              iso_band_cost='length')
+        iso2 = walk_compact.iso_bands(self.access_points, iso_bands=[100, 250],
+                                      iso_band_cost='length')
+        for g1, g2 in zip(iso1['iso_band_graph'], iso2['iso_band_graph']):
+            assert set(g1) == set(g2)
+            assert set(g1.edges(keys=True)) == set(g2.edges(keys=True))
+        assert iso1.geometry.geom_equals_exact(iso2.geometry, 1e-9).all()
+        
+        # Partial edges and band subgraphs read from the CompactGraph 
+        # without creating the graph
+        kwargs = dict(iso_bands=[100, 250], iso_band_cost='length', 
+                      iso_partial_edges=True, iso_band_graphs=False)
+        iso1 = walk.iso_bands(self.access_points, **kwargs)
+        iso2 = walk_compact.iso_bands(self.access_points, **kwargs)
+        # Edges cut at float32 costs
+        for g1, g2 in zip(iso1.geometry, iso2.geometry):
+            assert g1.symmetric_difference(g2).area < g1.area * 1e-6
+        assert set(walk_compact.iso_band_graph(iso2.loc[1]).edges(keys=True)) == \
+            set(walk.iso_band_graph(iso1.loc[1]).edges(keys=True))
+        assert walk_compact._G is None
+        assert len(walk_compact.edges) == grid_graph.number_of_edges()
+
+    def test_local_search_matches_whole_network(self, large_grid_graph, monkeypatch):
+        walk = network.WalkNetwork(large_grid_graph, compact=True)
+        walk.set_result_cache(None)
+        expected = walk.iso_bands(self.access_points, iso_bands=[60, 120],
+                                  iso_band_cost='length')
+        
+        monkeypatch.setattr(network, 'LOCAL_SEARCH_MIN_NODES', 0)
+        cg = walk._compact
+        assert cg.max_speed('length') == pytest.approx(1)
+        nodes = walk._local_nodes(expected.loc[0, 'access_nodes'], 120, 'length')
+        assert nodes is not None and len(nodes) < cg.number_of_nodes / 50
+        result = walk.iso_bands(self.access_points, iso_bands=[60, 120],
+                                iso_band_cost='length')
+        for g1, g2 in zip(expected['iso_band_graph'], result['iso_band_graph']):
+            assert set(g1) == set(g2)
+        
+        # Nodes out of straight line reach are not searched
+        costs = cg.multi_source_costs(self.sources[:1], cutoff=1000, weight='length',
+                                      nodes=cg.index_of([1000, 1001, 1002, 1040]))
+        assert set(costs) == {1000, 1001, 1002, 1040}
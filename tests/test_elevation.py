@@ -5,7 +5,11 @@ import pytest
 from osmcatch import elevation, catchment
 import osmnx as ox 
 import networkx as nx
+import numpy as np
+import pandas as pd
 import geopandas as gpd
+import pyproj
+import rasterio
 from pathlib import Path
 
 # Tests
@@ -26,6 +30,31 @@ class TestClassElevation():
 
         assert max(G2[1]['grade']) > 0
         
+    def test_add_elevations_to_graph_windowed(self, grid_graph):
+        
+        G = elevation.add_elevations_to_graph(grid_graph.copy(), self.tiles, 
+                                              max_workers=2)
+        
+        # Compare with sampling each node from each tile
+        to_nztm = pyproj.Transformer.from_crs('epsg:4326', 'epsg:2193', always_xy=True)
+        rasters = [rasterio.open(tile) for tile in self.tiles]
+        for node, data in G.nodes(data=True):
+            point = to_nztm.transform(data['x'], data['y'])
+            expected = np.nan
+            for raster in rasters:
+                if not rasterio.coords.disjoint_bounds(raster.bounds, point * 2):
+                    expected = float(next(raster.sample([point]))[0])
+                    break
+            if np.isnan(expected):
+                assert np.isnan(data['elevation'])
+            else:
+                assert data['elevation'] == pytest.approx(expected)
+        
+        elevations = [e for _, e in G.nodes(data='elevation')]
+        assert 0 < np.isnan(elevations).sum() < len(elevations)
+        grades = [g for _, _, g in G.edges(data='grade') if not np.isnan(g)]
+        assert max(grades) > 0
+        
     def test_get_raster_tile_names_from_linz(self):
       
         tiles = elevation.get_raster_tile_names_from_linz(self.access_points,200)
@@ -41,4 +70,18 @@ class TestClassElevation():
         speeds = elevation.gradient_adjusted_walk_speed(gradients)
         speeds = [round(s,2) for s in speeds]
         assert speeds == expected_speeds
-        
\ No newline at end of file
+        
+    def test_gradient_adjusted_walk_speed_vectorised(self):
+        
+        gradients = pd.Series(np.linspace(-100, 100, 2001), 
+                              index=np.arange(2001) * 2, name='grade')
+        expected = elevation.gradient_adjusted_walk_speed(gradients.tolist())
+        
+        speeds = elevation.gradient_adjusted_walk_speed(gradients)
+        assert type(speeds) == pd.Series
+        assert (speeds.index == gradients.index).all()
+        assert speeds.tolist() == expected
+        
+        speeds = elevation.gradient_adjusted_walk_speed(gradients.values.astype(np.float32))
+        assert type(speeds) == np.ndarray
+        assert speeds.dtype == np.float32
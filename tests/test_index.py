@@ -0,0 +1,147 @@
+"""Unit tests for the index module."""
+
+import pytest
+
+from osmcatch import index, network
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+
+# Tests
+class TestClassTravelTimeIndex():
+    
+    # Fixtures
+    stations_df = pd.DataFrame({
+        'location_name': ['A', 'B'],
+        'access_points': [[(-41.137575, 174.843478), (-41.13555, 174.84598)],
+                          [(-41.1340, 174.8440)]]})
+    
+    def test_build_nearest_station(self, grid_graph):
+        walk = network.WalkNetwork(grid_graph.copy())
+        walk.add_edge_grades()
+        tt_index = index.TravelTimeIndex.build(walk, self.stations_df, 
+                                               max_band=3, cost='walk_mins')
+        access_nodes = [walk.nearest_nodes(ap) for ap in self.stations_df['access_points']]
+        
+        # Uphill walk times, so costs are from each node towards the station
+        for node_id, station, cost in zip(tt_index.node_ids, 
+                                          tt_index.nearest_station, 
+                                          tt_index.nearest_cost):
+            costs = [min(nx.shortest_path_length(walk.graph, node_id, a, weight='walk_mins') 
+                         for a in nodes) for nodes in access_nodes]
+            assert cost == pytest.approx(min(costs), rel=1e-5)
+            assert costs[station] == pytest.approx(min(costs), abs=1e-3)
+    
+    def test_iso_bands_from_saved_index(self, grid_graph, tmp_path, monkeypatch):
+        walk = network.WalkNetwork(grid_graph, compact=True)
+        walk.set_result_cache(None)
+        expected = walk.iso_bands(self.stations_df.loc[0, 'access_points'], 
+                                  iso_bands=[100, 200], iso_band_cost='length')
+        
+        tt_index = index.TravelTimeIndex.build(walk, self.stations_df, 
+                                               max_band=250, cost='length')
+        tt_index.save(tmp_path / 'graph.index')
+        tt_index = index.TravelTimeIndex.load(tmp_path / 'graph.index')
+        assert isinstance(tt_index.station_costs, np.memmap)
+        walk.set_travel_time_index(tt_index)
+        
+        def no_search(*args, **kwargs):
+            raise AssertionError('should use index')
+        monkeypatch.setattr(walk._compact, 'multi_source_costs', no_search)
+        
+        result = walk.iso_bands(self.stations_df.loc[0, 'access_points'], 
+                                iso_bands=[100, 200], iso_band_cost='length')
+        for g1, g2 in zip(expected['iso_band_graph'], result['iso_band_graph']):
+            assert set(g1) == set(g2)
+        
+        # Bands larger than the index fall back to a search
+        with pytest.raises(AssertionError):
+            walk.iso_bands(self.stations_df.loc[0, 'access_points'], 
+                           iso_bands=[300], iso_band_cost='length')
+    
+    def test_edit_edges_repairs_index(self, grid_graph, monkeypatch):
+        stations_df = pd.concat([self.stations_df, pd.DataFrame({
+            'location_name': ['C'], 'access_points': [[(-41.133075, 174.847978)]]})],
+            ignore_index=True)
+        walk = network.WalkNetwork(grid_graph.copy(), compact=True)
+        walk.set_travel_time_index(index.TravelTimeIndex.build(
+            walk, stations_df, max_band=250, cost='length'))
+        
+        # Nearest stations and CompactGraph repaired, not rebuilt
+        def no_rebuild(*args, **kwargs):
+            raise AssertionError('should repair')
+        monkeypatch.setattr(index, 'nearest_stations', no_rebuild)
+        monkeypatch.setattr(network.CompactGraph, 'from_graph', no_rebuild)
+        
+        # Shortcut, removed edge and slower edge all near station A
+        costs = pd.DataFrame({'length': [500.0]}, 
+                             index=pd.MultiIndex.from_tuples([(1001, 1002, 0)]))
+        result = walk.edit_edges(add=[(1000, 1022, {'length': 10.0}), 
+                                      (1022, 1000, {'length': 10.0})],
+                                 remove=[(1005, 1006, 0), (1006, 1005, 0)],
+                                 costs=costs, iso_bands=[100, 200])
+        assert set(result['location_name']) == {'A'}
+        
+        G = grid_graph.copy()
+        G.add_edge(1000, 1022, length=10.0)
+        G.add_edge(1022, 1000, length=10.0)
+        G.remove_edges_from([(1005, 1006, 0), (1006, 1005, 0)])
+        G.edges[1001, 1002, 0]['length'] = 500.0
+        monkeypatch.undo()
+        expected = index.TravelTimeIndex.build(network.WalkNetwork(G), stations_df,
+                                               max_band=250, cost='length')
+        repaired = walk._travel_time_index
+        for name in ['station_ptr', 'station_nodes', 'station_costs', 'nearest_station', 'nearest_cost']:
+            np.testing.assert_allclose(getattr(repaired, name), getattr(expected, name))
+        assert (walk._compact.matrix('length') != 
+                network.CompactGraph.from_graph(G).matrix('length')).nnz == 0
+        
+        with pytest.raises(ValueError):
+            walk.edit_edges(costs=costs, iso_band_cost='walk_mins')
+
+        expected_bands = network.WalkNetwork(G).iso_bands(
+            self.stations_df.loc[0, 'access_points'], iso_bands=[100, 200],
+            iso_band_cost='length')
+        for g1, g2 in zip(expected_bands['iso_band_graph'], result['iso_band_graph']):
+            assert set(g1) == set(g2)
+
+    def test_edit_edges_network_loaded_from_folder(self, grid_graph, tmp_path, monkeypatch):
+        network.WalkNetwork(grid_graph.copy()).save_graph(tmp_path / 'walk')
+        walk = network.WalkNetwork.load_graph(tmp_path / 'walk')
+        walk.set_travel_time_index(index.TravelTimeIndex.build(
+            walk, self.stations_df, max_band=250, cost='length'))
+        compact = walk.as_compact()
+        assert walk.as_compact() is compact
+        
+        # CompactGraph held for the index is edited, not created again
+        def no_rebuild(*args, **kwargs):
+            raise AssertionError('should edit')
+        monkeypatch.setattr(network.CompactGraph, 'from_gdfs', no_rebuild)
+        monkeypatch.setattr(network.CompactGraph, 'from_graph', no_rebuild)
+        result = walk.edit_edges(add=[(1000, 1022, {'length': 10.0})],
+                                 costs=pd.DataFrame({'length': [500.0]}, 
+                                     index=pd.MultiIndex.from_tuples([(1001, 1002, 0)])),
+                                 iso_bands=[100, 200])
+        assert set(result['location_name']) == {'A'}
+        assert walk.as_compact() is compact
+        monkeypatch.undo()
+        
+        G = grid_graph.copy()
+        G.add_edge(1000, 1022, length=10.0)
+        G.edges[1001, 1002, 0]['length'] = 500.0
+        assert set(walk.graph.edges(keys=True)) == set(G.edges(keys=True))
+        assert walk.graph.edges[1001, 1002, 0]['length'] == 500.0
+        assert len(walk.edges) == G.number_of_edges()
+        assert (compact.matrix('length') != 
+                network.CompactGraph.from_graph(G).matrix('length')).nnz == 0
+
+    def test_build_single_access_point_station(self, grid_graph):
+        walk = network.WalkNetwork(grid_graph)
+        stations_df = self.stations_df.copy()
+        expected = index.TravelTimeIndex.build(walk, stations_df, max_band=250, cost='length')
+        stations_df['access_points'] = [stations_df.loc[0, 'access_points'], 
+                                        stations_df.loc[1, 'access_points'][0]]
+        result = index.TravelTimeIndex.build(walk, stations_df, max_band=250, cost='length')
+        for name in ['access_ptr', 'station_nodes', 'station_costs', 'nearest_station']:
+            np.testing.assert_array_equal(getattr(result, name), getattr(expected, name))
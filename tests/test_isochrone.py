@@ -0,0 +1,102 @@
+"""Unit tests for the isochrone module."""
+
+import pytest
+
+from osmcatch import isochrone, network
+import osmnx as ox
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import LineString
+from shapely.ops import substring, unary_union
+
+
+# Tests
+class TestClassIsoPolygonBuilder():
+    
+    # Fixtures
+    sources = [1000, 1055]
+    
+    def test_polygons_match_direct_union(self, grid_graph):
+        costs = network.multi_source_costs(grid_graph, self.sources, 
+                                           cutoff=250, weight='length')
+        edges = ox.graph_to_gdfs(grid_graph.subgraph(costs), nodes=False)
+        builder = isochrone.IsoPolygonBuilder(isochrone.utm_crs(174.84))
+        builder.add_edges(edges)
+        polygons = builder.polygons(edges.index, costs, [250, 100], 25)
+        assert list(polygons.index) == [250, 100]
+        assert polygons.crs == 'epsg:4326'
+        
+        edges_proj = ox.project_gdf(edges)
+        for band in [250, 100]:
+            in_band = [max(costs[u], costs[v]) <= band for u, v, _ in edges.index]
+            expected = ox.project_gdf(edges_proj[in_band].buffer(25), to_latlong=True)
+            assert polygons[band].symmetric_difference(expected.unary_union).area < 1e-12
+    
+    def test_edges_projected_and_buffered_once(self, grid_graph):
+        costs = network.multi_source_costs(grid_graph, self.sources, 
+                                           cutoff=250, weight='length')
+        edges = ox.graph_to_gdfs(grid_graph.subgraph(costs), nodes=False)
+        builder = isochrone.IsoPolygonBuilder(isochrone.utm_crs(174.84))
+        builder.add_edges(edges)
+        
+        # Both directions of each edge share one geometry
+        assert len(builder._projected) == len(edges) // 2
+        assert builder.missing(edges.index) == []
+        builder.polygons(edges.index, costs, [250, 100], 25)
+        buffers = dict(builder._buffers[25])
+        builder.polygons(edges.index, costs, [200], 25)
+        assert all(builder._buffers[25][k] is b for k, b in buffers.items())
+    
+    def test_partial_edges_cut_at_band(self, grid_graph):
+        costs = network.multi_source_costs(grid_graph, [1000], 
+                                           cutoff=30, weight='length')
+        edge_costs = {(u, v, k): d['length'] for u, v, k, d 
+                      in grid_graph.out_edges(costs, keys=True, data=True)}
+        edges = ox.graph_to_gdfs(grid_graph.edge_subgraph(edge_costs), nodes=False)
+        builder = isochrone.IsoPolygonBuilder(isochrone.utm_crs(174.84))
+        builder.add_edges(edges)
+        polygons = builder.polygons(list(edge_costs), costs, [30, 15], 1,
+                                    edge_costs=edge_costs)
+        
+        # Neither edge from the source is wholly reached, so each band is 
+        # two 1m buffered lines of band length
+        assert costs == {1000: 0}
+        areas = polygons.to_crs(builder.crs).area
+        for band in [30, 15]:
+            assert areas[band] == pytest.approx(2 * band * 2 + 3.14, rel=0.02)
+        
+        # Edges wholly reached are included as before
+        polygons = builder.polygons(list(edge_costs), costs, [500], 1,
+                                    edge_costs=edge_costs)
+        lengths = sum(d for d in edge_costs.values())
+        assert polygons.to_crs(builder.crs).area[500] == pytest.approx(lengths * 2 + 3.14, rel=0.02)
+    
+    def test_parallel_edges_matched_by_geometry(self):
+        # Straight and detour edges between two nodes, with reverse keys 
+        # swapped as on simplified graphs
+        straight = LineString([(174.840, -41.137), (174.842, -41.137)])
+        detour = LineString([(174.840, -41.137), (174.841, -41.136), (174.842, -41.137)])
+        reverse = lambda line: LineString(line.coords[::-1])
+        index = pd.MultiIndex.from_tuples([(1, 2, 0), (1, 2, 1), (2, 1, 0), (2, 1, 1)],
+                                          names=['u', 'v', 'key'])
+        edges = gpd.GeoDataFrame(geometry=[straight, detour, reverse(detour), reverse(straight)],
+                                 index=index, crs='epsg:4326')
+        builder = isochrone.IsoPolygonBuilder(isochrone.utm_crs(174.84))
+        builder.add_edges(edges)
+        assert len(builder._projected) == 2
+        assert builder._keys[2, 1, 0][0] == builder._keys[1, 2, 1][0]
+        
+        # Detour reached partly from each end, straight edge wholly
+        lengths = edges.to_crs(builder.crs).length
+        costs = {1: 0, 2: lengths[1, 2, 0]}
+        band = costs[2] * 1.1
+        polygons = builder.polygons(list(edges.index), costs, [band], 1, 
+                                    edge_costs=lengths.to_dict())
+        
+        straight_proj, detour_proj = edges.to_crs(builder.crs).geometry[:2]
+        expected = unary_union([
+            straight_proj.buffer(1),
+            substring(detour_proj, 0, band / lengths[1, 2, 1], normalized=True).buffer(1),
+            substring(detour_proj, 1 - (band - costs[2]) / lengths[1, 2, 1], 1, 
+                      normalized=True).buffer(1)])
+        assert polygons.to_crs(builder.crs)[band].symmetric_difference(expected).area < 0.1
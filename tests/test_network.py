@@ -3,7 +3,10 @@
 import pytest
 
 from osmcatch import network
+import osmnx as ox
 import networkx as nx
+import numpy as np
+import pandas as pd
 import geopandas as gpd
 
 
@@ -39,3 +42,249 @@ class TestClassNetwork():
     def test_test_get_osm_walk_network_local_authority_boundary(self):
         # TODO
         pass
+
+
+class TestClassWalkNetwork():
+    
+    # Fixtures
+    access_points = [(-41.137575, 174.843478), (-41.13555, 174.84598)]
+    
+    def test_iso_bands_match_ego_graphs(self, grid_graph):
+        walk = network.WalkNetwork(grid_graph)
+        iso_bands_gpd = walk.iso_bands(self.access_points, 'Test', 
+                                       iso_bands=[100, 250],
+                                       iso_band_cost='length')
+        assert list(iso_bands_gpd['iso_band_mins']) == [250, 100]
+        for _, row in iso_bands_gpd.iterrows():
+            expected = set()
+            for access_node in row['access_nodes']:
+                expected |= set(nx.ego_graph(grid_graph, access_node, 
+                                             radius=row['iso_band_mins'],
+                                             distance='length'))
+            assert set(row['iso_band_graph']) == expected
+        assert iso_bands_gpd.crs == 'epsg:4326'
+        outer, inner = iso_bands_gpd['geometry']
+        assert outer.buffer(1e-7).contains(inner)
+        assert outer.area > inner.area
+
+    def test_iso_band_nodes_instead_of_graphs(self, grid_graph):
+        walk = network.WalkNetwork(grid_graph)
+        kwargs = dict(iso_bands=[100, 250], iso_band_cost='length')
+        graphs = walk.iso_bands(self.access_points, **kwargs)
+        nodes = walk.iso_bands(self.access_points, iso_band_graphs=False, **kwargs)
+        assert 'iso_band_graph' not in nodes
+        for (_, row), (_, expected) in zip(nodes.iterrows(), graphs.iterrows()):
+            assert list(row['iso_band_nodes']) == sorted(expected['iso_band_graph'])
+            assert nx.utils.graphs_equal(walk.iso_band_graph(row), 
+                                         walk.iso_band_graph(expected))
+        
+        fig, ax = walk.plot_iso_bands(nodes, show=False, color_list=['r', 'b'])
+        assert len(ax.collections) > 0
+
+    def test_coverage_matches_street_length(self, grid_graph):
+        walk = network.WalkNetwork(grid_graph)
+        stations_df = pd.DataFrame({'location_name': ['A', 'B'],
+                                    'access_points': [self.access_points, 
+                                                      [(-41.1355, 174.8450)]]})
+        station_coverage, overlap = walk.coverage(
+            stations_df, 150, 'length', node_weights=pd.Series(1, index=list(grid_graph)))
+        
+        iso = walk.iso_bands_batch(stations_df, processes=1, iso_bands=[150],
+                                   iso_band_cost='length')
+        a, b = iso['iso_band_graph']
+        expected = [network.graph_street_length(a), network.graph_street_length(b)]
+        assert list(station_coverage['street_length']) == pytest.approx(expected)
+        assert list(station_coverage['weight']) == [len(a), len(b)]
+        assert overlap['street_length'].sum() == pytest.approx(
+            network.graph_street_length(nx.compose(a, b)))
+        assert overlap.loc[2, 'weight'] == len(set(a) & set(b)) > 0
+        assert station_coverage.loc[0, 'unique_weight'] == len(set(a) - set(b))
+
+    def test_nearest_station_times_match_networkx(self, grid_graph):
+        walk = network.WalkNetwork(grid_graph)
+        walk.add_edge_grades()
+        stations_df = pd.DataFrame({'location_name': ['A', 'B'],
+                                    'access_points': [self.access_points, 
+                                                      [(-41.1340, 174.8470)]]})
+        origins = [(-41.1370, 174.8450), (-41.1345, 174.8465), (-41.1333, 174.8439)]
+        result = walk.nearest_station_times(origins, stations_df, chunksize=2)
+        
+        # Uphill walk times, so costs are from origin towards the station
+        access_nodes = [walk.nearest_nodes(ap) for ap in stations_df['access_points']]
+        for origin, (_, row) in zip(walk.nearest_nodes(origins), result.iterrows()):
+            costs = [min(nx.shortest_path_length(walk.graph, origin, a, weight='walk_mins')
+                         for a in nodes) for nodes in access_nodes]
+            assert row['cost'] == pytest.approx(min(costs), rel=1e-5)
+            assert row['location_name'] == stations_df.loc[np.argmin(costs), 'location_name']
+        
+        result = walk.nearest_station_times(origins, stations_df, max_cost=3)
+        assert list(result['station']) == [0, 1, -1]
+        assert result.loc[2, 'location_name'] is None
+        
+        # Single (lat, lng) tuple the same as a list of one access point
+        stations_df.at[1, 'access_points'] = (-41.1340, 174.8470)
+        single = walk.nearest_station_times(origins, stations_df, max_cost=3)
+        assert single.equals(result)
+
+    def test_add_edge_grades_matches_osmnx(self, grid_graph):
+        G = grid_graph.copy()
+        nx.set_node_attributes(G, {1005: np.nan}, 'elevation')
+        expected = network.WalkNetwork(ox.add_edge_grades(G.copy(), add_absolute=True), compact=True)
+        expected.add_edge_speed()
+        
+        for materialise in [False, True]:
+            walk = network.WalkNetwork(G.copy(), compact=True)
+            if materialise:
+                walk.edges
+            walk.add_edge_grades()
+            for name in ['grade', 'grade_abs', 'speed', 'walk_mins']:
+                pd.testing.assert_series_equal(walk.edges[name], expected.edges[name])
+                
+                # Null grades are not set on graph edges
+                assert nx.get_edge_attributes(walk.graph, name) == {
+                    e: value for e, value in nx.get_edge_attributes(expected.graph, name).items()
+                    if not np.isnan(value)}
+            assert walk.access_costs([1000], 5) == expected.access_costs([1000], 5)
+
+    def test_gdfs_created_on_access_and_after_graph_changed(self, grid_graph):
+        G = grid_graph.copy()
+        walk = network.WalkNetwork(G)
+        walk.iso_bands(self.access_points, iso_bands=[100], iso_band_cost='length')
+        assert walk._nodes is None and walk._edges is None
+        
+        assert len(walk.edges) == G.number_of_edges()
+        assert walk.nodes is walk.nodes
+        
+        G.remove_node(1000)
+        walk.graph_changed()
+        assert walk._edges is None
+        assert len(walk.nodes) == G.number_of_nodes()
+        assert len(walk.edges) == G.number_of_edges()
+        assert 1000 not in walk.nearest_nodes(self.access_points)
+
+    def test_nearest_nodes_match_osmnx(self, grid_graph):
+        points = [(-41.137575 + 0.0043 * i / 20, 174.843478 + 0.0047 * (i % 7) / 7)
+                  for i in range(20)] + [(-41.13, 174.85)]
+        expected, expected_dists = ox.nearest_nodes(grid_graph, 
+                                                    [p[1] for p in points],
+                                                    [p[0] for p in points],
+                                                    return_dist=True)
+        for compact in [False, True]:
+            walk = network.WalkNetwork(grid_graph, compact=compact)
+            access_nodes, dists = walk.nearest_nodes(points, return_dist=True)
+            assert access_nodes == expected
+            assert dists == pytest.approx(expected_dists, rel=0.01)
+        assert walk.nearest_nodes([points[0]]) == expected[:1]
+        
+        # Far away entrance is flagged by its snap distance
+        assert dists[-1] > 200 > max(dists[:-1])
+
+    def test_iso_bands_partial_edges_extend_bands(self, grid_graph):
+        walk = network.WalkNetwork(grid_graph)
+        whole = walk.iso_bands(self.access_points, 'Test', iso_bands=[100, 250],
+                               iso_band_cost='length')
+        partial = walk.iso_bands(self.access_points, 'Test', iso_bands=[100, 250],
+                                 iso_band_cost='length', iso_partial_edges=True)
+        for whole_geom, partial_geom in zip(whole['geometry'], partial['geometry']):
+            assert partial_geom.buffer(1e-7).contains(whole_geom)
+            assert partial_geom.area > whole_geom.area
+
+    def test_iso_bands_batch_deterministic(self, grid_graph):
+        walk = network.WalkNetwork(grid_graph, compact=True)
+        stations_df = pd.DataFrame({
+            'location_name': ['A', 'B', 'C'],
+            'access_points': [self.access_points, 
+                              [(-41.1350, 174.8460)],
+                              [(-41.1340, 174.8440), (-41.1345, 174.8445)]]})
+        kwargs = dict(iso_bands=[100, 250], iso_band_cost='length')
+        serial = walk.iso_bands_batch(stations_df, processes=1, **kwargs)
+        parallel = walk.iso_bands_batch(stations_df, processes=2, **kwargs)
+        assert list(serial['location_name']) == ['A', 'A', 'B', 'B', 'C', 'C']
+        assert list(parallel['location_name']) == list(serial['location_name'])
+        assert parallel.geometry.geom_equals_exact(serial.geometry, 1e-9).all()
+        assert parallel.crs == serial.crs
+
+    def test_add_edge_speed_in_place(self, grid_graph):
+        G_compact = grid_graph.copy()
+        walk = network.WalkNetwork(grid_graph)
+        walk.add_edge_speed()
+        assert walk.graph is grid_graph
+        edge = grid_graph.edges[1000, 1001, 0]
+        assert edge['speed'] == walk.edges.loc[(1000, 1001, 0), 'speed']
+        assert edge['walk_mins'] == pytest.approx(edge['length'] / edge['speed'] / 60)
+        
+        # Compact network gives same result without creating edges
+        walk_compact = network.WalkNetwork(G_compact, compact=True)
+        walk_compact.add_edge_speed()
+        assert walk_compact._edges is None
+        iso1 = walk.iso_bands(self.access_points, iso_bands=[2, 4])
+        iso2 = walk_compact.iso_bands(self.access_points, iso_bands=[2, 4])
+        for g1, g2 in zip(iso1['iso_band_graph'], iso2['iso_band_graph']):
+            assert set(g1) == set(g2)
+
+
+class TestClassWalkNetworkDownload():
+    
+    # Fixtures
+    access_points = [(-41.1355, 174.8457), (-41.1352, 174.8460)]
+    
+    def test_get_osm_walk_network_single_merged_download(self, monkeypatch, grid_graph):
+        
+        # Overpass response for each filter, with ways and nodes that overlap
+        nodes = [{'type': 'node', 'id': n, 'lat': d['y'], 'lon': d['x']} 
+                 for n, d in grid_graph.nodes(data=True)]
+        ways = {}
+        for u, v, d in grid_graph.edges(data=True):
+            ways[d['osmid']] = {'type': 'way', 'id': d['osmid'], 'nodes': [u, v],
+                                'tags': {'highway': 'footway'}}
+        ways = list(ways.values())
+        responses = {'a': ways[:120], 'b': ways[60:]}
+        
+        queries = []
+        def fake_download(polygon, network_type, custom_filter):
+            queries.append(custom_filter)
+            yield {'elements': nodes + responses[custom_filter]}
+        monkeypatch.setattr(ox.downloader, '_osm_network_download', fake_download)
+        
+        builds = []
+        create_graph = ox.graph._create_graph
+        def counted_create_graph(*args, **kwargs):
+            builds.append(1)
+            return create_graph(*args, **kwargs)
+        monkeypatch.setattr(ox.graph, '_create_graph', counted_create_graph)
+        monkeypatch.setattr(network, 'WALK_CUSTOM_FILTERS', ['a', 'b'])
+        
+        G = network.get_osm_walk_network(self.access_points, dist=100)
+        assert queries == ['a', 'b']
+        assert len(builds) == 1
+        
+        # Ways matching both filters are only added once
+        assert set(k for _, _, k in G.edges(keys=True)) == {0}
+        expected = ox.truncate.truncate_graph_bbox(
+            grid_graph, *ox.utils_geo.bbox_from_point(self.access_points[0], dist=100), 
+            truncate_by_edge=True)
+        assert set(expected.edges) <= set(G.edges)
+    
+    def test_get_osm_walk_network_filters_without_ways(self, monkeypatch, grid_graph):
+        
+        def empty_download(polygon, network_type, custom_filter):
+            yield {'elements': []}
+        monkeypatch.setattr(ox.downloader, '_osm_network_download', empty_download)
+        
+        G = network.get_osm_walk_network(self.access_points, dist=100)
+        assert len(G) == 0
+        
+        # Public per filter download used without osmnx internals
+        monkeypatch.setattr(network, '_has_download_internals', lambda: False)
+        filters = []
+        def graph_from_polygon(polygon, custom_filter, **kwargs):
+            filters.append(custom_filter)
+            if custom_filter == 'b':
+                raise ox._errors.EmptyOverpassResponse('There are no data elements')
+            return grid_graph
+        monkeypatch.setattr(ox, 'graph_from_polygon', graph_from_polygon)
+        monkeypatch.setattr(network, 'WALK_CUSTOM_FILTERS', ['a', 'b'])
+        
+        G = network.get_osm_walk_network(self.access_points, dist=100)
+        assert filters == ['a', 'b']
+        assert 0 < len(G.edges) and set(G.edges) <= set(grid_graph.edges)
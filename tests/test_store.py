@@ -0,0 +1,111 @@
+"""Unit tests for the store module."""
+
+import pytest
+
+from osmcatch import network, store
+import osmnx as ox
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+from osmcatch.compact import COST_FIELDS
+
+
+def graphs_close(G, H):
+    """Return True if graphs equal, with compact float32 costs close"""
+    if set(G.edges(keys=True)) != set(H.edges(keys=True)) or G.graph != H.graph:
+        return False
+    if dict(G.nodes(data=True)) != dict(H.nodes(data=True)):
+        return False
+    for u, v, k, data in G.edges(keys=True, data=True):
+        expected = H.edges[u, v, k]
+        if data.keys() != expected.keys():
+            return False
+        for name, value in data.items():
+            if name in COST_FIELDS:
+                if not np.isclose(value, expected[name], rtol=1e-6):
+                    return False
+            elif value != expected[name]:
+                return False
+    return True
+
+
+# Tests
+class TestClassStore():
+
+    # Fixtures
+    access_points = [(-41.137575, 174.843478), (-41.13555, 174.84598)]
+
+    def test_save_load_gdfs_round_trip(self, grid_graph, tmp_path):
+        G = grid_graph.copy()
+
+        # OSM tags can hold lists or be missing
+        nx.set_edge_attributes(G, {(1000, 1001, 0): [1, 2],
+                                   (1001, 1000, 0): 'Main Street'}, 'name')
+        gdf_nodes, gdf_edges = ox.graph_to_gdfs(G)
+        store.save_gdfs(tmp_path / 'walk', gdf_nodes, gdf_edges, G.graph)
+
+        assert store.is_gdfs_folder(tmp_path / 'walk')
+        nodes, edges, graph_attrs = store.load_gdfs(tmp_path / 'walk')
+        assert graph_attrs == G.graph
+        pd.testing.assert_frame_equal(nodes.drop(columns='geometry'),
+                                      gdf_nodes.drop(columns='geometry'))
+        pd.testing.assert_frame_equal(edges.drop(columns='geometry'),
+                                      gdf_edges.drop(columns='geometry'))
+        assert nodes.geom_equals(gdf_nodes.geometry).all()
+        assert edges.geom_equals(gdf_edges.geometry).all()
+        assert edges.loc[(1000, 1001, 0), 'name'] == [1, 2]
+        assert np.isnan(edges.loc[(1000, 1010, 0), 'name'])
+
+    def test_walk_network_load_graph_folder(self, grid_graph, tmp_path):
+        walk = network.WalkNetwork(grid_graph.copy())
+        walk.add_edge_speed()
+        walk.save_graph(tmp_path / 'walk')
+        walk.save_graph(tmp_path / 'walk.gpickle.gz')
+
+        # Loaded without creating graph until needed
+        loaded = network.WalkNetwork.load_graph(tmp_path / 'walk', compact=True)
+        assert loaded._G is None
+        expected = walk.iso_bands(self.access_points, iso_bands=[5, 10])
+        result = loaded.iso_bands(self.access_points, iso_bands=[5, 10])
+        for (_, row), (_, expected_row) in zip(result.iterrows(), expected.iterrows()):
+            assert set(row['iso_band_graph']) == set(expected_row['iso_band_graph'])
+            assert row['geometry'].equals(expected_row['geometry'])
+        assert loaded._G is None
+        
+        # Graph created from edges has straight line geometry added, and 
+        # costs held as float32
+        G = loaded.graph
+        for u, v, k, data in G.edges(keys=True, data=True):
+            data.pop('geometry')
+        assert graphs_close(G, walk.graph)
+
+        # Pickles still read
+        loaded = network.WalkNetwork.load_graph(tmp_path / 'walk.gpickle.gz')
+        assert nx.utils.graphs_equal(loaded.graph, walk.graph)
+        walk.save_graph(tmp_path / 'walk.pkl')
+        with open(tmp_path / 'walk.pkl', 'rb') as f:
+            loaded = network.WalkNetwork.load_graph(f)
+        assert nx.utils.graphs_equal(loaded.graph, walk.graph)
+    
+    def test_iso_bands_to_folder_resumes(self, grid_graph, tmp_path):
+        walk = network.WalkNetwork(grid_graph)
+        stations_df = pd.DataFrame({'location_name': ['A', 'B', 'C'],
+                                    'access_points': [self.access_points, 
+                                                      [(-41.1340, 174.8440)],
+                                                      (-41.1350, 174.8460)]})
+        kwargs = dict(iso_bands=[100, 250], iso_band_cost='length')
+        assert walk.iso_bands_to_folder(stations_df, tmp_path / 'out', **kwargs) == 3
+        
+        # Interrupted run leaves a partly written temporary file
+        names = store.part_names(stations_df['location_name'], stations_df['access_points'])
+        (tmp_path / 'out' / (names[1] + '.fgb')).rename(tmp_path / 'out' / (names[1] + '.tmp.fgb'))
+        assert walk.iso_bands_to_folder(stations_df, tmp_path / 'out', 
+                                        processes=1, **kwargs) == 1
+        
+        result = store.load_parts(tmp_path / 'out')
+        expected = walk.iso_bands_batch(stations_df, processes=1, **kwargs)
+        assert list(result['location_name']) == list(expected['location_name'])
+        assert list(result['iso_band_mins']) == list(expected['iso_band_mins'])
+        assert list(result['access_points']) == list(expected['access_points'])
+        assert result.geometry.geom_equals_exact(expected.geometry, 1e-9).all()